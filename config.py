@@ -25,6 +25,9 @@ SYSTEM_PROMPT = """You are a helpful assistant. Your responses should be concise
 
 Please ensure your responses are easy to read and visually appealing in a chat interface."""
 
+# Upper bound on blocking LLM calls running at once (size of the LLM thread pool).
+LLM_MAX_CONCURRENCY = max(1, int(os.getenv("LLM_MAX_CONCURRENCY") or "5"))
+
 if TELEGRAM_TOKEN is None:
     raise EnvironmentError("TELEGRAM_BOT_TOKEN is not set")
 
@@ -9,6 +9,7 @@ from config import LLM_PROVIDER
 from handlers.messages import (
     DEFAULT_MODE,
     MODE_AUDIO,
+    _discard_pending_tool_audio,
     _ensure_admin_for_message,
     _merge_instructions_with_prompt,
     handle_message,
@@ -36,6 +37,7 @@ try:
         get_recent_history,
         resolve_tool_identifier,
         run_tool_direct,
+        run_tool_direct_async,
         translate_instruction_to_command,
         translate_instruction_to_query,
     )
@@ -45,6 +47,7 @@ except ImportError:  # Optional dependency
     get_recent_history = None
     resolve_tool_identifier = None
     run_tool_direct = None
+    run_tool_direct_async = None
     translate_instruction_to_command = None
     translate_instruction_to_query = None
 
@@ -423,7 +426,7 @@ async def tool_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     from utils.tldr import extract_tldr_from_tool_result, send_tldr
 
-    result = run_tool_direct(tool_name, parameters)
+    result = await run_tool_direct_async(tool_name, parameters)
     if result is None:
         await update.message.reply_text("Unknown or unavailable tool.")
         return
@@ -472,7 +475,6 @@ async def web_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
 
     from handlers.messages import send_markdown_message
-    from services.ollama import run_tool_direct_async
     from utils.tldr import extract_tldr_from_tool_result, send_tldr
 
     instructions = " ".join(context.args).strip()
@@ -519,7 +521,7 @@ async def cheat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Use the tool registry entry (if available) or call run_tool_direct
     try:
         if run_tool_direct:
-            result = run_tool_direct("cheat", {"command": cmd})
+            result = await run_tool_direct_async("cheat", {"command": cmd})
         else:
             # Fallback: attempt to import tools.cheat directly
             from tools.cheat import fetch_cheat
@@ -533,16 +535,13 @@ async def cheat_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-import asyncio
-
-
 async def _run_tool_async(tool_name, parameters):
     # Use native async for web_search, otherwise offload to thread
     if tool_name == "web_search":
         from tools.web_search import web_search_async
 
         return await web_search_async(parameters.get("query", ""))
-    return await asyncio.to_thread(run_tool_direct, tool_name, parameters)
+    return await run_tool_direct_async(tool_name, parameters)
 
 
 async def _run_direct_instruction_tool(
@@ -783,7 +782,8 @@ async def clear_user_history(update: Update, context: ContextTypes.DEFAULT_TYPE)
     logger.warn(f"Clearing history for {update.effective_user}")
 
     if LLM_PROVIDER == "ollama" and clear_history:
-        clear_history()
+        clear_history(getattr(update.effective_user, "id", None))
+        _discard_pending_tool_audio(getattr(context, "user_data", None))
     elif LLM_PROVIDER == "gemini":
         if update.effective_user is not None:
             clear_conversations(update.effective_user.id)
@@ -833,7 +833,9 @@ async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "History inspection only works when Ollama is active."
         )
         return
-    entries = get_recent_history(limit=20)
+    entries = get_recent_history(
+        limit=20, user_id=getattr(update.effective_user, "id", None)
+    )
     if not entries:
         await update.message.reply_text("No conversation history recorded yet.")
         return
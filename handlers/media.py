@@ -69,10 +69,14 @@ async def handle_tool_audio_choice(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
 
     payload = context.user_data.pop("pending_tool_audio", None)
+    # The speech rewrite of the TLDR may still be running in the background.
+    script_task = payload.get("script_task") if payload else None
 
     if query.data == CALLBACK_TOOL_TLDR_AUDIO_YES and payload:
         script = payload.get("script")
         caption = payload.get("caption", DEFAULT_TLDR_CAPTION)
+        if script_task is not None:
+            script = await script_task or script
 
         if not script:
             await query.message.edit_text(MSG_AUDIO_SCRIPT_MISSING)
@@ -94,6 +98,8 @@ async def handle_tool_audio_choice(update: Update, context: ContextTypes.DEFAULT
             await query.message.edit_text(MSG_FAILED_TLDR_AUDIO)
         return
 
+    if script_task is not None:
+        script_task.cancel()
     await query.message.edit_text(MSG_SKIPPED_TLDR_AUDIO)
 
 
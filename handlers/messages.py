@@ -44,10 +44,12 @@ try:
     from services.ollama import (
         pop_last_tool_audio,
         run_tool_direct,
+        run_tool_direct_async,
     )
 except ImportError:  # Guard against optional Ollama dependency
     pop_last_tool_audio = None
     run_tool_direct = None
+    run_tool_direct_async = None
 
 
 DEFAULT_PARSE_MODE = "MarkdownV2"
@@ -66,6 +68,20 @@ PROMPT_AUDIO_SUMMARY_QUESTION = "Do you want the audio summary?"
 PROMPT_INVALID_TEXT = "Please send a valid text message."
 PROMPT_UNKNOWN_TOOL = "Unknown tool request."
 
+# Control words in the same shape _merge_instructions_with_prompt compares.
+_REPROCESS_NORMALIZED = frozenset(
+    word.lower().rstrip("!.? ") for word in REPROCESS_CONTROL_WORDS
+)
+
+
+# Characters that either carry Markdown meaning or need a MarkdownV2 escape.
+# Text without any of them is already valid MarkdownV2 as-is.
+_MARKDOWN_SPECIAL_CHARS = frozenset("_*[]()~`>#+=|{}.!-\\")
+
+
+def _needs_markdownify(text: str) -> bool:
+    return not _MARKDOWN_SPECIAL_CHARS.isdisjoint(text)
+
 
 def escape_markdown_v2(text: str) -> str:
     """Escape Telegram MarkdownV2 special characters, including period and backslash."""
@@ -97,14 +113,17 @@ def escape_markdown_v2(text: str) -> str:
     return text
 
 
-async def _safe_reply_text(target, text: str, parse_mode: Optional[str]):
+async def _safe_reply_text(
+    target, text: str, parse_mode: Optional[str], reply_markup=None
+):
     """Send a message with parse_mode, fallback to plain text on Markdown parsing errors."""
+    extra = {"reply_markup": reply_markup} if reply_markup is not None else {}
     try:
-        return await target.reply_text(text=text, parse_mode=parse_mode)
+        return await target.reply_text(text=text, parse_mode=parse_mode, **extra)
     except BadRequest as e:
         if "Can't parse entities" in str(e):
             logger.warning(f"Markdown parsing failed, sending as plain text: {e}")
-            return await target.reply_text(text=text, parse_mode=None)
+            return await target.reply_text(text=text, parse_mode=None, **extra)
         raise
 
 
@@ -201,11 +220,29 @@ async def send_voice_reply(update_message, filename, caption):
         return None
 
     finally:
-        os.remove(filename)
+        _remove_file_later(filename)
 
     return sent_message
 
 
+# Strong references to fire-and-forget cleanup tasks; the loop only keeps weak ones.
+_BACKGROUND_TASKS: set = set()
+
+
+async def _remove_file(filename: str) -> None:
+    try:
+        await asyncio.to_thread(os.remove, filename)
+    except OSError as e:
+        logger.warning(f"Could not remove temporary file {filename}: {e}")
+
+
+def _remove_file_later(filename: str) -> None:
+    """Delete ``filename`` off the event loop without delaying the caller."""
+    task = asyncio.create_task(_remove_file(filename))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+
 def _resolve_user_id(update: Update, message) -> Optional[int]:
     user = getattr(update, "effective_user", None)
     user_id = getattr(user, "id", None)
@@ -224,38 +261,62 @@ def _build_tool_tldr_caption(summary: str, tool_name: str) -> str:
     return "TL;DR"
 
 
-async def maybe_send_tool_audio(update_message, context):
-    if not conversation_manager.is_ollama() or not pop_last_tool_audio:
-        return
+def _discard_pending_tool_audio(user_data) -> None:
+    """Drop a pending tool audio payload and stop its background script rewrite."""
+    payload = user_data.pop("pending_tool_audio", None) if user_data else None
+    script_task = payload.get("script_task") if payload else None
+    if script_task is not None and not script_task.done():
+        script_task.cancel()
+
+
+def _stage_tool_audio(context) -> bool:
+    """Move a queued tool TL;DR audio payload into user_data.
+
+    Returns True when a payload is now pending and the user should be asked
+    whether they want to hear it.
+    """
+    if not conversation_manager.is_ollama or not pop_last_tool_audio:
+        return False
     payload = pop_last_tool_audio()
     if not payload:
-        return
+        return False
     summary = payload.get("summary", "")
     tool_name = payload.get("tool_name", "")
     script = payload.get("script")
     caption = payload.get("caption") or _build_tool_tldr_caption(summary, tool_name)
     if not script:
         logger.warning("Missing audio script for tool payload: %s", payload)
-        return
+        if payload.get("script_task") is not None:
+            payload["script_task"].cancel()
+        return False
+    # Nobody will answer the earlier prompt now, so stop its rewrite.
+    _discard_pending_tool_audio(context.user_data)
     context.user_data["pending_tool_audio"] = {
         "script": script,
+        "script_task": payload.get("script_task"),
         "caption": caption,
         "tool_name": tool_name,
         "summary": summary,
     }
-    if InlineKeyboardButton is not object and InlineKeyboardMarkup is not object:
-        keyboard = InlineKeyboardMarkup(
+    return True
+
+
+def _tool_audio_keyboard():
+    if InlineKeyboardButton is object or InlineKeyboardMarkup is object:
+        return None
+    return InlineKeyboardMarkup(
+        [
             [
-                [
-                    InlineKeyboardButton(
-                        "🔊", callback_data=CALLBACK_TOOL_TLDR_AUDIO_YES
-                    ),
-                    InlineKeyboardButton(
-                        "Skip", callback_data=CALLBACK_TOOL_TLDR_AUDIO_NO
-                    ),
-                ]
+                InlineKeyboardButton("🔊", callback_data=CALLBACK_TOOL_TLDR_AUDIO_YES),
+                InlineKeyboardButton("Skip", callback_data=CALLBACK_TOOL_TLDR_AUDIO_NO),
             ]
-        )
+        ]
+    )
+
+
+async def _send_tool_audio_prompt(update_message):
+    keyboard = _tool_audio_keyboard()
+    if keyboard is not None:
         await update_message.reply_text(
             PROMPT_AUDIO_SUMMARY_QUESTION,
             reply_markup=keyboard,
@@ -264,6 +325,11 @@ async def maybe_send_tool_audio(update_message, context):
         await update_message.reply_text(PROMPT_AUDIO_SUMMARY_QUESTION)
 
 
+async def maybe_send_tool_audio(update_message, context):
+    if _stage_tool_audio(context):
+        await _send_tool_audio_prompt(update_message)
+
+
 async def respond_in_mode(
     update_message, context, user_input, ai_output, *, tool_info=None
 ):
@@ -281,6 +347,10 @@ async def respond_in_mode(
     )
     sent_messages = []
     is_shell_agent = bool(tool_info and tool_info.get("tool_name") == "shell_agent")
+    # None until a branch has already staged (and possibly asked about) the
+    # tool audio summary itself.
+    audio_staged = None
+    audio_prompt_pending = False
 
     if mode == DEFAULT_MODE:
         if is_shell_agent:
@@ -299,13 +369,32 @@ async def respond_in_mode(
                 sent_msg = await _safe_reply_text(update_message, msg, "MarkdownV2")
                 sent_messages.append(sent_msg)
         else:
-            # Convert Markdown to MarkdownV2 for proper rendering
-            ai_output = markdownify(ai_output)
-            sent_messages = await send_chunked_message(
-                update_message,
-                ai_output,
-                parse_mode=DEFAULT_PARSE_MODE,
+            # Convert Markdown to MarkdownV2 for proper rendering; plain
+            # prose has nothing to convert or escape.
+            if _needs_markdownify(ai_output):
+                ai_output = markdownify(ai_output)
+            audio_staged = _stage_tool_audio(context)
+            combined = (
+                f"{ai_output}\n\n{escape_markdown_v2(PROMPT_AUDIO_SUMMARY_QUESTION)}"
             )
+            if audio_staged and len(combined) <= DEFAULT_CHUNK_SIZE:
+                # Ask about the audio summary in the reply itself instead of
+                # spending a second sendMessage call on the question.
+                sent_messages = [
+                    await _safe_reply_text(
+                        update_message,
+                        combined,
+                        DEFAULT_PARSE_MODE,
+                        reply_markup=_tool_audio_keyboard(),
+                    )
+                ]
+            else:
+                sent_messages = await send_chunked_message(
+                    update_message,
+                    ai_output,
+                    parse_mode=DEFAULT_PARSE_MODE,
+                )
+                audio_prompt_pending = audio_staged
 
     elif mode == MODE_AUDIO:
         if is_cheat_tool:
@@ -334,7 +423,9 @@ async def respond_in_mode(
                 await update_message.reply_text("Content generation failed.")
 
     remember_generated_output(context, user_input, sent_messages, tool_info)
-    if not is_cheat_tool:
+    if audio_prompt_pending:
+        await _send_tool_audio_prompt(update_message)
+    elif audio_staged is None and not is_cheat_tool:
         await maybe_send_tool_audio(update_message, context)
 
 
@@ -346,7 +437,8 @@ def _strip_markdown_escape(text: str) -> str:
 def _strip_command_prefix(text: str) -> str:
     if not text.startswith("/"):
         return text
-    return text.split(" ", 1)[1] if " " in text else ""
+    space = text.find(" ")
+    return "" if space < 0 else text[space + 1 :]
 
 
 def _merge_instructions_with_prompt(instructions: str, original_prompt: str) -> str:
@@ -355,9 +447,11 @@ def _merge_instructions_with_prompt(instructions: str, original_prompt: str) ->
     if not original_prompt:
         return instructions
 
-    normalized = instructions.lower().rstrip("!.? ")
-    if normalized in REPROCESS_CONTROL_WORDS:
-        instructions = ""
+    if instructions:
+        # Most replies are typed lowercase already; skip the extra copy then.
+        normalized = instructions if instructions.islower() else instructions.lower()
+        if normalized.rstrip("!.? ") in _REPROCESS_NORMALIZED:
+            instructions = ""
 
     if instructions:
         return f"{instructions}\n\n{original_prompt}"
@@ -370,6 +464,7 @@ async def _maybe_handle_tool_followup(
     instructions: str,
     original_prompt: str,
     tool_metadata: dict,
+    prompt_history: Optional[dict] = None,
 ):
     if not (tool_metadata and run_tool_direct):
         return False
@@ -388,13 +483,12 @@ async def _maybe_handle_tool_followup(
             "Tool execution backend is not available.", parse_mode=None
         )
         return True
-    generated_content = (
-        run_tool_direct(tool_name, parameters) if run_tool_direct else None
-    )
+    generated_content = await _run_tool_async(tool_name, parameters)
     if generated_content is None:
         await message.reply_text("Unknown tool request.", parse_mode=None)
         return True
-    prompt_history = get_prompt_history(context)
+    if prompt_history is None:
+        prompt_history = get_prompt_history(context)
     prompt_history[message.message_id] = display_prompt
     await respond_in_mode(
         message,
@@ -421,8 +515,9 @@ def _looks_like_shell_command(text: str) -> bool:
 
 
 async def _run_tool_async(tool_name, parameters):
-    # Offload to thread if run_tool_direct is blocking
-    return await asyncio.to_thread(run_tool_direct, tool_name, parameters)
+    # Awaited on this context so the queued tool audio is visible to
+    # pop_last_tool_audio; asyncio.to_thread would set it on a copy.
+    return await run_tool_direct_async(tool_name, parameters)
 
 
 async def _handle_shell_command(message, context, user_text):
@@ -534,6 +629,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, *ar
 
     user_text = _strip_command_prefix(message.text).strip()
 
+    # Resolve the per-user bookkeeping maps once for the whole update.
+    prompt_history = get_prompt_history(context)
+    output_metadata = get_output_metadata(context)
+
     reprocess_detail = None
     reply = message.reply_to_message
     if reply:
@@ -544,7 +643,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, *ar
         if handled:
             return
 
-        original_prompt, tool_metadata = lookup_reply_context(context, reply)
+        original_prompt, tool_metadata = lookup_reply_context(
+            context, reply, prompt_history, output_metadata
+        )
         if tool_metadata and tool_metadata.get("tool_name") == "shell_agent":
             if _looks_like_shell_command(user_text):
                 # Treat as shell command: use context-aware follow-up
@@ -598,26 +699,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, *ar
                 instructions,
                 original_prompt,
                 tool_metadata or {},
+                prompt_history,
             )
             if handled:
                 return
             user_text = _merge_instructions_with_prompt(instructions, original_prompt)
             reprocess_detail = f"reply_to_message_id={reply.message_id}"
 
-    prompt_history = get_prompt_history(context)
-    llm_prompt = user_text
-
     if not user_text:
         await message.reply_text(PROMPT_INVALID_TEXT)
         return
 
-    remember_prompt(context, message, user_text)
+    remember_prompt(context, message, user_text, prompt_history)
 
     if _looks_like_shell_command(user_text):
         await _handle_shell_command(message, context, user_text)
         return
 
-    if conversation_manager.is_ollama() and run_tool_direct:
+    if conversation_manager.is_ollama and run_tool_direct:
         try:
             tool_request = _extract_tool_request(user_text)
         except Exception as directive_err:
@@ -650,8 +749,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, *ar
 
     try:
         user_id = _resolve_user_id(update, message)
+        # A reprocess request asks for a fresh answer, not the cached one.
         generated_content = await conversation_manager.generate_reply_async(
-            user_id, user_text
+            user_id, user_text, bypass_cache=bool(reprocess_detail)
         )
     except RuntimeError as err:
         await mess.edit_text(str(err))
@@ -1,11 +1,18 @@
 import asyncio
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
 
-from config import LLM_PROVIDER
+from config import LLM_MAX_CONCURRENCY, LLM_PROVIDER
 from services.gemini import handle_user_message
-from services.generate import generate_content
+from services.generate import generate_content, load_ollama_async_generator
 from utils.logger import logger
 
+# Dedicated pool so slow LLM calls neither queue behind nor starve other work
+# sharing the loop's default executor.
+_LLM_EXECUTOR = ThreadPoolExecutor(
+    max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm"
+)
+
 
 class ConversationManager:
     """Central entry point for generating LLM replies.
@@ -17,28 +24,49 @@ class ConversationManager:
 
     def __init__(self, provider: Optional[str] = None) -> None:
         self._provider = (provider or LLM_PROVIDER or "").strip().lower()
+        # The provider never changes after construction, so resolve the
+        # backend once instead of re-branching on every reply.
+        self.is_ollama = self._provider == "ollama"
+        self._dispatch = self._resolve_dispatch()
 
     @property
     def provider(self) -> str:
         return self._provider
 
-    def is_ollama(self) -> bool:
-        return self.provider == "ollama"
-
-    def generate_reply(self, user_id: Optional[int], prompt: str) -> str:
-        provider = self.provider
-
-        if provider == "gemini":
-            return handle_user_message(user_id, prompt)
+    def _resolve_dispatch(self) -> Optional[Callable[..., str]]:
+        """Return the backend wrapped behind a uniform (user_id, prompt) signature."""
+        if self._provider == "gemini":
+            return handle_user_message
+        if self._provider == "ollama":
+            return lambda _user_id, prompt: generate_content(prompt)
+        return None
 
-        if provider == "ollama":
-            return generate_content(prompt)
+    def generate_reply(
+        self, user_id: Optional[int], prompt: str, bypass_cache: bool = False
+    ) -> str:
+        if self._dispatch is None:
+            raise RuntimeError(
+                "LLM provider is not configured. Enable Gemini or Ollama."
+            )
+        # Gemini caches per (history, prompt) itself. Ollama replies depend on
+        # the user's history and may run tools, so they are never cached.
+        if not self.is_ollama:
+            return self._dispatch(user_id, prompt, bypass_cache=bypass_cache)
+        return self._dispatch(user_id, prompt)
 
-        raise RuntimeError("LLM provider is not configured. Enable Gemini or Ollama.")
+    async def generate_reply_async(
+        self, user_id: Optional[int], prompt: str, bypass_cache: bool = False
+    ) -> str:
+        # Ollama has a native async client, so its turns run on the event loop
+        # and overlap on the server instead of occupying a pool thread each.
+        async_generator = load_ollama_async_generator() if self.is_ollama else None
+        if async_generator is not None:
+            return await async_generator(prompt, user_id=user_id)
 
-    async def generate_reply_async(self, user_id: Optional[int], prompt: str) -> str:
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self.generate_reply, user_id, prompt)
+        return await loop.run_in_executor(
+            _LLM_EXECUTOR, self.generate_reply, user_id, prompt, bypass_cache
+        )
 
     def summarize_tool_output(self, mode: str, ai_output: str, tool_info: Any) -> str:
         return ai_output
@@ -1,58 +1,242 @@
 # services/gemini.py
+import atexit
+import hashlib
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from config import GEMINI_KEY, SYSTEM_PROMPT
-from utils.logger import RED, RST
+try:  # Optional: much faster (de)serialization of the conversations snapshot
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json is used instead
+    orjson = None
+
+from config import GEMINI_KEY, LLM_MAX_CONCURRENCY, SYSTEM_PROMPT
+from utils.logger import RED, RST, logger
 
 MODEL_NAME = "gemini-1.5-flash-latest"
 API_URL = (
     f"https://generativelanguage.googleapis.com/v1beta/models/"
     f"{MODEL_NAME}:generateContent?key={GEMINI_KEY}"
 )
+CACHE_API = "https://generativelanguage.googleapis.com/v1beta"
+CACHE_URL = f"{CACHE_API}/cachedContents?key={GEMINI_KEY}"
+# Gemini 1.5 only caches prefixes of at least 32768 tokens, so shorter chats
+# are simply sent whole. Roughly 4 characters per token.
+CACHE_MIN_PREFIX_CHARS = 4 * 32768
+# Re-cache once this many uncached messages have piled up after the prefix.
+CACHE_REFRESH_TURNS = 10
+CACHE_TTL = "900s"
+# After a failed cache creation, send that user's history whole for a while
+# instead of paying for another failing request on every turn.
+CACHE_RETRY_AFTER = 600  # seconds
 
 CONVERSATION_FILE = "user_conversations.json"
+# Append-only log of turns added since the last full snapshot.
+CONVERSATION_WAL = "user_conversations.wal"
+SNAPSHOT_EVERY_TURNS = 50
 MAX_CONVERSATIONS = 40
 TRIM_TO = 20
+# Messages kept per user (user and model turns alike). Past the limit the
+# oldest HISTORY_TRIM_BLOCK messages go at once, so the start of the history,
+# and any cached prefix of it, stays put between trims. Keep both even so
+# user/model pairs are evicted together.
+HISTORY_LIMIT = 40
+HISTORY_TRIM_BLOCK = 20
+
+REQUEST_TIMEOUT = (3, 30)  # (connect, read) seconds
+
+# One pooled session so each turn reuses a warm TLS connection instead of
+# paying a fresh handshake. Concurrent user turns already run in parallel on
+# the LLM thread pool, so keep one pooled connection per worker.
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=max(16, LLM_MAX_CONCURRENCY),
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
+atexit.register(_session.close)
+
+_wal_file = None
+_turns_since_snapshot = 0
+_loaded = False
+user_conversations = {}
+# Serializes history mutation, WAL appends and snapshots; handlers run on the
+# LLM thread pool. Re-entrant because an append may trigger a snapshot.
+_persist_lock = threading.RLock()
+
+# Replies for an identical (history, prompt) pair, e.g. a resent message.
+REPLY_CACHE_SIZE = 1024
+REPLY_CACHE_TTL = 300  # seconds
+_reply_cache: "OrderedDict[tuple[str, str], tuple[float, str]]" = OrderedDict()
+_reply_cache_lock = threading.Lock()
+
+# user key -> (prefix_len, prefix_hash, cached_content_name)
+_user_cache_ids: dict[str, tuple[int, str, str]] = {}
+# user key -> time.monotonic() before which no new cache is attempted
+_cache_retry_at: dict[str, float] = {}
+# One lock per user so concurrent turns don't both create (and leak) a cache.
+# Re-entrant because resolving a prefix may drop the superseded one.
+_cache_locks: dict[str, threading.RLock] = {}
+# Statuses meaning the cachedContents entry is gone or unusable; anything else
+# (rate limits, timeouts, 5xx) would fail the same way with the full history.
+CACHE_GONE_STATUSES = frozenset({400, 403, 404})
+
+
+def _close_wal():
+    global _wal_file
+    if _wal_file is not None:
+        _wal_file.close()
+        _wal_file = None
+
+
+def _append_wal(key, messages):
+    """Log one turn instead of rewriting the whole conversations file."""
+    global _wal_file, _turns_since_snapshot
+    line = json.dumps({"k": key, "m": messages}, ensure_ascii=False)
+    with _persist_lock:
+        if _wal_file is None:
+            _wal_file = open(CONVERSATION_WAL, "a", encoding="utf-8", buffering=1)
+        _wal_file.write(line + "\n")
+        _turns_since_snapshot += 1
+        if _turns_since_snapshot > SNAPSHOT_EVERY_TURNS:
+            save_conversations()
+
+
+def _dumps_snapshot(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _loads(data: bytes):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _user_history(key):
+    history = user_conversations.get(key)
+    if history is None:
+        history = user_conversations[key] = []
+    return history
+
+
+def _extend_history(history, messages) -> bool:
+    """Append messages and trim a whole block once over HISTORY_LIMIT.
+
+    Returns True when old messages were dropped, i.e. the prefix moved.
+    """
+    history.extend(messages)
+    excess = len(history) - HISTORY_LIMIT
+    if excess <= 0:
+        return False
+    del history[: max(excess, HISTORY_TRIM_BLOCK)]
+    return True
+
+
+def _replay_wal(conversations):
+    global _turns_since_snapshot
+    if not os.path.exists(CONVERSATION_WAL):
+        return
+    with open(CONVERSATION_WAL, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write; everything before it is intact.
+                break
+            _extend_history(conversations.setdefault(entry["k"], []), entry["m"])
+            _turns_since_snapshot += 1
 
 
 def save_conversations():
     # if logs grow bigger than 40 elements, pop the odest out
-    global user_conversations
-    if len(user_conversations) > MAX_CONVERSATIONS:
-        print(f"{RED}Trimming logs{RST} ")
-        keys_to_remove = list(user_conversations.keys())[
-            : len(user_conversations) - TRIM_TO
-        ]
-        for key in keys_to_remove:
-            del user_conversations[key]
+    global user_conversations, _turns_since_snapshot
+    with _persist_lock:
+        if len(user_conversations) > MAX_CONVERSATIONS:
+            print(f"{RED}Trimming logs{RST} ")
+            keys_to_remove = list(user_conversations.keys())[
+                : len(user_conversations) - TRIM_TO
+            ]
+            for key in keys_to_remove:
+                del user_conversations[key]
 
-    with open(CONVERSATION_FILE, "w", encoding="utf-8") as f:
-        json.dump(user_conversations, f, ensure_ascii=False, indent=2)
+        tmp_file = f"{CONVERSATION_FILE}.tmp"
+        snapshot = {key: list(history) for key, history in user_conversations.items()}
+        with open(tmp_file, "wb") as f:
+            f.write(_dumps_snapshot(snapshot))
+            # Make sure the data is on disk before it replaces the old snapshot.
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, CONVERSATION_FILE)
+
+        # The snapshot now holds every logged turn, so start a fresh log.
+        _close_wal()
+        open(CONVERSATION_WAL, "w", encoding="utf-8").close()
+        _turns_since_snapshot = 0
 
 
 def clear_conversations(delete_usr_id):
     global user_conversations
     key = str(delete_usr_id)
-    if key in user_conversations:
-        del user_conversations[key]
-        save_conversations()
-        return True
+    _ensure_loaded()
+    _drop_cached_prefix(key)
+    _cache_retry_at.pop(key, None)
+    with _persist_lock:
+        if key in user_conversations:
+            del user_conversations[key]
+            save_conversations()
+            return True
     return False
 
 
 def load_conversations():
-    global user_conversations
-    if os.path.exists(CONVERSATION_FILE):
-        with open(CONVERSATION_FILE, "r", encoding="utf-8") as f:
-            user_conversations = json.load(f)
-    else:
-        user_conversations = {}
+    global user_conversations, _turns_since_snapshot, _loaded
+    with _persist_lock:
+        _close_wal()
+        _turns_since_snapshot = 0
+        if os.path.exists(CONVERSATION_FILE):
+            with open(CONVERSATION_FILE, "rb") as f:
+                conversations = {
+                    key: history[-HISTORY_LIMIT:]
+                    for key, history in _loads(f.read()).items()
+                }
+        else:
+            conversations = {}
+        _replay_wal(conversations)
+        # Publish only the fully loaded dict; _ensure_loaded checks _loaded
+        # without the lock, so it must not turn True any earlier.
+        user_conversations = conversations
+        _loaded = True
+
+
+def _ensure_loaded():
+    """Load the stored conversations the first time a Gemini turn needs them."""
+    if _loaded:
+        return
+    with _persist_lock:
+        if not _loaded:
+            load_conversations()
 
 
 def delete_conversations_file():
+    _close_wal()
+    if os.path.exists(CONVERSATION_WAL):
+        os.remove(CONVERSATION_WAL)
     if os.path.exists(CONVERSATION_FILE):
         os.remove(CONVERSATION_FILE)
         print(f"{RED}Deleted conversations file{RST}")
@@ -60,42 +244,179 @@ def delete_conversations_file():
         print(f"{RED}Conversations file does not exist{RST}")
 
 
-load_conversations()
+def _snapshot_on_exit():
+    if _turns_since_snapshot:
+        save_conversations()
+    _close_wal()
+
 
+atexit.register(_snapshot_on_exit)
 
-def handle_user_message(user_id, message_text):
-    key = str(user_id)  # Convert to string for JSON-safe key
-    history = user_conversations.get(key, [])
 
-    history.append({"role": "user", "parts": [{"text": message_text}]})
+def _cached_reply(cache_key: tuple[str, str]) -> str | None:
+    with _reply_cache_lock:
+        entry = _reply_cache.get(cache_key)
+        if entry is None:
+            return None
+        expires_at, reply = entry
+        if expires_at < time.monotonic():
+            del _reply_cache[cache_key]
+            return None
+        _reply_cache.move_to_end(cache_key)
+        return reply
 
-    reply = generate_content(message_text, history=history[:-1])
 
-    history.append({"role": "model", "parts": [{"text": reply}]})
+def _store_reply(cache_key: tuple[str, str], reply: str) -> None:
+    with _reply_cache_lock:
+        _reply_cache[cache_key] = (time.monotonic() + REPLY_CACHE_TTL, reply)
+        _reply_cache.move_to_end(cache_key)
+        while len(_reply_cache) > REPLY_CACHE_SIZE:
+            _reply_cache.popitem(last=False)
 
-    user_conversations[key] = history
-    save_conversations()
+
+def handle_user_message(user_id, message_text, bypass_cache=False):
+    key = str(user_id)  # Convert to string for JSON-safe key
+    _ensure_loaded()
+    history = _user_history(key)
+    past_turns = list(history)
+
+    reply_key = (_prefix_hash(past_turns), message_text)
+    reply = None if bypass_cache else _cached_reply(reply_key)
+    if reply is None:
+        reply = generate_content(message_text, history=past_turns, cache_key=key)
+        if not reply.startswith(("Error calling Gemini API", "No response from")):
+            _store_reply(reply_key, reply)
+
+    # Append the pair together so the bounded history never starts on a model turn.
+    turn = [
+        {"role": "user", "parts": [{"text": message_text}]},
+        {"role": "model", "parts": [{"text": reply}]},
+    ]
+    with _persist_lock:
+        trimmed = _extend_history(history, turn)
+        _append_wal(key, turn)
+    if trimmed:
+        # The cached prefix no longer matches the start of the history.
+        _drop_cached_prefix(key)
     return reply
 
 
-def generate_content(prompt: str, history: list = []) -> str:
+def _prefix_hash(turns: list) -> str:
+    encoded = json.dumps(turns, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def _history_chars(turns: list) -> int:
+    return sum(
+        len(part.get("text", "")) for turn in turns for part in turn.get("parts", [])
+    )
+
+
+def _create_cached_prefix(turns: list) -> str:
+    payload = {
+        "model": f"models/{MODEL_NAME}",
+        "contents": turns,
+        "systemInstruction": {"parts": [{"text": SYSTEM_PROMPT}]},
+        "ttl": CACHE_TTL,
+    }
+    response = _session.post(CACHE_URL, json=payload, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["name"]
+
+
+def _delete_cached_prefix(name: str) -> None:
+    try:
+        response = _session.delete(
+            f"{CACHE_API}/{name}?key={GEMINI_KEY}", timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.warning("Could not delete Gemini cache %s: %s", name, e)
+
+
+def _cache_lock(cache_key: str) -> threading.RLock:
+    # dict.setdefault is atomic, so racing callers end up with the same lock.
+    return _cache_locks.setdefault(cache_key, threading.RLock())
+
+
+def _drop_cached_prefix(cache_key: str) -> None:
+    """Forget the user's cached prefix and free it on the server."""
+    with _cache_lock(cache_key):
+        entry = _user_cache_ids.pop(cache_key, None)
+    if entry is not None:
+        _delete_cached_prefix(entry[2])
+
+
+def _resolve_cached_prefix(cache_key: str, history: list) -> tuple[str | None, int]:
+    """Return a cachedContents name covering the start of history and its length.
+
+    Returns (None, 0) when the history is too short to be worth caching or the
+    cache could not be created.
+    """
+    with _cache_lock(cache_key):
+        return _resolve_cached_prefix_locked(cache_key, history)
+
+
+def _resolve_cached_prefix_locked(
+    cache_key: str, history: list
+) -> tuple[str | None, int]:
+    entry = _user_cache_ids.get(cache_key)
+    if entry is not None:
+        prefix_len, digest, name = entry
+        if (
+            prefix_len <= len(history) <= prefix_len + CACHE_REFRESH_TURNS
+            and _prefix_hash(history[:prefix_len]) == digest
+        ):
+            return name, prefix_len
+        # Superseded: the history moved past it or a trim shifted its start.
+        _drop_cached_prefix(cache_key)
+
+    if _history_chars(history) < CACHE_MIN_PREFIX_CHARS:
+        return None, 0
+    if _cache_retry_at.get(cache_key, 0.0) > time.monotonic():
+        return None, 0
+
+    try:
+        name = _create_cached_prefix(history)
+    except (requests.RequestException, KeyError, ValueError) as e:
+        logger.warning("Could not cache Gemini history prefix: %s", e)
+        _cache_retry_at[cache_key] = time.monotonic() + CACHE_RETRY_AFTER
+        return None, 0
+
+    _cache_retry_at.pop(cache_key, None)
+    _user_cache_ids[cache_key] = (len(history), _prefix_hash(history), name)
+    return name, len(history)
+
+
+def generate_content(
+    prompt: str, history: list = [], cache_key: str | None = None
+) -> str:
     """
     prompt: Current user message
     history: Optional previous messages (each with 'role' and 'parts')
+    cache_key: Optional conversation key; long histories are then sent as a
+        server-side cached prefix plus only the turns after it
     """
-    # Start from history if exists, otherwise empty list
-    contents = history[:]
+    user_turn = {"role": "user", "parts": [{"text": prompt}]}
+    cached_name, prefix_len = (
+        _resolve_cached_prefix(cache_key, history) if cache_key else (None, 0)
+    )
 
-    # Add current user message
-    contents.append({"role": "user", "parts": [{"text": prompt}]})
-
-    payload = {
-        "contents": contents,
-        "system_instruction": {"parts": [{"text": SYSTEM_PROMPT}]},
-    }
+    if cached_name:
+        payload = {
+            "contents": history[prefix_len:] + [user_turn],
+            "cachedContent": cached_name,
+        }
+    else:
+        payload = {
+            "contents": history + [user_turn],
+            "system_instruction": {"parts": [{"text": SYSTEM_PROMPT}]},
+        }
     headers = {"Content-Type": "application/json"}
     try:
-        response = requests.post(API_URL, headers=headers, json=payload)
+        response = _session.post(
+            API_URL, headers=headers, json=payload, timeout=REQUEST_TIMEOUT
+        )
         response.raise_for_status()
         candidates = response.json().get("candidates", [])
         if not candidates:
@@ -103,4 +424,9 @@ def generate_content(prompt: str, history: list = []) -> str:
 
         return candidates[0]["content"]["parts"][0]["text"]
     except requests.RequestException as e:
+        status = getattr(e.response, "status_code", None)
+        if cached_name and status in CACHE_GONE_STATUSES:
+            # The cache expired or was rejected; retry with the full history.
+            _drop_cached_prefix(cache_key)
+            return generate_content(prompt, history)
         return f"Error calling Gemini API: {e}"
@@ -1,4 +1,5 @@
-from typing import Callable, Optional
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional
 
 from utils.logger import logger
 
@@ -7,6 +8,7 @@ GEMINI_SOURCE = "gemini"
 OLLAMA_SOURCE = "ollama"
 
 
+@lru_cache(maxsize=1)
 def load_ollama_generator() -> Optional[Callable[..., str]]:
     try:
         import services.ollama
@@ -18,6 +20,18 @@ def load_ollama_generator() -> Optional[Callable[..., str]]:
     return ollama_generator
 
 
+@lru_cache(maxsize=1)
+def load_ollama_async_generator() -> Optional[Callable[..., Awaitable[str]]]:
+    try:
+        import services.ollama
+
+        return services.ollama.generate_content_async
+    except ImportError as e:
+        logger.error("Ollama service is not available: %s", e)
+        return None
+
+
+@lru_cache(maxsize=1)
 def load_gemini_generator() -> Optional[Callable[..., str]]:
     import services.gemini
 
@@ -37,6 +51,13 @@ def generate_from_gemini(prompt: str) -> str:
     return "Failed to load Gemini generator"
 
 
+# Loaders are memoized, so each backend module is imported and resolved once.
+_BACKENDS = {
+    GEMINI_SOURCE: ("Gemini", load_gemini_generator),
+    OLLAMA_SOURCE: ("Ollama", load_ollama_generator),
+}
+
+
 def generate_content(prompt: str, source: Optional[str] = LLM_PROVIDER) -> str:
     """
     Generates content based on the provided prompt and source.
@@ -48,21 +69,17 @@ def generate_content(prompt: str, source: Optional[str] = LLM_PROVIDER) -> str:
     """
     normalized_source = (source or LLM_PROVIDER).strip()
     provider = normalized_source.lower()
-    if provider == GEMINI_SOURCE:
-        try:
-            return generate_from_gemini(prompt)
-        except Exception as e:
-            logger.error("Error generating content from Gemini: %s", e)
-            return f"Error from Gemini: {e}"
-    elif provider == OLLAMA_SOURCE:
-        try:
-            ollama_generator = load_ollama_generator()
-            if ollama_generator:
-                return ollama_generator(prompt)
-            else:
-                logger.error("Failed to load Ollama generator")
-                return "Failed to load Ollama generator"
-        except Exception as e:
-            logger.error("Error generating content from Ollama: %s", e)
-            return f"Error from Ollama: {e}"
-    return f"Unknown source: {provider or 'unspecified'}"
+    backend = _BACKENDS.get(provider)
+    if backend is None:
+        return f"Unknown source: {provider or 'unspecified'}"
+
+    label, loader = backend
+    try:
+        generator = loader()
+        if generator:
+            return generator(prompt)
+        logger.error("Failed to load %s generator", label)
+        return f"Failed to load {label} generator"
+    except Exception as e:
+        logger.error("Error generating content from %s: %s", label, e)
+        return f"Error from {label}: {e}"
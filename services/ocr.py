@@ -1,9 +1,22 @@
+import re
+import threading
+from operator import itemgetter
 from typing import Dict, List
 
 import pytesseract
 
 from PIL import Image
 
+try:  # Optional: in-process libtesseract bindings, no temp file or fork per image
+    import tesserocr
+except ImportError:  # pragma: no cover - falls back to the pytesseract CLI wrapper
+    tesserocr = None
+
+try:  # Optional: SIMD JPEG decode and thresholding
+    import cv2
+except ImportError:  # pragma: no cover - PIL handles preprocessing instead
+    cv2 = None
+
 from utils.logger import logger
 
 
@@ -12,6 +25,34 @@ DEFAULT_BINARY_THRESHOLD = 145
 TESSERACT_LANG = "eng+deu"
 TESSERACT_PSM = 6
 
+# Lookup table for binarization; a precomputed table lets PIL map pixels in C
+# instead of evaluating a Python callable to build one.
+_BINARY_LUT = [0 if x < DEFAULT_BINARY_THRESHOLD else 255 for x in range(256)]
+
+# A tesserocr API handle is expensive to create (it loads the language data)
+# and not thread-safe, so one is shared behind a lock.
+_tesserocr_api = None
+_tesserocr_lock = threading.Lock()
+
+
+# Both merge rules as one scan over the space-joined line. Every alternative
+# is anchored to whole tokens, and re.sub's left-to-right, non-overlapping
+# matching mirrors the token walk: a decimal merge is tried before a currency
+# merge, and merged tokens are not reconsidered.
+_MERGE_RE = re.compile(
+    r"(?<!\S)(?:"
+    r"(?P<amount>[.,]*\d[\d.,]*) (?P<sep>[.,]) (?P<frac>\d+)"
+    r"|(?P<value>\S*\d\S*) (?P<currency>€|EUR|eur)"
+    r")(?!\S)"
+)
+_left_of = itemgetter("left")
+
+
+def _merge_match(match: re.Match) -> str:
+    if match.group("sep"):
+        return match.group("amount") + match.group("sep") + match.group("frac")
+    return match.group("value") + match.group("currency")
+
 
 def _merge_line_tokens(tokens: List[Dict[str, int | str]]) -> str:
     """Merge tokens on a single visual line into a readable string.
@@ -24,38 +65,8 @@ def _merge_line_tokens(tokens: List[Dict[str, int | str]]) -> str:
     if not tokens:
         return ""
 
-    merged: List[str] = []
-    i = 0
-
-    while i < len(tokens):
-        current_text = str(tokens[i]["text"])
-
-        # Merge patterns like: 12 , 34  ->  12,34   or  12 . 34  ->  12.34
-        if i + 2 < len(tokens):
-            next_text = str(tokens[i + 1]["text"])
-            third_text = str(tokens[i + 2]["text"])
-
-            if (
-                next_text in {",", "."}
-                and current_text.replace(",", "").replace(".", "").isdigit()
-                and third_text.isdigit()
-            ):
-                merged.append(f"{current_text}{next_text}{third_text}")
-                i += 3
-                continue
-
-        # Merge currency symbol / code directly after an amount: 12,34  € -> 12,34€
-        if i + 1 < len(tokens):
-            next_text = str(tokens[i + 1]["text"])
-            if next_text in {"€", "EUR", "eur"} and any(ch.isdigit() for ch in current_text):
-                merged.append(f"{current_text}{next_text}")
-                i += 2
-                continue
-
-        merged.append(current_text)
-        i += 1
-
-    return " ".join(merged)
+    joined = " ".join(str(token["text"]) for token in tokens)
+    return _MERGE_RE.sub(_merge_match, joined)
 
 
 def group_tokens_by_line(tokens: List[Dict[str, int | str]], y_tolerance: int = DEFAULT_Y_TOLERANCE) -> List[str]:
@@ -69,72 +80,107 @@ def group_tokens_by_line(tokens: List[Dict[str, int | str]], y_tolerance: int =
     if not tokens:
         return []
 
-    enriched: List[Dict[str, int | str]] = []
-    for token in tokens:
+    def center_y(token: Dict[str, int | str]) -> float:
         top = int(token["top"])
         height = int(token.get("height", 0))
-        center_y = top + (height / 2.0 if height else 0)
-        # Copy token so we don't mutate the original list unexpectedly
-        enriched.append({**token, "_center_y": center_y})
+        return top + (height / 2.0 if height else 0)
 
-    # Sort by vertical centre so tokens from the same printed row stay close
-    enriched.sort(key=lambda t: t["_center_y"])
+    # Sort by vertical centre so tokens from the same printed row are adjacent.
+    # Each token then only needs comparing against the line being built, whose
+    # mean centre is tracked incrementally instead of re-summed per token.
+    keyed = sorted(
+        ((center_y(token), token) for token in tokens), key=lambda kt: kt[0]
+    )
 
     lines: List[List[Dict[str, int | str]]] = []
-
-    for token in enriched:
-        placed = False
-        for line in lines:
-            # Use the average centre of the existing line as its reference
-            line_center = sum(t["_center_y"] for t in line) / len(line)
-            if abs(token["_center_y"] - line_center) <= y_tolerance:
-                line.append(token)
-                placed = True
-                break
-
-        if not placed:
+    line_sum = 0.0
+    for center, token in keyed:
+        if lines and abs(center - line_sum / len(lines[-1])) <= y_tolerance:
+            lines[-1].append(token)
+            line_sum += center
+        else:
             lines.append([token])
+            line_sum = center
 
     # Within each visual line, sort left-to-right and apply token merging
     result: List[str] = []
     for line in lines:
-        ordered = sorted(line, key=lambda t: t["left"])
-        result.append(_merge_line_tokens(ordered))
+        # The line lists are our own, so sort them in place rather than copying.
+        line.sort(key=_left_of)
+        result.append(_merge_line_tokens(line))
 
     return result
 
-def process_image(image_path: str) -> List[Dict[str, int | str]]:
+def _tokens_from_tesserocr(binary: Image.Image) -> List[Dict[str, int | str]]:
+    global _tesserocr_api
+
     tokens: List[Dict[str, int | str]] = []
+    level = tesserocr.RIL.WORD
+    with _tesserocr_lock:
+        if _tesserocr_api is None:
+            _tesserocr_api = tesserocr.PyTessBaseAPI(
+                lang=TESSERACT_LANG, psm=TESSERACT_PSM
+            )
+        _tesserocr_api.SetImage(binary)
+        _tesserocr_api.Recognize()
+        for word in tesserocr.iterate_level(_tesserocr_api.GetIterator(), level):
+            text = word.GetUTF8Text(level)
+            box = word.BoundingBox(level)
+            cleaned = (text or "").strip()
+            if not cleaned or box is None:
+                continue
 
-    try:
-        with Image.open(image_path) as image:
-            grayscale = image.convert("L")
-            binary = grayscale.point(
-                lambda x: 0 if x < DEFAULT_BINARY_THRESHOLD else 255,
-                "1",
+            left, top, _right, bottom = box
+            tokens.append(
+                {"text": cleaned, "top": top, "left": left, "height": bottom - top}
             )
-            data = pytesseract.image_to_data(
-                binary,
-                # Many receipts are mixed English/German; enable both to
-                # improve recognition of store names and item descriptions.
-                lang=TESSERACT_LANG,
-                config=f"--psm {TESSERACT_PSM}",
-                output_type=pytesseract.Output.DICT,
+    return tokens
+
+
+def _binarize(image_path: str) -> Image.Image:
+    """Load the image as black/white using DEFAULT_BINARY_THRESHOLD."""
+    if cv2 is not None:
+        grayscale = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if grayscale is not None:
+            # THRESH_BINARY keeps pixels strictly above the threshold, PIL's
+            # table keeps those at or above it.
+            _, binary = cv2.threshold(
+                grayscale, DEFAULT_BINARY_THRESHOLD - 1, 255, cv2.THRESH_BINARY
             )
+            return Image.fromarray(binary)
 
+    with Image.open(image_path) as image:
+        return image.convert("L").point(_BINARY_LUT, "1")
 
-        for index, text in enumerate(data.get("text", [])):
+
+def process_image(image_path: str) -> List[Dict[str, int | str]]:
+    tokens: List[Dict[str, int | str]] = []
+
+    try:
+        binary = _binarize(image_path)
+        if tesserocr is not None:
+            return _tokens_from_tesserocr(binary)
+
+        data = pytesseract.image_to_data(
+            binary,
+            # Many receipts are mixed English/German; enable both to
+            # improve recognition of store names and item descriptions.
+            lang=TESSERACT_LANG,
+            config=f"--psm {TESSERACT_PSM}",
+            output_type=pytesseract.Output.DICT,
+        )
+
+        # Walk tesseract's parallel columns together rather than indexing
+        # three lists per word.
+        for text, top, left, height in zip(
+            data.get("text", []), data["top"], data["left"], data["height"]
+        ):
             cleaned = text.strip()
             if not cleaned:
                 continue
 
             tokens.append(
-                {
-                    "text": cleaned,
-                    "top": data["top"][index],
-                    "left": data["left"][index],
-                    "height": data["height"][index],
-                }
+                {"text": cleaned, "top": top, "left": left, "height": height}
             )
     except Exception as exc:  # pragma: no cover - defensive log
         logger.error("Error processing image: %s", exc)
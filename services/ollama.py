@@ -1,14 +1,25 @@
 import asyncio
+import atexit
+import contextvars
 import json
+import logging
 import os
 import re
 import threading
+import time
 import uuid
-from collections import deque
-from datetime import UTC, datetime
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-from ollama import chat as _ollama_chat
+import httpx
+from ollama import AsyncClient, ChatResponse, Client
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json is used instead
+    orjson = None
 
 from config import (
     DEBUG_HISTORY_STATE,
@@ -17,12 +28,15 @@ from config import (
     SYSTEM_PROMPT,
 )
 from services.ollama_shared import (
+    COMMAND_ALTERNATIVES_PROMPT,
     COMMAND_TRANSLATOR_SYSTEM_PROMPT,
     CONTENT_REPORTER_SCRIPT_PROMPT,
+    KEEP_ALIVE,
     MAX_HISTORY_LENGTH,
     MAX_TOOL_OUTPUT_IN_HISTORY,
     MODEL_NAME,
     QUERY_TRANSLATOR_SYSTEM_PROMPT,
+    TLDR_MIN_CHARS,
 )
 from tools import load_tools
 from utils.command_guard import (
@@ -32,102 +46,382 @@ from utils.command_guard import (
 )
 from utils.logger import RED, RST, logger
 
-if hasattr(_ollama_chat, "chat"):
-    chat = _ollama_chat.chat
-else:
-    chat = _ollama_chat
+# Per-context user id keying user_histories. ContextVars follow asyncio tasks
+# where threading.local would be shared by every task on the event loop thread.
+# asyncio.to_thread runs in a *copy* of the context: values set there (such as
+# the last tool audio) never reach the caller, so tools with side effects the
+# caller reads back must be awaited through the async entry points.
+_user_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "ollama_user_id", default=None
+)
+_last_tool_audio_var: contextvars.ContextVar[Optional[Dict[str, Any]]] = (
+    contextvars.ContextVar("ollama_last_tool_audio", default=None)
+)
+
+# Bounds on remembered conversations: least recently used users beyond
+# MAX_USERS, and users idle for longer than USER_HISTORY_TTL seconds, are dropped.
+MAX_USERS = max(1, int(os.getenv("MAX_USERS") or "1000"))
+USER_HISTORY_TTL = float(os.getenv("USER_HISTORY_TTL") or 24 * 60 * 60)
+
+
+class _LRUHistoryStore(OrderedDict):
+    """user_id -> history map kept in least-recently-used order.
 
+    Because entries are ordered by last access, idle users are always at the
+    front, so expiring them stops at the first entry that is still fresh.
+    Turns run on the event loop and on worker threads alike, so every
+    reordering or eviction happens under one lock. It is re-entrant because
+    checkout and __setitem__ evict, and eviction pops.
+    """
+
+    def __init__(
+        self,
+        *args,
+        capacity: int = MAX_USERS,
+        ttl: float = USER_HISTORY_TTL,
+        **kwargs,
+    ) -> None:
+        self.capacity = capacity
+        self.ttl = ttl
+        self._last_seen: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            self._last_seen[key] = time.monotonic()
+            self._evict()
+
+    def pop(self, key, *default):
+        with self._lock:
+            self._last_seen.pop(key, None)
+            return super().pop(key, *default)
+
+    def checkout(self, key: str) -> List[Dict[str, Any]]:
+        """Return the history for key, creating it, and mark it most recent."""
+        with self._lock:
+            history = super().get(key)
+            if history is None:
+                history = []
+                self[key] = history
+                return history
+            self.move_to_end(key)
+            self._last_seen[key] = time.monotonic()
+            self._evict()
+            return history
+
+    def _evict(self) -> None:
+        with self._lock:
+            cutoff = time.monotonic() - self.ttl
+            while self:
+                oldest = next(iter(self))
+                if (
+                    len(self) <= self.capacity
+                    and self._last_seen.get(oldest, 0) >= cutoff
+                ):
+                    break
+                self.pop(oldest)
 
-# Internal global mapping of thread/session -> UUID
-_thread_local = threading.local()
 
-# Maps uuid -> conversation history
-user_histories: Dict[str, List[Dict[str, str]]] = {}
+# Maps user id -> conversation history
+user_histories: _LRUHistoryStore = _LRUHistoryStore()
 
 # Shared constants imported from services.ollama_shared
 
-available_functions = load_tools()
+TOOL_MODE = False
+
+# One compiled trigger alternation per tool, in registry order.
+_tool_triggers: Tuple[Tuple[str, re.Pattern], ...] = ()
+_all_tool_names: Tuple[str, ...] = ()
+# Lowercased name / function name / trigger -> (key, entry); first tool wins.
+_tool_aliases: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
 
-if DEBUG_OLLAMA:
-    logger.debug(
-        f"Loaded {len(available_functions)} tools for Ollama. {list(available_functions.keys())}"
+@lru_cache(maxsize=1024)
+def _match_tool_names(lower_prompt: str) -> Tuple[str, ...]:
+    return tuple(
+        name
+        for name, pattern in _tool_triggers
+        if pattern.match(lower_prompt)
     )
 
-TOOL_MODE = False
+
+@lru_cache(maxsize=256)
+def _tool_callables_for(names: Tuple[str, ...]) -> tuple:
+    return tuple(get_available_functions()[name]["function"] for name in names)
+
+
+def _compile_triggers(triggers: List[str]) -> re.Pattern:
+    """Match any trigger as a whole word at the start of the lowercased prompt."""
+    alternatives = "|".join(re.escape(trigger.lower()) for trigger in triggers)
+    return re.compile(r"\b(?:" + alternatives + r")\b")
+
+
+def _build_tool_aliases(
+    tools: Dict[str, Dict[str, Any]],
+) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    aliases: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    for key, entry in tools.items():
+        names = [entry.get("name") or "", entry["function"].__name__]
+        names.extend(t for t in entry.get("triggers", []) if isinstance(t, str))
+        for alias in names:
+            if alias:
+                aliases.setdefault(alias.lower(), (key, entry))
+    return aliases
+
+
+def _refresh_tool_index() -> None:
+    """Rebuild trigger patterns from the tool registry and drop cached lookups."""
+    global _tool_triggers, _all_tool_names, _tool_aliases
+    tools = _tools_cache or {}
+    _tool_triggers = tuple(
+        (name, _compile_triggers(entry["triggers"]))
+        for name, entry in tools.items()
+        if entry.get("triggers")
+    )
+    _all_tool_names = tuple(tools)
+    _tool_aliases = _build_tool_aliases(tools)
+    _match_tool_names.cache_clear()
+    _tool_callables_for.cache_clear()
+
+
+_tools_cache: Optional[Dict[str, dict]] = None
+_tools_lock = threading.Lock()
+
+
+def get_available_functions() -> Dict[str, dict]:
+    """Return the tool registry, loading it the first time a turn needs it."""
+    if _tools_cache is None:
+        with _tools_lock:
+            if _tools_cache is None:
+                reload_tools()
+    return _tools_cache
+
+
+def reload_tools() -> Dict[str, dict]:
+    """Load the tool registry again and rebuild the trigger/callable caches."""
+    global _tools_cache
+    tools = load_tools()
+    if DEBUG_OLLAMA:
+        logger.debug(f"Loaded {len(tools)} tools for Ollama. {list(tools.keys())}")
+    _tools_cache = tools
+    _refresh_tool_index()
+    return tools
 
 EVENT_LOG_LIMIT = 200
 MAX_EVENT_TEXT = 400
 
+# Extra messages dropped whenever the history overflows, so trimming happens
+# once every HISTORY_TRIM_SLACK turns instead of on every turn at the cap.
+HISTORY_TRIM_SLACK = 32
+
+# Approximate tokens (len(content) // 4) of recent turns that are never dropped
+# just to make slack. Cuts land on user-turn boundaries and the dropped span is
+# folded into one summary message, so the prefix the server has cached stays
+# put between trims.
+HISTORY_TAIL_TOKENS = max(0, int(os.getenv("HISTORY_TAIL_TOKENS") or "1500"))
+SUMMARY_MARKER = "[earlier turns summarized]"
+SUMMARY_MAX_LINES = 20
+SUMMARY_LINE_CHARS = 80
+
+# Tool stdout/stderr kept when formatting a tool result.
+MAX_STDOUT_CHARS = 16000
+OUTPUT_TRUNCATED_NOTE = "\n... (output truncated)"
+
+# Request-side compaction of the history sent to the model (the stored
+# history keeps everything up to MAX_HISTORY_LENGTH).
+KEEP_RECENT_TOOL_RESULTS = 2
+KEEP_RECENT_TURNS = 5
+ARCHIVED_PREVIEW_CHARS = 200
+EVICTED_TOOL_OUTPUT = "[evicted tool output]"
+
 OLLAMA_URL = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+# Matches the server's OLLAMA_NUM_PARALLEL; more in-flight requests only queue.
+OLLAMA_NUM_PARALLEL = max(1, int(os.getenv("OLLAMA_NUM_PARALLEL") or "4"))
+
+# Shared connection pools: keep-alive connections are reused across turns, and
+# HTTP/2 (h2 is a dependency) multiplexes requests when OLLAMA_HOST is https.
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+_HTTP_TIMEOUT = httpx.Timeout(600, connect=5)
+
+_client = Client(
+    host=OLLAMA_URL, http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS
+)
+atexit.register(_client.close)
+
+# Replies are streamed and reassembled into one ChatResponse: the server sends
+# tokens as soon as they exist, so long generations never sit idle against the
+# read timeout, and callers can watch the text arrive through on_token.
+STREAM_CHAT = os.getenv("OLLAMA_STREAM", "1") != "0"
+
+
+def chat(
+    on_token: Optional[Callable[[str], None]] = None, **kwargs: Any
+) -> ChatResponse:
+    """Blocking chat call on the shared client; see STREAM_CHAT."""
+    if not STREAM_CHAT:
+        return _client.chat(**kwargs)
+    parts: List[str] = []
+    tool_calls: List[Any] = []
+    last = None
+    for last in _client.chat(stream=True, **kwargs):
+        _absorb_chunk(last, parts, tool_calls, on_token)
+    return _assemble_response(last, parts, tool_calls)
+
+
+async def _client_chat_async(
+    client: AsyncClient,
+    on_token: Optional[Callable[[str], None]] = None,
+    **kwargs: Any,
+) -> ChatResponse:
+    if not STREAM_CHAT:
+        return await client.chat(**kwargs)
+    parts: List[str] = []
+    tool_calls: List[Any] = []
+    last = None
+    async for last in await client.chat(stream=True, **kwargs):
+        _absorb_chunk(last, parts, tool_calls, on_token)
+    return _assemble_response(last, parts, tool_calls)
+
+
+def _absorb_chunk(
+    chunk: ChatResponse,
+    parts: List[str],
+    tool_calls: List[Any],
+    on_token: Optional[Callable[[str], None]],
+) -> None:
+    message = chunk.message
+    if message.content:
+        parts.append(message.content)
+        if on_token is not None:
+            on_token(message.content)
+    if message.tool_calls:
+        tool_calls.extend(message.tool_calls)
+
+
+def _assemble_response(
+    last: Optional[ChatResponse], parts: List[str], tool_calls: List[Any]
+) -> ChatResponse:
+    """Fold a finished stream into the response shape a non-streamed call returns."""
+    if last is None:
+        raise RuntimeError("Ollama returned an empty chat stream")
+    message = last.message.model_copy(
+        update={"content": "".join(parts), "tool_calls": tool_calls or None}
+    )
+    return last.model_copy(update={"message": message})
+
+_async_client: Optional[AsyncClient] = None
+_ollama_slots = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+
+# Optional coalescing window for async chat calls. Requests arriving within the
+# window are released together so the server can batch them over the shared
+# system-prompt prefix; 0 (the default) sends each one as soon as a slot frees.
+OLLAMA_BATCH_WINDOW_MS = max(0, int(os.getenv("OLLAMA_BATCH_WINDOW_MS") or "0"))
+
+_batch_queue: Optional[asyncio.Queue] = None
+_batch_loop: Optional[asyncio.AbstractEventLoop] = None
+_BACKGROUND_TASKS: set = set()
 
 _event_log: deque[Dict[str, Any]] = deque(maxlen=EVENT_LOG_LIMIT)
 _last_command_translation_error: Optional[str] = None
 
+# Successful instruction translations, keyed by (kind, model, instruction).
+# OLLAMA_TRANSLATE_CACHE=0 turns the cache off, e.g. while tuning prompts.
+TRANSLATION_CACHE_ENABLED = os.getenv("OLLAMA_TRANSLATE_CACHE", "1") != "0"
+TRANSLATION_CACHE_SIZE = 512
+TRANSLATION_CACHE_TTL = 60  # seconds
+_translation_cache: "OrderedDict[Tuple[str, str, str], Tuple[float, str, Optional[str]]]" = (
+    OrderedDict()
+)
+_translation_cache_lock = threading.Lock()
+
 from utils.logger import debug_payload
 
+_DEBUG_ON = DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES
 _debug = (
-    lambda *args, **kwargs: debug_payload(*args, **kwargs)
-    if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES
-    else None
+    lambda *args, **kwargs: debug_payload(*args, **kwargs) if _DEBUG_ON else None
 )
 
 
+_REDACTED_SYSTEM_MESSAGE = {"role": "system", "content": "<REDACTED_SYSTEM_PROMPT>"}
+# Shared by every history and one-off prompt; never mutate these in place.
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+_TLDR_REQUEST_MESSAGE = {
+    "role": "user",
+    "content": "Summarize the key points in no more than three sentences.",
+}
+_AUDIO_SCRIPT_REQUEST_MESSAGE = {
+    "role": "user",
+    "content": CONTENT_REPORTER_SCRIPT_PROMPT,
+}
+
+
 def _redact_system_content_in_messages(
     messages: List[Dict[str, str]],
 ) -> List[Dict[str, str]]:
-    """Return a copy of messages with system role content redacted for logging."""
-    sanitized: List[Dict[str, str]] = []
-    for m in messages:
-        if m.get("role") == "system":
-            sanitized.append({**m, "content": "<REDACTED_SYSTEM_PROMPT>"})
-        else:
-            sanitized.append(m)
-    return sanitized
+    """Return messages for logging with system entries swapped for a placeholder.
+
+    Other entries are the original dicts (not copies), so treat the result as read-only.
+    """
+    return [
+        _REDACTED_SYSTEM_MESSAGE if m.get("role") == "system" else m for m in messages
+    ]
 
 
 def _sanitize_payload(payload: Any) -> Any:
     """Sanitize common payload structures (e.g., dicts with a 'messages' key) to avoid logging system prompts."""
-    if isinstance(payload, dict):
-        p = dict(payload)
-        if "messages" in p and isinstance(p["messages"], list):
-            p["messages"] = _redact_system_content_in_messages(p["messages"])
+    if isinstance(payload, dict) and isinstance(payload.get("messages"), list):
+        return {
+            **payload,
+            "messages": _redact_system_content_in_messages(payload["messages"]),
+        }
     return payload
 
 
+# Follow-up prompt markers, found in one scan. The shell-output marker only
+# counts at the very start and is case-sensitive; the others match anywhere.
+_PROMPT_SENTINELS = re.compile(
+    r"\A(Given this shell output:)|(?i:(answer this question:)|(previous command:))"
+)
+_ANSWER_QUESTION_GROUP = 2
+_PREVIOUS_COMMAND_GROUP = 3
+
+
 def evaluate_tool_usage(prompt: str) -> Tuple[bool, Dict[str, dict]]:
     assert isinstance(prompt, str)
     lower_prompt = prompt.lower()
-
-    if (
-        prompt.startswith("Given this shell output:")
-        or "answer this question:" in lower_prompt
+    tools = get_available_functions()
+
+    sentinel = _PROMPT_SENTINELS.search(prompt)
+    if sentinel and (
+        sentinel.lastindex != _PREVIOUS_COMMAND_GROUP
+        # A later "answer this question:" still wins over "previous command:";
+        # a repeated "previous command:" does not.
+        or any(
+            later.lastindex == _ANSWER_QUESTION_GROUP
+            for later in _PROMPT_SENTINELS.finditer(prompt, sentinel.end())
+        )
     ):
         return False, {}
 
-    if "previous command:" in lower_prompt:
-        shell_agent_entry = available_functions.get("shell_agent")
+    if sentinel:
+        shell_agent_entry = tools.get("shell_agent")
         if shell_agent_entry:
             return True, {"shell_agent": shell_agent_entry}
 
-    matched_tools = {
-        name: entry
-        for name, entry in available_functions.items()
-        if any(
-            re.match(r"\b" + re.escape(trigger) + r"\b", lower_prompt)
-            for trigger in entry.get("triggers", [])
-        )
-    }
+    matched_tools = {name: tools[name] for name in _match_tool_names(lower_prompt)}
 
     should_use = bool(matched_tools) or TOOL_MODE
 
     return should_use, matched_tools
 
 
-def generate_content(prompt: str) -> str | tuple[str, str | None]:
+def _begin_turn(prompt: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Record the user's prompt in their history and return (user_id, history)."""
     user_id = _get_or_create_user_id()
-    history = user_histories.setdefault(user_id, [])
-
-    _ensure_system_prompt(history)
+    history = _checkout_history(user_id)
 
     # Add user message
     history.append({"role": "user", "content": prompt})
@@ -136,161 +430,372 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
     if DEBUG_HISTORY_STATE:
         _debug(
             "history_after_user",
-            {
+            lambda: {
                 "user_id": user_id,
                 "entries": _redact_system_content_in_messages(history),
             },
         )
+    return user_id, history
 
+
+def _prepare_chat_request(
+    prompt: str, history: List[Dict[str, Any]]
+) -> Tuple[Dict[str, dict], List[Dict[str, Any]], tuple]:
+    """Return (matched_tools, messages, tool_callables) for the chat call."""
+    use_tools, matched_tools = evaluate_tool_usage(prompt)
+    _debug(
+        "tool_evaluation",
+        lambda: {
+            "prompt": prompt,
+            "use_tools": use_tools,
+            "matched_tools": list(matched_tools.keys()),
+        },
+    )
+    messages = _compact_for_llm(history)
+
+    _debug(
+        "chat_request",
+        lambda: {
+            "messages": _redact_system_content_in_messages(messages),
+        },
+    )
+
+    if not use_tools:
+        return matched_tools, messages, ()
+    tool_callables = _tool_callables_for(
+        tuple(matched_tools) if matched_tools else _all_tool_names
+    )
+    return matched_tools, messages, tool_callables
+
+
+def _select_tool_call(
+    response: Any, history: List[Dict[str, Any]], matched_tools: Dict[str, dict]
+) -> Optional[Tuple[str, Any, Dict[str, Any]]]:
+    """Log the chat response and pick the tool call to run, if any.
+
+    Returns (tool_name, tool_function, arguments) for the first tool call that
+    maps to an allowed tool, or None when the model answered directly.
+    """
+    response_message_content = None
     try:
-        use_tools, matched_tools = evaluate_tool_usage(prompt)
+        response_message_content = getattr(response.message, "content", None)
+    except Exception:
+        response_message_content = None
+    if response_message_content is not None:
         _debug(
-            "tool_evaluation",
-            {
-                "prompt": prompt,
-                "use_tools": use_tools,
-                "matched_tools": list(matched_tools.keys()),
-            },
+            "chat_response",
+            lambda: {"message_content": response_message_content},
         )
-        messages = history
 
-        _debug(
-            "chat_request",
-            {
-                "messages": _redact_system_content_in_messages(messages),
-            },
-        )
+    tool_calls = response.message.tool_calls
+    if not tool_calls:
+        return None
 
-        tool_pool = matched_tools if matched_tools else available_functions
-        tool_callables = (
-            [entry["function"] for entry in tool_pool.values()] if use_tools else []
-        )
+    # Add the assistant's message with tool calls to history for context; each
+    # call is dumped once here and the objects are read directly below.
+    assistant_message = {
+        "role": "assistant",
+        "content": response_message_content or "",
+        "tool_calls": [
+            call.model_dump() if hasattr(call, "model_dump") else call
+            for call in tool_calls
+        ],
+    }
+    history.append(assistant_message)
+    _debug("tool_calls", lambda: [call.function.name for call in tool_calls])
+    tools = get_available_functions()
+    for tool in tool_calls:
+        func_entry = tools.get(tool.function.name)
+        if func_entry and (not matched_tools or tool.function.name in matched_tools):
+            _debug(
+                "executing_tool",
+                lambda: {
+                    "tool": tool.function.name,
+                    "arguments": tool.function.arguments,
+                },
+            )
+            return tool.function.name, func_entry["function"], tool.function.arguments
+        logger.warning(f"Tool {tool.function.name} not found in available functions.")
+    return None
+
+
+def _finish_reply(user_id: str, history: List[Dict[str, Any]], response: Any) -> str:
+    reply = response.message.content or ""
+    reply = escape_entities(reply)
+    history.append({"role": "assistant", "content": reply})
+
+    _record_event("assistant", reply)
+    _debug(
+        "assistant_reply",
+        lambda: {
+            "user_id": user_id,
+            "reply": reply,
+            "history_size": len(history),
+        },
+    )
+    return reply
+
+
+def _direct_shell_request(prompt: str) -> Optional[Dict[str, str]]:
+    """Return shell_agent parameters when the prompt is already a runnable command."""
+    if "shell_agent" not in get_available_functions():
+        return None
+    command = detect_direct_command(prompt)
+    return {"prompt": command} if command else None
+
+
+def generate_content(
+    prompt: str, on_token: Optional[Callable[[str], None]] = None
+) -> str | tuple[str, str | None]:
+    """Answer one prompt for the bound user, running a tool when one is called.
+
+    on_token, if given, receives reply text as it streams in (e.g. to start
+    speech at the first sentence); the full reply is still returned.
+    """
+    # Literal commands skip the chat round-trip and go straight to the shell tool.
+    direct = _direct_shell_request(prompt)
+    if direct is not None:
+        result = run_tool_direct("shell_agent", direct)
+        if result is not None:
+            return result
 
+    user_id, history = _begin_turn(prompt)
+
+    try:
+        matched_tools, messages, tool_callables = _prepare_chat_request(
+            prompt, history
+        )
         response = chat(
             model=MODEL_NAME,
             messages=messages,
-            keep_alive=0,
+            keep_alive=KEEP_ALIVE,
             tools=tool_callables,
+            on_token=on_token,
         )
-        response_message_content = None
-        try:
-            response_message_content = getattr(response.message, "content", None)
-        except Exception:
-            response_message_content = None
-        log_payload: Dict[str, Any] = {}
-        if response_message_content is not None:
-            log_payload["message_content"] = response_message_content
-        if log_payload:
-            _debug("chat_response", log_payload)
-
-        if response.message.tool_calls:
-            # Add the assistant's message with tool calls to history for context
-            assistant_message = {
-                "role": "assistant",
-                "content": response.message.content or "",
-                "tool_calls": [
-                    call.model_dump() if hasattr(call, "model_dump") else call
-                    for call in response.message.tool_calls
-                ],
-            }
-            history.append(assistant_message)
-            _debug(
-                "tool_calls",
-                [call.function.name for call in response.message.tool_calls],
-            )
-            for tool in response.message.tool_calls:
-                func_entry = available_functions.get(tool.function.name)
-                if func_entry and (
-                    not matched_tools or tool.function.name in matched_tools
-                ):
-                    _debug(
-                        "executing_tool",
-                        {
-                            "tool": tool.function.name,
-                            "arguments": tool.function.arguments,
-                        },
-                    )
-                    output = call_tool_with_tldr(
-                        tool.function.name,
-                        func_entry["function"],
-                        history,
-                        **tool.function.arguments,
-                    )
-                    return output
-                else:
-                    logger.warning(
-                        f"Tool {tool.function.name} not found in available functions."
-                    )
+        tool_call = _select_tool_call(response, history, matched_tools)
+        if tool_call is not None:
+            tool_name, tool_function, arguments = tool_call
+            return call_tool_with_tldr(tool_name, tool_function, history, **arguments)
+        return _finish_reply(user_id, history, response)
 
-        reply = response.message.content or ""
-        reply = escape_entities(reply)
-        history.append({"role": "assistant", "content": reply})
+    except Exception as e:
+        return f"Error calling Ollama API: {e}"
 
-        _record_event("assistant", reply)
-        _debug(
-            "assistant_reply",
-            {
-                "user_id": user_id,
-                "reply": reply,
-                "history_size": len(history),
-            },
+
+def _get_async_client() -> AsyncClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncClient(
+            host=OLLAMA_URL, http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS
+        )
+    return _async_client
+
+
+async def _chat_async(**kwargs: Any) -> Any:
+    """Run one chat call on the async client, through the batch window if set."""
+    if OLLAMA_BATCH_WINDOW_MS <= 0:
+        async with _ollama_slots:
+            return await _client_chat_async(_get_async_client(), **kwargs)
+
+    future = asyncio.get_running_loop().create_future()
+    _get_batch_queue().put_nowait((kwargs, future))
+    return await future
+
+
+def _get_batch_queue() -> asyncio.Queue:
+    global _batch_queue, _batch_loop
+    loop = asyncio.get_running_loop()
+    if _batch_queue is None or _batch_loop is not loop:
+        _batch_queue = asyncio.Queue()
+        _batch_loop = loop
+        _spawn(_batcher(_batch_queue))
+    return _batch_queue
+
+
+def _spawn(coro) -> asyncio.Task:
+    """Start coro on the running loop and keep a reference until it finishes."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+async def _batcher(queue: asyncio.Queue) -> None:
+    while True:
+        batch = [await queue.get()]
+        await asyncio.sleep(OLLAMA_BATCH_WINDOW_MS / 1000)
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        # Release the whole window at once; _ollama_slots still caps how many
+        # requests are in flight.
+        for kwargs, future in batch:
+            _spawn(_run_batched_chat(kwargs, future))
+
+
+async def _run_batched_chat(kwargs: Dict[str, Any], future: asyncio.Future) -> None:
+    try:
+        async with _ollama_slots:
+            result = await _client_chat_async(_get_async_client(), **kwargs)
+    except Exception as err:
+        if not future.done():
+            future.set_exception(err)
+    else:
+        if not future.done():
+            future.set_result(result)
+
+
+async def generate_content_async(
+    prompt: str,
+    user_id: Any = None,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> str | tuple[str, str | None]:
+    """Async counterpart of generate_content that awaits the chat call.
+
+    History updates happen in synchronous stretches between awaits, so
+    concurrent turns cannot interleave inside a single append.
+    """
+    bind_user(user_id)
+    direct = _direct_shell_request(prompt)
+    if direct is not None:
+        result = await run_tool_direct_async("shell_agent", direct)
+        if result is not None:
+            return result
+
+    user_id, history = _begin_turn(prompt)
+
+    try:
+        matched_tools, messages, tool_callables = _prepare_chat_request(
+            prompt, history
+        )
+        response = await _chat_async(
+            model=MODEL_NAME,
+            messages=messages,
+            keep_alive=KEEP_ALIVE,
+            tools=tool_callables,
+            on_token=on_token,
         )
-        return reply
+        tool_call = _select_tool_call(response, history, matched_tools)
+        if tool_call is not None:
+            tool_name, tool_function, arguments = tool_call
+            return await call_tool_with_tldr_async(
+                tool_name, tool_function, history, **arguments
+            )
+        return _finish_reply(user_id, history, response)
 
     except Exception as e:
         return f"Error calling Ollama API: {e}"
 
 
+async def generate_content_many(
+    prompts: List[str],
+) -> List[str | tuple[str, str | None]]:
+    """Run several prompts concurrently; the server handles them in parallel."""
+    return await asyncio.gather(*(generate_content_async(p) for p in prompts))
+
+
+# entities to escape, applied in a single translate() pass
+_ESCAPE_TABLE = str.maketrans({"!": " !", "=": " ="})
+
+
 def escape_entities(text: str) -> str:
-    # a list of entities to escape
-    entities = ["!", "="]
-    for entity in entities:
-        text = text.replace(entity, f" {entity}")
-    return text
+    return text.translate(_ESCAPE_TABLE)
 
 
-def tldr_tool_output(tool_name: str, output: str) -> str:
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+def _tldr_messages(tool_name: str, output: str) -> List[Dict[str, str]]:
+    return [
+        _SYSTEM_MESSAGE,
         {
             "role": "assistant",
             "content": f"Tool {tool_name} returned the following data:\n{output}",
         },
+        _TLDR_REQUEST_MESSAGE,
+    ]
+
+
+def _audio_script_messages(summary_text: str) -> List[Dict[str, str]]:
+    return [
+        _SYSTEM_MESSAGE,
         {
-            "role": "user",
-            "content": "Summarize the key points in no more than three sentences.",
+            "role": "assistant",
+            "content": f"Here is the summary you produced earlier: {summary_text}",
         },
+        _AUDIO_SCRIPT_REQUEST_MESSAGE,
     ]
-    response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+
+
+def tldr_tool_output(tool_name: str, output: str) -> str:
+    messages = _tldr_messages(tool_name, output)
+    response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
+
+    return response.message.content or ""
+
+
+async def tldr_tool_output_async(tool_name: str, output: str) -> str:
+    messages = _tldr_messages(tool_name, output)
+    response = await _chat_async(
+        model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE
+    )
 
     return response.message.content or ""
 
 
 def build_audio_script(summary_text: str) -> Optional[str]:
     try:
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "assistant",
-                "content": f"Here is the summary you produced earlier: {summary_text}",
-            },
-            {
-                "role": "user",
-                "content": CONTENT_REPORTER_SCRIPT_PROMPT,
-            },
-        ]
+        messages = _audio_script_messages(summary_text)
+        response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
+        content = response.message.content
+        return content.strip() if content is not None else None
+    except Exception as err:
+        logger.error(f"Error generating audio script: {err}")
+        return None
+
 
-        response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+async def build_audio_script_async(summary_text: str) -> Optional[str]:
+    try:
+        messages = _audio_script_messages(summary_text)
+        response = await _chat_async(
+            model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE
+        )
         content = response.message.content
-        if content is not None:
-            return content.strip()
-        else:
-            return None
+        return content.strip() if content is not None else None
     except Exception as err:
         logger.error(f"Error generating audio script: {err}")
         return None
 
 
+# stderr phrases that mark a shell_agent attempt as failed even on exit code 0.
+_STDERR_ERROR_MARKERS = re.compile(
+    "|".join(
+        map(
+            re.escape,
+            (
+                "unknown option",
+                "unrecognized option",
+                "invalid option",
+                "command not found",
+                "permission denied",
+                "no such file or directory",
+                "cannot access",
+                "not found",
+                "failed",
+                "error",
+            ),
+        )
+    ),
+    re.IGNORECASE,
+)
+
+NO_SEARCH_QUERY_REPLY = "I couldn't infer a web search query from that request."
+
+
+def _query_to_translate(tool_name: str, arguments: Dict[str, Any]) -> Optional[str]:
+    """Return the web_search query that should be rewritten before the call."""
+    if tool_name != "web_search":
+        return None
+    query = arguments.get("query")
+    return query.strip() if isinstance(query, str) else None
+
+
 def call_tool_with_tldr(
     tool_name: str,
     tool_callable,
@@ -300,26 +805,20 @@ def call_tool_with_tldr(
 ) -> str | tuple[str, str | None]:
     working_arguments = dict(arguments)
 
-    if (
-        tool_name == "web_search"
-        and translate_instruction_to_query
-        and isinstance(working_arguments.get("query"), str)
-    ):
-        query = working_arguments["query"].strip()
-        if query:
-            translated = translate_instruction_to_query(query)
-            if not translated:
-                logger.warning(
-                    "Query translation failed for web_search; aborting tool call."
-                )
-                return "I couldn't infer a web search query from that request."
-            working_arguments["query"] = translated
+    query = _query_to_translate(tool_name, working_arguments)
+    if query:
+        translated = translate_instruction_to_query(query)
+        if not translated:
+            logger.warning("Query translation failed for web_search; aborting tool call.")
+            return NO_SEARCH_QUERY_REPLY
+        working_arguments["query"] = translated
 
     raw_output: Any
     if tool_name == "shell_agent":
         max_attempts = 3
         attempt = 0
         last_output: Any = None
+        candidates: Optional[List[str]] = None
 
         while attempt < max_attempts:
             attempt += 1
@@ -334,28 +833,12 @@ def call_tool_with_tldr(
 
             has_error = exit_code not in (0, None)
 
-            lower_err = stderr.lower()
             if not has_error and stderr:
-                for marker in (
-                    "unknown option",
-                    "unrecognized option",
-                    "invalid option",
-                    "command not found",
-                    "permission denied",
-                    "no such file or directory",
-                    "cannot access",
-                    "not found",
-                    "no such file or directory",
-                    "failed",
-                    "error",
-                ):
-                    if marker in lower_err:
-                        has_error = True
-                        break
+                has_error = bool(_STDERR_ERROR_MARKERS.search(stderr))
 
             # If command succeeded but produced no output, consider it a failure
             # Most information-gathering commands should produce at least some output
-            if not has_error and exit_code == 0 and not stdout.strip():
+            if not has_error and exit_code == 0 and not stdout:
                 has_error = True
 
             if not has_error:
@@ -366,10 +849,7 @@ def call_tool_with_tldr(
             )
 
             original_prompt = working_arguments.get("prompt")
-            if (
-                not isinstance(original_prompt, str)
-                or not translate_instruction_to_command
-            ):
+            if not isinstance(original_prompt, str) or attempt == max_attempts:
                 break
 
             context_instruction = (
@@ -377,7 +857,15 @@ def call_tool_with_tldr(
                 f"Suggest a simple alternative command for the same task: {original_prompt}"
             )
 
-            new_command = translate_instruction_to_command(context_instruction)
+            # One model call proposes every remaining retry; fall back to a
+            # single translation only once those candidates run out.
+            if candidates is None:
+                candidates = translate_instruction_to_commands(
+                    context_instruction, n=max_attempts - attempt
+                )
+            new_command = _next_candidate(candidates, last_output.get("command"))
+            if not new_command:
+                new_command = translate_instruction_to_command(context_instruction)
             if not new_command:
                 logger.info(
                     f"shell_agent retry {attempt}/{max_attempts}: no new command generated, aborting retry"
@@ -424,7 +912,7 @@ def call_tool_with_tldr(
     raw_text = _format_tool_output(tool_name, raw_output)
     _debug(
         "tool_raw_output",
-        {
+        lambda: {
             "tool": tool_name,
             "arguments": working_arguments,
             "raw_output": raw_output,
@@ -432,9 +920,7 @@ def call_tool_with_tldr(
     )
 
     # Truncate tool output for history to keep it manageable
-    truncated_text = raw_text[:MAX_TOOL_OUTPUT_IN_HISTORY] + (
-        "..." if len(raw_text) > MAX_TOOL_OUTPUT_IN_HISTORY else ""
-    )
+    truncated_text = _bounded(raw_text, MAX_TOOL_OUTPUT_IN_HISTORY)
 
     history.append({"role": "tool", "name": tool_name, "content": truncated_text})
 
@@ -442,48 +928,55 @@ def call_tool_with_tldr(
         "tool_call",
         f"{tool_name} completed",
         {
-            "arguments": _stringify_data(working_arguments)
-            if working_arguments
-            else "{}",
-            "output": raw_text,
+            "arguments": working_arguments,
+            "output": truncated_text,
         },
     )
 
     if tool_name in ("shell_agent", "cheat", "fetch_cheat", "cheat.sh"):
-        if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
+        if _DEBUG_ON:
             logger.info(
                 f"Skipping TLDR for {tool_name}; returning raw tool output only."
             )
         return raw_text if not tldr_separate else (raw_text, None)
 
-    summary = None
-    try:
-        summary = tldr_tool_output(tool_name, raw_text)
-    except Exception as err:
-        logger.error(f"Error generating TLDR for tool {tool_name}: {err}")
+    # Short outputs are their own summary; skip the TLDR model call for them.
+    short_text = raw_text.strip()
+    is_short = len(short_text) <= TLDR_MIN_CHARS
+    summary = short_text if is_short else None
+    if not is_short:
+        try:
+            summary = tldr_tool_output(tool_name, raw_text)
+        except Exception as err:
+            logger.error(f"Error generating TLDR for tool {tool_name}: {err}")
 
     if summary:
         summary_text = summary
-        if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
-            logger.info(f"TLDR ready for {tool_name}: {summary_text}")
+        if _DEBUG_ON:
+            logger.info("TLDR ready for %s: %s", tool_name, summary_text)
         _record_event("tldr", f"{tool_name}: {summary_text}")
         _debug(
             "tldr_summary",
-            {
+            lambda: {
                 "tool": tool_name,
                 "summary": summary_text,
             },
         )
-        history.append(
-            {
-                "role": "assistant",
-                "content": f"TLDR (from {tool_name}): {summary_text}",
-            }
-        )
+        if not is_short:
+            history.append(
+                {
+                    "role": "assistant",
+                    "content": f"TLDR (from {tool_name}): {summary_text}",
+                }
+            )
         try:
-            audio_script = build_audio_script(summary_text) or summary_text
-            if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
-                logger.info(f"Queued TLDR audio script for {tool_name}: {audio_script}")
+            # Only the separate-TLDR callers voice short outputs as a script.
+            if is_short and not tldr_separate:
+                audio_script = summary_text
+            else:
+                audio_script = build_audio_script(summary_text) or summary_text
+            if _DEBUG_ON:
+                logger.info("Queued TLDR audio script for %s: %s", tool_name, audio_script)
             _set_last_tool_audio(
                 {
                     "summary": summary_text,
@@ -494,7 +987,7 @@ def call_tool_with_tldr(
             _record_event("audio_queue", f"Queued TLDR audio for {tool_name}")
             _debug(
                 "audio_queue_payload",
-                {
+                lambda: {
                     "tool": tool_name,
                     "audio_script": audio_script,
                 },
@@ -506,12 +999,33 @@ def call_tool_with_tldr(
 
         if tldr_separate:
             return raw_text, summary_text
+        elif is_short:
+            return raw_text
         else:
             return f"{raw_text}\n\nTLDR: {summary_text}"
 
     return raw_text if not tldr_separate else (raw_text, None)
 
 
+async def _build_tool_audio_script(tool_name: str, summary_text: str) -> str:
+    """Rewrite a TLDR for speech, falling back to the summary on any error."""
+    try:
+        audio_script = await build_audio_script_async(summary_text) or summary_text
+    except Exception as audio_err:
+        logger.error(f"Error building audio script for tool {tool_name}: {audio_err}")
+        return summary_text
+    if _DEBUG_ON:
+        logger.info("Queued TLDR audio script for %s: %s", tool_name, audio_script)
+    _debug(
+        "audio_queue_payload",
+        lambda: {
+            "tool": tool_name,
+            "audio_script": audio_script,
+        },
+    )
+    return audio_script
+
+
 async def call_tool_with_tldr_async(
     tool_name: str,
     tool_callable,
@@ -521,26 +1035,20 @@ async def call_tool_with_tldr_async(
 ) -> str | tuple[str, str | None]:
     working_arguments = dict(arguments)
 
-    if (
-        tool_name == "web_search"
-        and translate_instruction_to_query
-        and isinstance(working_arguments.get("query"), str)
-    ):
-        query = working_arguments["query"].strip()
-        if query:
-            translated = await asyncio.to_thread(translate_instruction_to_query, query)
-            if not translated:
-                logger.warning(
-                    "Query translation failed for web_search; aborting tool call."
-                )
-                return "I couldn't infer a web search query from that request."
-            working_arguments["query"] = translated
+    query = _query_to_translate(tool_name, working_arguments)
+    if query:
+        translated = await asyncio.to_thread(translate_instruction_to_query, query)
+        if not translated:
+            logger.warning("Query translation failed for web_search; aborting tool call.")
+            return NO_SEARCH_QUERY_REPLY
+        working_arguments["query"] = translated
 
     raw_output: Any
     if tool_name == "shell_agent":
         max_attempts = 3
         attempt = 0
         last_output: Any = None
+        candidates: Optional[List[str]] = None
 
         while attempt < max_attempts:
             attempt += 1
@@ -555,27 +1063,11 @@ async def call_tool_with_tldr_async(
 
             has_error = exit_code not in (0, None)
 
-            lower_err = stderr.lower()
             if not has_error and stderr:
-                for marker in (
-                    "unknown option",
-                    "unrecognized option",
-                    "invalid option",
-                    "command not found",
-                    "permission denied",
-                    "no such file or directory",
-                    "cannot access",
-                    "not found",
-                    "no such file or directory",
-                    "failed",
-                    "error",
-                ):
-                    if marker in lower_err:
-                        has_error = True
-                        break
+                has_error = bool(_STDERR_ERROR_MARKERS.search(stderr))
 
             # If command succeeded but produced no output, consider it a failure
-            if not has_error and exit_code == 0 and not stdout.strip():
+            if not has_error and exit_code == 0 and not stdout:
                 has_error = True
 
             if not has_error:
@@ -586,10 +1078,7 @@ async def call_tool_with_tldr_async(
             )
 
             original_prompt = working_arguments.get("prompt")
-            if (
-                not isinstance(original_prompt, str)
-                or not translate_instruction_to_command
-            ):
+            if not isinstance(original_prompt, str) or attempt == max_attempts:
                 break
 
             context_instruction = (
@@ -597,9 +1086,17 @@ async def call_tool_with_tldr_async(
                 f"Suggest a simple alternative command for the same task: {original_prompt}"
             )
 
-            new_command = await asyncio.to_thread(
-                translate_instruction_to_command, context_instruction
-            )
+            if candidates is None:
+                candidates = await asyncio.to_thread(
+                    translate_instruction_to_commands,
+                    context_instruction,
+                    n=max_attempts - attempt,
+                )
+            new_command = _next_candidate(candidates, last_output.get("command"))
+            if not new_command:
+                new_command = await asyncio.to_thread(
+                    translate_instruction_to_command, context_instruction
+                )
             if not new_command:
                 logger.info(
                     f"shell_agent retry {attempt}/{max_attempts}: no new command generated, aborting retry"
@@ -650,16 +1147,14 @@ async def call_tool_with_tldr_async(
     raw_text = _format_tool_output(tool_name, raw_output)
     _debug(
         "tool_raw_output",
-        {
+        lambda: {
             "tool": tool_name,
             "arguments": working_arguments,
             "raw_output": raw_output,
         },
     )
 
-    truncated_text = raw_text[:MAX_TOOL_OUTPUT_IN_HISTORY] + (
-        "..." if len(raw_text) > MAX_TOOL_OUTPUT_IN_HISTORY else ""
-    )
+    truncated_text = _bounded(raw_text, MAX_TOOL_OUTPUT_IN_HISTORY)
 
     history.append({"role": "tool", "name": tool_name, "content": truncated_text})
 
@@ -667,79 +1162,100 @@ async def call_tool_with_tldr_async(
         "tool_call",
         f"{tool_name} completed",
         {
-            "arguments": _stringify_data(working_arguments)
-            if working_arguments
-            else "{}",
-            "output": raw_text,
+            "arguments": working_arguments,
+            "output": truncated_text,
         },
     )
 
     if tool_name in ("shell_agent", "cheat", "fetch_cheat", "cheat.sh"):
-        if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
+        if _DEBUG_ON:
             logger.info(
                 f"Skipping TLDR for {tool_name}; returning raw tool output only."
             )
         return raw_text if not tldr_separate else (raw_text, None)
 
-    summary = None
-    try:
-        summary = await asyncio.to_thread(tldr_tool_output, tool_name, raw_text)
-    except Exception as err:
-        logger.error(f"Error generating TLDR for tool {tool_name}: {err}")
+    # Short outputs are their own summary; skip the TLDR model call for them.
+    short_text = raw_text.strip()
+    is_short = len(short_text) <= TLDR_MIN_CHARS
+    summary = short_text if is_short else None
+    if not is_short:
+        try:
+            summary = await tldr_tool_output_async(tool_name, raw_text)
+        except Exception as err:
+            logger.error(f"Error generating TLDR for tool {tool_name}: {err}")
 
     if summary:
         summary_text = summary
-        if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
-            logger.info(f"TLDR ready for {tool_name}: {summary_text}")
+        if _DEBUG_ON:
+            logger.info("TLDR ready for %s: %s", tool_name, summary_text)
         _record_event("tldr", f"{tool_name}: {summary_text}")
         _debug(
             "tldr_summary",
-            {
+            lambda: {
                 "tool": tool_name,
                 "summary": summary_text,
             },
         )
-        history.append(
-            {
-                "role": "assistant",
-                "content": f"TLDR (from {tool_name}): {summary_text}",
-            }
-        )
-        try:
-            audio_script = (
-                await asyncio.to_thread(build_audio_script, summary_text)
-                or summary_text
-            )
-            if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
-                logger.info(f"Queued TLDR audio script for {tool_name}: {audio_script}")
-            _set_last_tool_audio(
+        if not is_short:
+            history.append(
                 {
-                    "summary": summary_text,
-                    "tool_name": tool_name,
-                    "script": audio_script,
+                    "role": "assistant",
+                    "content": f"TLDR (from {tool_name}): {summary_text}",
                 }
             )
-            _record_event("audio_queue", f"Queued TLDR audio for {tool_name}")
-            _debug(
-                "audio_queue_payload",
-                {
-                    "tool": tool_name,
-                    "audio_script": audio_script,
-                },
-            )
-        except Exception as audio_err:
-            logger.error(
-                f"Error building audio script for tool {tool_name}: {audio_err}"
-            )
+        # The audio rewrite is only needed if the user asks to hear the TLDR,
+        # so it runs in the background instead of delaying the reply. The
+        # payload carries the summary as a fallback script plus the task.
+        # Only the separate-TLDR callers voice short outputs as a script.
+        script_task = None
+        if not (is_short and not tldr_separate):
+            script_task = _spawn(_build_tool_audio_script(tool_name, summary_text))
+        _set_last_tool_audio(
+            {
+                "summary": summary_text,
+                "tool_name": tool_name,
+                "script": summary_text,
+                "script_task": script_task,
+            }
+        )
+        _record_event("audio_queue", f"Queued TLDR audio for {tool_name}")
 
         if tldr_separate:
             return raw_text, summary_text
+        elif is_short:
+            return raw_text
         else:
             return f"{raw_text}\n\nTLDR: {summary_text}"
 
     return raw_text if not tldr_separate else (raw_text, None)
 
 
+def _bounded(text: str, limit: int, note: str = "...") -> str:
+    """Return text capped at limit characters, note included, in one slice."""
+    if len(text) <= limit:
+        return text
+    return text[: limit - len(note)] + note
+
+
+def _bounded_output(output: Any) -> str:
+    """Return stripped tool output capped at MAX_STDOUT_CHARS.
+
+    Oversized strings are sliced before stripping so only the kept part is
+    copied; iterables of chunks (e.g. streamed lines) are read only up to the cap.
+    """
+    if not isinstance(output, str):
+        chunks: List[str] = []
+        size = 0
+        for chunk in output:
+            chunks.append(str(chunk))
+            size += len(chunks[-1])
+            if size > MAX_STDOUT_CHARS:
+                break
+        output = "".join(chunks)
+
+    return _bounded(output, MAX_STDOUT_CHARS, OUTPUT_TRUNCATED_NOTE).strip()
+
+
 def _format_tool_output(tool_name: str, raw_output: Any) -> str:
     if raw_output is None:
         return "Tool returned no data."
@@ -756,6 +1272,12 @@ def _format_tool_output(tool_name: str, raw_output: Any) -> str:
         stdout = raw_output.get("stdout")
         stderr = raw_output.get("stderr")
 
+        # Successful shell_agent result: build the text directly, no line list.
+        if stdout and exit_code in (0, None):
+            body = _bounded_output(stdout)
+            if body:
+                return f"$ {command}\n{body}" if command else body
+
         if command:
             lines.append(f"$ {command}")
         has_error = (exit_code not in (0, None)) or (stderr and not stdout)
@@ -765,29 +1287,24 @@ def _format_tool_output(tool_name: str, raw_output: Any) -> str:
                 lines.append(f"Exit code: {exit_code}")
 
             if stdout:
-                stdout_str = stdout.strip()
-                if len(stdout_str) > 16000:  # Truncate very long stdout
-                    stdout_str = stdout_str[:16000] + "\n... (output truncated)"
                 lines.append("Stdout:")
-                lines.append(stdout_str)
+                lines.append(_bounded_output(stdout))
 
             if stderr:
                 lines.append("Stderr:")
-                lines.append(stderr.strip())
+                lines.append(_bounded_output(stderr))
         else:
             if stdout:
-                stdout_str = stdout.strip()
-                if len(stdout_str) > 16000:  # Truncate very long stdout
-                    stdout_str = stdout_str[:16000] + "\n... (output truncated)"
-                lines.append(stdout_str)
+                lines.append(_bounded_output(stdout))
             elif exit_code is not None:
                 lines.append(f"Exit code: {exit_code}")
 
         if lines:
-            return "\n".join(lines).strip()
+            # Only a trailing empty body can leave whitespace; no line starts with it.
+            return "\n".join(lines).rstrip()
 
         try:
-            return json.dumps(raw_output, indent=2, sort_keys=True)
+            return _json_text(raw_output, indent=True)
         except (TypeError, ValueError):
             return str(raw_output)
 
@@ -800,35 +1317,134 @@ def _format_tool_output(tool_name: str, raw_output: Any) -> str:
     return str(raw_output)
 
 
+def bind_user(user_id: Any) -> None:
+    """Key this context's Ollama history by a stable id such as the Telegram user."""
+    if user_id is not None:
+        _user_id_var.set(str(user_id))
+
+
 def _get_or_create_user_id() -> str:
-    if not hasattr(_thread_local, "user_id"):
-        _thread_local.user_id = str(uuid.uuid4())
-    return _thread_local.user_id
+    user_id = _user_id_var.get()
+    if user_id is None:
+        user_id = str(uuid.uuid4())
+        _user_id_var.set(user_id)
+    return user_id
 
 
-def _ensure_system_prompt(history: List[Dict[str, str]]) -> None:
-    """Ensure the first history entry is the system prompt.
+def _checkout_history(user_id: str) -> List[Dict[str, Any]]:
+    """Return the user's history, starting new ones with the system prompt.
 
-    Both chat-driven and direct tool flows expect the same leading
-    system message; centralize this check so behavior stays aligned.
+    Both chat-driven and direct tool flows expect the same leading system
+    message. Trimming and summarizing never touch index 0, so it is only
+    installed when the history is created rather than checked every turn.
     """
-
-    if not history or history[0].get("role") != "system":
-        history.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
+    history = user_histories.checkout(user_id)
+    if not history:
+        history.append(_SYSTEM_MESSAGE)
+    return history
 
 
 def _trim_history(history: List[Dict[str, str]]) -> None:
     """Trim conversation history to a bounded length while preserving system prompt.
 
     Keeps the first entry (typically the system prompt) and the most recent
-    MAX_HISTORY_LENGTH-1 messages.
+    turns. Once over MAX_HISTORY_LENGTH, up to HISTORY_TRIM_SLACK extra entries
+    are dropped so the following turns append without trimming, but never from
+    the last HISTORY_TAIL_TOKENS of the conversation. The cut is moved to the
+    start of a user turn and the dropped span is replaced in place by a single
+    summary message.
     """
     if len(history) <= MAX_HISTORY_LENGTH:
         return
 
-    system = history[0:1]
-    recent = history[-(MAX_HISTORY_LENGTH - 1) :]
-    history[:] = system + recent
+    # one slot is taken back by the summary message
+    required = len(history) - MAX_HISTORY_LENGTH + 2
+    cut = max(required, min(required + HISTORY_TRIM_SLACK, _hot_tail_start(history)))
+    cut = _user_turn_start(history, cut)
+
+    # Read the dropped span in place; the slice assignment is the only move.
+    history[1:cut] = [_summarize_turns(islice(history, 1, cut))]
+
+
+def _approx_tokens(message: Dict[str, Any]) -> int:
+    return len(str(message.get("content") or "")) // 4
+
+
+def _user_turn_start(history: List[Dict[str, Any]], index: int) -> int:
+    """Return the first user message at or after index (or index if none)."""
+    for position in range(index, len(history)):
+        if history[position].get("role") == "user":
+            return position
+    return index
+
+
+def _hot_tail_start(history: List[Dict[str, Any]]) -> int:
+    """Return the user turn where the last HISTORY_TAIL_TOKENS tokens begin."""
+    budget = HISTORY_TAIL_TOKENS
+    for index in range(len(history) - 1, 0, -1):
+        message = history[index]
+        budget -= _approx_tokens(message)
+        if budget <= 0 and message.get("role") == "user":
+            return index
+    return 1
+
+
+def _summarize_turns(messages: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+    """Fold dropped messages into one system message listing the user's asks.
+
+    Built locally rather than with tldr_tool_output, so trimming never waits
+    on an extra model call in the middle of a turn.
+    """
+    lines: List[str] = []
+    for message in messages:
+        content = str(message.get("content") or "")
+        if message.get("role") == "system" and content.startswith(SUMMARY_MARKER):
+            lines.extend(content.splitlines()[1:])
+        elif message.get("role") == "user" and content.strip():
+            first_line = content.strip().partition("\n")[0].rstrip()
+            lines.append("- " + first_line[:SUMMARY_LINE_CHARS])
+
+    body = "\n".join([SUMMARY_MARKER, *lines[-SUMMARY_MAX_LINES:]])
+    return {"role": "system", "content": body}
+
+
+def _compact_for_llm(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return a lighter copy of history to send to the model.
+
+    Only the latest KEEP_RECENT_TOOL_RESULTS tool outputs are sent verbatim,
+    and messages older than the last KEEP_RECENT_TURNS user turns are clipped
+    to a short preview. Every message keeps its role so the sequence stays valid.
+    """
+    tool_budget = KEEP_RECENT_TOOL_RESULTS
+    turns_seen = 0
+    compacted: List[Dict[str, Any]] = []
+
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        role = message.get("role")
+        content = message.get("content") or ""
+
+        if role == "system":
+            compacted.append(message)
+            continue
+
+        if role == "tool":
+            if tool_budget > 0:
+                tool_budget -= 1
+            else:
+                message = {**message, "content": EVICTED_TOOL_OUTPUT}
+        elif turns_seen >= KEEP_RECENT_TURNS and len(content) > ARCHIVED_PREVIEW_CHARS:
+            message = {
+                **message,
+                "content": content[:ARCHIVED_PREVIEW_CHARS] + "... [archived]",
+            }
+
+        if role == "user":
+            turns_seen += 1
+        compacted.append(message)
+
+    compacted.reverse()
+    return compacted
 
 
 def run_tool_direct(
@@ -846,12 +1462,11 @@ def run_tool_direct(
     tool_identifier, entry = resolved
 
     user_id = _get_or_create_user_id()
-    history = user_histories.setdefault(user_id, [])
-    _ensure_system_prompt(history)
+    history = _checkout_history(user_id)
     _record_event(
         "tool_request",
         f"Direct tool request: {tool_identifier}",
-        {"parameters": _stringify_data(parameters)},
+        {"parameters": parameters},
     )
     history.append(
         {
@@ -890,12 +1505,11 @@ async def run_tool_direct_async(
     tool_identifier, entry = resolved
 
     user_id = _get_or_create_user_id()
-    history = user_histories.setdefault(user_id, [])
-    _ensure_system_prompt(history)
+    history = _checkout_history(user_id)
     _record_event(
         "tool_request",
         f"Direct tool request: {tool_identifier}",
-        {"parameters": _stringify_data(parameters)},
+        {"parameters": parameters},
     )
     history.append(
         {
@@ -922,33 +1536,12 @@ async def run_tool_direct_async(
 def _resolve_tool_entry(
     tool_identifier: str,
 ) -> Optional[Tuple[str, Dict[str, Any]]]:
-    identifier_lower = tool_identifier.lower()
-
-    entry = available_functions.get(tool_identifier)
+    tools = get_available_functions()
+    entry = tools.get(tool_identifier)
     if entry:
         return tool_identifier, entry
 
-    for key, candidate in available_functions.items():
-        candidate_name = candidate.get("name", "")
-        candidate_name_lower = candidate_name.lower() if candidate_name else ""
-        function_name = candidate.get("function").__name__
-        function_name_lower = function_name.lower()
-        trigger_matches = any(
-            isinstance(trigger, str) and trigger.lower() == identifier_lower
-            for trigger in candidate.get("triggers", [])
-        )
-
-        if (
-            identifier_lower
-            in (
-                candidate_name_lower,
-                function_name_lower,
-            )
-            or trigger_matches
-        ):
-            return key, candidate
-
-    return None
+    return _tool_aliases.get(tool_identifier.lower())
 
 
 def resolve_tool_identifier(
@@ -968,6 +1561,12 @@ def get_last_command_translation_error() -> Optional[str]:
     return _last_command_translation_error
 
 
+_QUOTES = ('"', "'")
+# Numbering, bullets or a shell prompt in front of a suggested command.
+_LIST_MARKER = re.compile(r"^(?:[-*•]\s+|\d+[.)]\s+|\$\s+)")
+_SPLIT_CMD = re.compile(r"[;&|]")
+
+
 def _maybe_fix_unclosed_quotes(command: str) -> Optional[str]:
     """Best-effort fix for commands that only fail due to an unclosed quote.
 
@@ -977,20 +1576,73 @@ def _maybe_fix_unclosed_quotes(command: str) -> Optional[str]:
     """
 
     text = command or ""
-    for quote in ('"', "'"):
-        if text.count(quote) % 2 == 1:
+    if not text:
+        return None
+    # str.count scans in C, far faster than one Python-level pass over both
+    # quote types; the second scan only runs when double quotes are balanced.
+    for quote in _QUOTES:
+        if text.count(quote) & 1:
             return text + quote
     return None
 
 
+def _cached_translation(
+    key: Tuple[str, str, str],
+) -> Optional[Tuple[str, Optional[str]]]:
+    if not TRANSLATION_CACHE_ENABLED:
+        return None
+    with _translation_cache_lock:
+        entry = _translation_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, result, note = entry
+        if expires_at < time.monotonic():
+            del _translation_cache[key]
+            return None
+        _translation_cache.move_to_end(key)
+        return result, note
+
+
+def _store_translation(
+    key: Tuple[str, str, str], result: str, note: Optional[str] = None
+) -> None:
+    if not TRANSLATION_CACHE_ENABLED:
+        return
+    with _translation_cache_lock:
+        _translation_cache[key] = (time.monotonic() + TRANSLATION_CACHE_TTL, result, note)
+        _translation_cache.move_to_end(key)
+        while len(_translation_cache) > TRANSLATION_CACHE_SIZE:
+            _translation_cache.popitem(last=False)
+
+
+def clear_translation_cache() -> None:
+    with _translation_cache_lock:
+        _translation_cache.clear()
+
+
 def translate_instruction_to_command(instruction: str) -> Optional[str]:
     instruction = (instruction or "").strip()
     if not instruction:
         _set_last_command_translation_error("instruction was empty")
         return None
 
+    key = ("command", MODEL_NAME, instruction)
+    cached = _cached_translation(key)
+    if cached is not None:
+        command, note = cached
+        _set_last_command_translation_error(note)
+        return command
+
+    # Failures are not cached, so a retry after a transient error asks again.
+    command = _translate_instruction_to_command(instruction)
+    if command is not None:
+        _store_translation(key, command, get_last_command_translation_error())
+    return command
+
+
+def _translate_instruction_to_command(instruction: str) -> Optional[str]:
     _set_last_command_translation_error(None)
-    _debug("command_translation_input", {"instruction": instruction})
+    _debug("command_translation_input", lambda: {"instruction": instruction})
 
     direct = detect_direct_command(instruction)
     if direct:
@@ -1005,7 +1657,7 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
     _debug("command_translation_request", messages)
 
     try:
-        response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+        response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
         command = (response.message.content or "").strip()
         _debug("command_translation_response", command)
 
@@ -1013,12 +1665,12 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
             command = command.split(":", 1)[1].strip()
 
         if "\n" in command:
-            command = command.splitlines()[0].strip()
+            command = command.partition("\n")[0].strip()
 
         if command.upper() == "NONE":
             _debug(
                 "command_translation_none",
-                {"instruction": instruction, "reason": "model_returned_NONE"},
+                lambda: {"instruction": instruction, "reason": "model_returned_NONE"},
             )
             _set_last_command_translation_error(
                 "model explicitly replied with NONE (no safe command)"
@@ -1041,14 +1693,14 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
                     _set_last_command_translation_error(None)
                     return fixed_sanitized
 
-        segments = re.split(r"[;&|]", command, maxsplit=1)
+        segments = _SPLIT_CMD.split(command, maxsplit=1)
         leading = segments[0].strip() if segments else ""
         if leading and leading != command:
             fallback = sanitize_command(leading)
             if fallback:
                 _debug(
                     "command_translation_sanitized_fallback",
-                    {
+                    lambda: {
                         "instruction": instruction,
                         "raw_command": command,
                         "fallback_command": fallback,
@@ -1065,7 +1717,7 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
         )
         _debug(
             "command_translation_rejected",
-            {
+            lambda: {
                 "instruction": instruction,
                 "raw_command": command,
                 "reason": sanitize_reason,
@@ -1079,11 +1731,78 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
         return None
 
 
+def translate_instruction_to_commands(instruction: str, n: int = 3) -> List[str]:
+    """Ask the model once for up to n alternative commands, best first.
+
+    Every suggestion goes through sanitize_command; rejected and duplicate
+    lines are dropped. Returns an empty list when nothing usable comes back.
+    """
+    instruction = (instruction or "").strip()
+    if not instruction or n <= 0:
+        return []
+
+    messages = [
+        {"role": "system", "content": COMMAND_TRANSLATOR_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"{instruction}\n\n{COMMAND_ALTERNATIVES_PROMPT.format(count=n)}",
+        },
+    ]
+    _debug("command_alternatives_request", messages)
+
+    try:
+        response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
+    except Exception as err:
+        logger.error(f"Unable to translate instruction to commands: {err}")
+        return []
+
+    commands: List[str] = []
+    for line in (response.message.content or "").splitlines():
+        line = _LIST_MARKER.sub("", line.strip())
+        if not line or line.startswith("```"):
+            continue
+        command = sanitize_command(line)
+        if command and command not in commands:
+            commands.append(command)
+            if len(commands) == n:
+                break
+    _debug("command_alternatives", commands)
+    return commands
+
+
+def _next_candidate(candidates: List[str], failed_command: Optional[str]) -> Optional[str]:
+    """Pop the next suggestion that differs from the command that just failed."""
+    while candidates:
+        command = candidates.pop(0)
+        if command != failed_command:
+            return command
+    return None
+
+
 def translate_instruction_to_query(instruction: str) -> Optional[str]:
     instruction = (instruction or "").strip()
     if not instruction:
         return None
 
+    # A bare URL is already a usable query.
+    if instruction.startswith(("http://", "https://")) and not any(
+        char.isspace() for char in instruction
+    ):
+        return instruction
+
+    # Search queries are case-insensitive, unlike paths in shell commands.
+    key = ("query", MODEL_NAME, instruction.lower())
+    cached = _cached_translation(key)
+    if cached is not None:
+        return cached[0]
+
+    query = _translate_instruction_to_query(instruction)
+    if query:
+        _store_translation(key, query)
+    return query
+
+
+def _translate_instruction_to_query(instruction: str) -> Optional[str]:
     messages = [
         {"role": "system", "content": QUERY_TRANSLATOR_SYSTEM_PROMPT},
         {"role": "user", "content": instruction},
@@ -1092,12 +1811,12 @@ def translate_instruction_to_query(instruction: str) -> Optional[str]:
     _debug("query_translation_request", messages)
 
     try:
-        response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+        response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
         query = (response.message.content or "").strip()
         _debug("query_translation_response", query)
 
         if "\n" in query:
-            query = query.splitlines()[0].strip()
+            query = query.partition("\n")[0].strip()
 
         if query.upper() == "NONE":
             return None
@@ -1114,20 +1833,65 @@ def translate_instruction_to_query(instruction: str) -> Optional[str]:
         return None
 
 
-def get_recent_history(limit: int = 15) -> List[Dict[str, Any]]:
+def get_recent_history(
+    limit: int = 15, user_id: Any = None
+) -> List[Dict[str, Any]]:
+    bind_user(user_id)
     user_id = _get_or_create_user_id()
     history = user_histories.get(user_id, [])
-    _debug("history_snapshot", {"user_id": user_id, "limit": limit, "history": history})
+    _debug(
+        "history_snapshot",
+        lambda: {"user_id": user_id, "limit": limit, "history": history},
+    )
     if limit <= 0:
         return history
     return history[-limit:]
 
 
 def get_recent_events(limit: int = 20) -> List[Dict[str, Any]]:
-    _debug("event_log_snapshot", {"limit": limit, "events": list(_event_log)})
+    _debug("event_log_snapshot", lambda: {"limit": limit, "events": list(_event_log)})
     if limit <= 0:
-        return list(_event_log)
-    return list(_event_log)[-limit:]
+        events = list(_event_log)
+    else:
+        # Walk back from the newest entry so only `limit` events are touched.
+        events = list(islice(reversed(_event_log), limit))
+        events.reverse()
+    # Timestamps and extras are stored raw and only formatted when someone reads them.
+    return [_formatted_event(event) for event in events]
+
+
+def _formatted_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    if "extra" in event:
+        _freeze_event_extra(event)
+    return {**event, "time": _format_event_time(event["ts"])}
+
+
+def _freeze_event_extra(event: Dict[str, Any]) -> Dict[str, str]:
+    """Store an event's extras as text the first time they are formatted.
+
+    The raw values are private copies that never change, so only the first
+    reader pays for _stringify_data; formatting text again is a no-op.
+    """
+    extra = event["extra"] = _format_event_extra(event["extra"])
+    return extra
+
+
+def _format_event_extra(extra: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        key: _truncate_event_text(
+            value if isinstance(value, str) else _stringify_data(value)
+        )
+        for key, value in extra.items()
+    }
+
+
+@lru_cache(maxsize=64)
+def _format_event_second(seconds: int) -> str:
+    return time.strftime("%H:%M:%S", time.gmtime(seconds))
+
+
+def _format_event_time(ts_ns: int) -> str:
+    return _format_event_second(ts_ns // 1_000_000_000)
 
 
 def _record_event(
@@ -1136,60 +1900,105 @@ def _record_event(
     extra: Optional[Dict[str, Any]] = None,
     user_id: Optional[str] = None,
 ) -> None:
+    # A fresh dict per event: readers may still hold the one the log evicts.
     entry: Dict[str, Any] = {
-        "time": datetime.now(UTC).strftime("%H:%M:%S"),
+        "ts": time.time_ns(),
         "kind": kind,
         "message": _truncate_event_text(message),
     }
 
     if extra:
+        # Dict values (tool arguments) are copied so later edits don't leak in.
         entry["extra"] = {
-            key: _truncate_event_text(str(value)) for key, value in extra.items()
+            key: dict(value) if isinstance(value, dict) else value
+            for key, value in extra.items()
         }
 
     if user_id:
         entry["user_id"] = user_id
 
     _event_log.append(entry)
-    if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
+    if _DEBUG_ON and logger.isEnabledFor(logging.INFO):
         extra_txt = (
-            " " + " ".join(f"{k}={v}" for k, v in entry.get("extra", {}).items())
-            if entry.get("extra")
+            " "
+            + " ".join(
+                f"{k}={v}" for k, v in _freeze_event_extra(entry).items()
+            )
+            if "extra" in entry
             else ""
         )
         user_info = f" (user: {user_id})" if user_id else ""
         logger.info(
-            f"[event] {entry['time']} {kind}: {entry['message']}{extra_txt}{user_info}"
+            f"[event] {_format_event_time(entry['ts'])} {kind}: "
+            f"{entry['message']}{extra_txt}{user_info}"
         )
 
 
+_LEADING_SPACE = re.compile(r"\s*")
+_NON_SPACE = re.compile(r"\S")
+
+
 def _truncate_event_text(text: str) -> str:
-    text = (text or "").strip()
-    if len(text) <= MAX_EVENT_TEXT:
+    if not text:
+        return ""
+    # Most events are short and already trimmed; return them without copying.
+    if len(text) <= MAX_EVENT_TEXT and not (text[0].isspace() or text[-1].isspace()):
         return text
-    return text[: MAX_EVENT_TEXT - 3] + "..."
+    # Find the cut on the raw text so a long message is copied only up to it.
+    start = _LEADING_SPACE.match(text).end()
+    if _NON_SPACE.search(text, start + MAX_EVENT_TEXT):
+        return _bounded(text[start : start + MAX_EVENT_TEXT + 1], MAX_EVENT_TEXT)
+    return text[start:].rstrip()
+
+
+def _json_text(data: Any, indent: bool = False) -> str:
+    """Serialize with sorted keys, using orjson when it is installed.
+
+    orjson.JSONEncodeError subclasses TypeError, so callers catch one set of errors.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option).decode()
+    return json.dumps(data, sort_keys=True, indent=2 if indent else None)
 
 
 def _stringify_data(data: Any) -> str:
     try:
-        return json.dumps(data, sort_keys=True)
+        return _json_text(data)
     except (TypeError, ValueError):
         return str(data)
 
 
-def clear_history():
+def unload_model() -> None:
+    """Ask the server to unload MODEL_NAME now instead of after KEEP_ALIVE."""
+    try:
+        _client.generate(model=MODEL_NAME, keep_alive=0)
+    except Exception as err:
+        logger.warning(f"Unable to unload Ollama model {MODEL_NAME}: {err}")
+
+
+def clear_history(user_id: Any = None):
+    bind_user(user_id)
     user_id = _get_or_create_user_id()
     user_histories.pop(user_id, None)
-    if hasattr(_thread_local, "last_tool_audio"):
-        delattr(_thread_local, "last_tool_audio")
+    _last_tool_audio_var.set(None)
+    clear_translation_cache()
+    # The model is shared by every user, so only free it once nobody is chatting.
+    if not user_histories:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            unload_model()
+        else:
+            _spawn(asyncio.to_thread(unload_model))
 
 
-def _set_last_tool_audio(payload: Dict[str, str]) -> None:
-    _thread_local.last_tool_audio = payload
+def _set_last_tool_audio(payload: Dict[str, Any]) -> None:
+    _last_tool_audio_var.set(payload)
 
 
-def pop_last_tool_audio() -> Optional[Dict[str, str]]:
-    payload = getattr(_thread_local, "last_tool_audio", None)
-    if hasattr(_thread_local, "last_tool_audio"):
-        delattr(_thread_local, "last_tool_audio")
+def pop_last_tool_audio() -> Optional[Dict[str, Any]]:
+    payload = _last_tool_audio_var.get()
+    if payload is not None:
+        _last_tool_audio_var.set(None)
     return payload
@@ -1,14 +1,17 @@
+import contextvars
 import json
 import os
 import re
-import threading
+import time
 import uuid
 from collections import deque
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
 from logging import DEBUG, Logger
 from typing import Any, Dict, List, Optional, Tuple
 
-from ollama import chat as _ollama_chat
+from ollama import chat
 
 from config import (
     DEBUG_HISTORY_STATE,
@@ -17,6 +20,7 @@ from config import (
     SYSTEM_PROMPT,
 )
 from services.ollama_shared import (
+    KEEP_ALIVE,
     MAX_HISTORY_LENGTH,
     MAX_TOOL_OUTPUT_IN_HISTORY,
     MODEL_NAME,
@@ -27,13 +31,14 @@ from utils.logger import GREEN, RST, debug_payload, logger
 EVENT_LOG_LIMIT = 200
 MAX_EVENT_TEXT = 400
 
-if hasattr(_ollama_chat, "chat"):
-    chat = _ollama_chat
-else:
-    chat = _ollama_chat
-
-# Internal global mapping of thread/session -> UUID
-_thread_local = threading.local()
+# Per-context user id and history. ContextVars follow asyncio tasks, where
+# threading.local would be shared by every task on the event loop thread.
+_user_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "ollama_core_user_id", default=None
+)
+_history_var: contextvars.ContextVar[Optional[List[Dict[str, str]]]] = (
+    contextvars.ContextVar("ollama_core_history", default=None)
+)
 
 # Maps uuid -> conversation history
 user_histories: Dict[str, List[Dict[str, str]]] = {}
@@ -49,54 +54,100 @@ _debug = (
 )
 
 
+_REDACTED_SYSTEM_MESSAGE = {"role": "system", "content": "<REDACTED_SYSTEM_PROMPT>"}
+# Shared by every history and one-off prompt; never mutate it in place.
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
 def _redact_system_content_in_messages(
     messages: List[Dict[str, str]],
 ) -> List[Dict[str, str]]:
-    """Return a copy of messages with system role content redacted for logging."""
-    sanitized: List[Dict[str, str]] = []
-    for m in messages:
-        if m.get("role") == "system":
-            sanitized.append({**m, "content": "<REDACTED_SYSTEM_PROMPT>"})
-        else:
-            sanitized.append(m)
-    return sanitized
+    """Return messages for logging with system entries swapped for a placeholder.
+
+    Other entries are the original dicts (not copies), so treat the result as read-only.
+    """
+    return [
+        _REDACTED_SYSTEM_MESSAGE if m.get("role") == "system" else m for m in messages
+    ]
 
 
 def _sanitize_payload(payload: Any) -> Any:
     """Sanitize common payload structures (e.g., dicts with a 'messages' key) to avoid logging system prompts."""
-    if isinstance(payload, dict):
-        p = dict(payload)
-        if "messages" in p and isinstance(p["messages"], list):
-            p["messages"] = _redact_system_content_in_messages(p["messages"])
+    if isinstance(payload, dict) and isinstance(payload.get("messages"), list):
+        return {
+            **payload,
+            "messages": _redact_system_content_in_messages(payload["messages"]),
+        }
     return payload
 
 
 def generate_simple_response(prompt: str) -> str:
     """Generate a simple response without history or tools."""
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+        _SYSTEM_MESSAGE,
         {"role": "user", "content": prompt},
     ]
-    response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+    response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
     return response.message.content or ""
 
 
 def _get_or_create_user_id() -> str:
-    if not hasattr(_thread_local, "user_id"):
-        _thread_local.user_id = str(uuid.uuid4())
-    return _thread_local.user_id
+    user_id = _user_id_var.get()
+    if user_id is None:
+        user_id = str(uuid.uuid4())
+        _user_id_var.set(user_id)
+    return user_id
+
+
+def _get_history() -> List[Dict[str, str]]:
+    """Return this context's history, registering it in user_histories once.
+
+    Later turns read it straight off the context var instead of looking the
+    uuid up again; user_histories stays the shared view for snapshots.
+    """
+    history = _history_var.get()
+    if history is None:
+        history = user_histories.setdefault(_get_or_create_user_id(), [])
+        # The system prompt stays at index 0, so install it once per history.
+        _ensure_system_prompt(history)
+        _history_var.set(history)
+    return history
 
 
 def _ensure_system_prompt(history: List[Dict[str, str]]) -> None:
     if not history or history[0].get("role") != "system":
-        history.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
+        history.insert(0, _SYSTEM_MESSAGE)
 
 
 def _trim_history(history: List[Dict[str, str]]) -> None:
     total_length = sum(len(entry.get("content", "")) for entry in history)
-    while total_length > MAX_HISTORY_LENGTH and len(history) > 1:
-        removed = history.pop(1)  # Keep system prompt
-        total_length -= len(removed.get("content", ""))
+    if total_length <= MAX_HISTORY_LENGTH:
+        return
+    # Find how many of the oldest turns must go, then drop them in one slice
+    # instead of shifting the list once per pop(1). The system prompt stays.
+    cut = 1
+    while total_length > MAX_HISTORY_LENGTH and cut < len(history):
+        total_length -= len(history[cut].get("content", ""))
+        cut += 1
+    del history[1:cut]
+
+
+@lru_cache(maxsize=64)
+def _tool_defs_for(names: Tuple[str, ...]) -> Tuple[Dict[str, Any], ...]:
+    """Build the chat tool schemas once per tool set; the registry is static."""
+    from services.ollama_tools import available_functions
+
+    return tuple(
+        {
+            "type": "function",
+            "function": {
+                "name": entry["name"],
+                "description": entry.get("description", ""),
+                "parameters": entry.get("parameters", {}),
+            },
+        }
+        for entry in (available_functions[name] for name in names)
+    )
 
 
 def generate_content(prompt: str) -> str | tuple[str, str | None]:
@@ -107,9 +158,7 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
     )
 
     user_id = _get_or_create_user_id()
-    history = user_histories.setdefault(user_id, [])
-
-    _ensure_system_prompt(history)
+    history = _get_history()
 
     # Add user message
     history.append({"role": "user", "content": prompt})
@@ -118,7 +167,7 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
     if DEBUG_HISTORY_STATE:
         _debug(
             "history_after_user",
-            {
+            lambda: {
                 "user_id": user_id,
                 "entries": _redact_system_content_in_messages(history),
             },
@@ -128,7 +177,7 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
         use_tools, matched_tools = evaluate_tool_usage(prompt)
         _debug(
             "tool_evaluation",
-            {
+            lambda: {
                 "prompt": prompt,
                 "use_tools": use_tools,
                 "matched_tools": list(matched_tools.keys()),
@@ -138,32 +187,21 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
 
         _debug(
             "chat_request",
-            {
+            lambda: {
                 "messages": _redact_system_content_in_messages(messages),
             },
         )
 
-        tool_pool = matched_tools if matched_tools else available_functions
         tool_defs = (
-            [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": entry["name"],
-                        "description": entry.get("description", ""),
-                        "parameters": entry.get("parameters", {}),
-                    },
-                }
-                for entry in tool_pool.values()
-            ]
+            _tool_defs_for(tuple(matched_tools or available_functions))
             if use_tools
-            else []
+            else ()
         )
 
         response = chat(
             model=MODEL_NAME,
             messages=messages,
-            keep_alive=0,
+            keep_alive=KEEP_ALIVE,
             tools=tool_defs,
         )
         response_message_content = None
@@ -171,34 +209,32 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
             response_message_content = getattr(response.message, "content", None)
         except Exception:
             response_message_content = None
-        log_payload: Dict[str, Any] = {}
         if response_message_content is not None:
-            log_payload["message_content"] = response_message_content
-        if log_payload:
-            _debug("chat_response", log_payload)
+            _debug(
+                "chat_response",
+                lambda: {"message_content": response_message_content},
+            )
 
-        if response.message.tool_calls:
+        tool_calls = response.message.tool_calls
+        if tool_calls:
             assistant_message = {
                 "role": "assistant",
-                "content": response.message.content or "",
+                "content": response_message_content or "",
                 "tool_calls": [
                     call.model_dump() if hasattr(call, "model_dump") else call
-                    for call in response.message.tool_calls
+                    for call in tool_calls
                 ],
             }
             history.append(assistant_message)
-            _debug(
-                "tool_calls",
-                [call.function.name for call in response.message.tool_calls],
-            )
-            for tool in response.message.tool_calls:
+            _debug("tool_calls", lambda: [call.function.name for call in tool_calls])
+            for tool in tool_calls:
                 func_entry = available_functions.get(tool.function.name)
                 if func_entry and (
                     not matched_tools or tool.function.name in matched_tools
                 ):
                     _debug(
                         "executing_tool",
-                        {
+                        lambda: {
                             "tool": tool.function.name,
                             "arguments": tool.function.arguments,
                         },
@@ -228,7 +264,7 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
             except Exception as e:
                 _debug(
                     "json_load_failed",
-                    {"error": str(e), "parameters_str": parameters_str},
+                    lambda: {"error": str(e), "parameters_str": parameters_str},
                 )
                 parameters = {}
             from services.ollama_tools import run_tool_direct
@@ -240,7 +276,7 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
                 _record_event("assistant", str(tool_output))
                 _debug(
                     "assistant_reply_from_tool",
-                    {
+                    lambda: {
                         "user_id": user_id,
                         "tool_output": tool_output,
                         "history_size": len(history),
@@ -256,7 +292,7 @@ def generate_content(prompt: str) -> str | tuple[str, str | None]:
         _record_event("assistant", reply)
         _debug(
             "assistant_reply",
-            {
+            lambda: {
                 "user_id": user_id,
                 "reply": reply,
                 "history_size": len(history),
@@ -278,7 +314,7 @@ def _record_event(
     user_id: Optional[str] = None,
 ) -> None:
     event = {
-        "timestamp": datetime.now().isoformat(),
+        "ts": time.time_ns(),
         "kind": kind,
         "message": _truncate_event_text(message),
         "user_id": user_id,
@@ -295,16 +331,25 @@ def _truncate_event_text(text: str) -> str:
 
 
 def get_recent_events(limit: int = 20) -> List[Dict[str, Any]]:
-    return list(_event_log)[-limit:]
+    if limit <= 0:
+        events = list(_event_log)
+    else:
+        # Walk back from the newest entry so only `limit` events are touched.
+        events = list(islice(reversed(_event_log), limit))
+        events.reverse()
+    # Timestamps are stored raw and only formatted when someone reads them.
+    return [
+        {**event, "timestamp": datetime.fromtimestamp(event["ts"] / 1e9).isoformat()}
+        for event in events
+    ]
 
 
 def get_recent_history(limit: int = 15) -> List[Dict[str, Any]]:
-    user_id = _get_or_create_user_id()
-    history = user_histories.get(user_id, [])
+    history = _history_var.get() or []
     return history[-limit:]
 
 
 def clear_history() -> None:
     user_id = _get_or_create_user_id()
-    if user_id in user_histories:
-        del user_histories[user_id]
+    user_histories.pop(user_id, None)
+    _history_var.set(None)
@@ -3,13 +3,20 @@
 Keep only small, import-safe values here (no heavy runtime imports).
 """
 
+import os
+
 from utils.tool_directives import ALLOWED_SHELL_CMDS
 
 
 MODEL_NAME = "llama3.2"
+# How long the server keeps the model loaded after a request (Ollama duration
+# string). "0" unloads it after every call.
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "5m")
 
 MAX_HISTORY_LENGTH = 400
 MAX_TOOL_OUTPUT_IN_HISTORY = 1000
+# Tool outputs at most this long (stripped) are used as their own TLDR.
+TLDR_MIN_CHARS = max(0, int(os.getenv("OLLAMA_TLDR_MIN_CHARS") or "200"))
 
 CONTENT_REPORTER_SCRIPT_PROMPT = (
     "Rewrite that summary into two energetic, fast-paced sentences that stay factually accurate,"
@@ -38,6 +45,12 @@ COMMAND_TRANSLATOR_SYSTEM_PROMPT = (
     f"allowed commands: {ALLOWED_SHELL_CMDS}"
 )
 
+COMMAND_ALTERNATIVES_PROMPT = (
+    "Instead of a single command, list up to {count} different commands that"
+    " would each fulfil the request, best first, one per line."
+    " No numbering, commentary or blank lines."
+)
+
 QUERY_TRANSLATOR_SYSTEM_PROMPT = (
     "You receive a user follow-up or instruction plus optional context."
     " Rewrite it into a single concise web search query that will retrieve the requested information."
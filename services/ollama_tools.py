@@ -1,21 +1,35 @@
 import json
 import re
 import shlex
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 
-from config import DEBUG_OLLAMA, DEBUG_TOOL_DIRECTIVES
+from config import DEBUG_OLLAMA, DEBUG_TOOL_DIRECTIVES, SYSTEM_PROMPT
+from services import ollama_translation
+from services.ollama_core import _record_event
 from services.ollama_shared import (
     CONTENT_REPORTER_SCRIPT_PROMPT,
+    KEEP_ALIVE,
     MAX_TOOL_OUTPUT_IN_HISTORY,
+    TLDR_MIN_CHARS,
 )
 from tools import load_tools
 from tools.cheat import fetch_cheat
-from utils.logger import GREEN, RST, logger
+from utils.logger import GREEN, RST, debug_payload, logger
 
 
-def _debug(*args, **kwargs):
-    if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
-        logger.debug(*args, **kwargs)
+_debug = (
+    lambda *args, **kwargs: debug_payload(*args, **kwargs)
+    if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES
+    else None
+)
+
+
+def _bounded(text: str, limit: int, note: str = "...") -> str:
+    """Return text capped at limit characters, note included, in one slice."""
+    if len(text) <= limit:
+        return text
+    return text[: limit - len(note)] + note
 
 
 available_functions = load_tools()
@@ -28,6 +42,41 @@ if DEBUG_OLLAMA:
 TOOL_MODE = True
 
 
+def _compile_triggers(triggers: List[str]) -> re.Pattern:
+    """Match any trigger as a whole word at the start of the lowercased prompt."""
+    alternatives = "|".join(re.escape(trigger.lower()) for trigger in triggers)
+    return re.compile(r"\b(?:" + alternatives + r")\b")
+
+
+# One compiled trigger alternation per tool, built once for the static registry.
+_tool_triggers = tuple(
+    (name, _compile_triggers(entry["triggers"]))
+    for name, entry in available_functions.items()
+    if entry.get("triggers")
+)
+
+
+def _build_tool_aliases(
+    tools: Dict[str, Dict[str, Any]],
+) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    # The first tool to claim an alias keeps it.
+    aliases: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    for name, entry in tools.items():
+        for alias in entry.get("aliases", []):
+            aliases.setdefault(alias, (name, entry))
+    return aliases
+
+
+_tool_aliases = _build_tool_aliases(available_functions)
+
+
+@lru_cache(maxsize=1024)
+def _match_tool_names(lower_prompt: str) -> Tuple[str, ...]:
+    return tuple(
+        name for name, pattern in _tool_triggers if pattern.match(lower_prompt)
+    )
+
+
 def evaluate_tool_usage(prompt: str) -> Tuple[bool, Dict[str, dict]]:
     assert isinstance(prompt, str)
     lower_prompt = prompt.lower()
@@ -44,12 +93,7 @@ def evaluate_tool_usage(prompt: str) -> Tuple[bool, Dict[str, dict]]:
             return True, {"shell_agent": shell_agent_entry}
 
     matched_tools = {
-        name: entry
-        for name, entry in available_functions.items()
-        if any(
-            re.match(r"\b" + re.escape(trigger) + r"\b", lower_prompt)
-            for trigger in entry.get("triggers", [])
-        )
+        name: available_functions[name] for name in _match_tool_names(lower_prompt)
     }
 
     should_use = bool(matched_tools) or TOOL_MODE
@@ -57,14 +101,24 @@ def evaluate_tool_usage(prompt: str) -> Tuple[bool, Dict[str, dict]]:
     return should_use, matched_tools
 
 
+# stderr phrases that mark a shell_agent attempt as failed even on exit code 0.
+_STDERR_ERROR_MARKERS = re.compile(
+    "unknown option|unrecognized option|invalid option|command not found"
+    "|permission denied|no such file or directory|cannot access|not found"
+    "|failed|error",
+    re.IGNORECASE,
+)
+
+# Shared by the one-off TLDR and audio script prompts; never mutate it in place.
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
 def tldr_tool_output(tool_name: str, output: str) -> str:
     from ollama import chat
 
-    from config import SYSTEM_PROMPT
-
     MODEL_NAME = "llama3.2"
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+        _SYSTEM_MESSAGE,
         {
             "role": "assistant",
             "content": f"Tool {tool_name} returned the following data:\n{output}",
@@ -74,7 +128,7 @@ def tldr_tool_output(tool_name: str, output: str) -> str:
             "content": "Summarize the key points in no more than three sentences.",
         },
     ]
-    response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+    response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
 
     return response.message.content or "No summary available"
 
@@ -82,12 +136,10 @@ def tldr_tool_output(tool_name: str, output: str) -> str:
 def build_audio_script(summary_text: str) -> Optional[str]:
     from ollama import chat
 
-    from config import SYSTEM_PROMPT
-
     MODEL_NAME = "llama3.2"
     try:
         messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
+            _SYSTEM_MESSAGE,
             {
                 "role": "assistant",
                 "content": f"Here is the summary you produced earlier: {summary_text}",
@@ -98,12 +150,10 @@ def build_audio_script(summary_text: str) -> Optional[str]:
             },
         ]
 
-        response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+        response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
         return response.message.content.strip()
 
     except Exception as err:
-        from utils.logger import logger
-
         logger.error(f"Error generating audio script: {err}")
         return None
 
@@ -115,11 +165,9 @@ def call_tool_with_tldr(
     tldr_separate: bool = False,
     **arguments,
 ) -> str | tuple[str, str | None]:
-    from services.ollama_core import _record_event
-    from services.ollama_translation import (
-        translate_instruction_to_command,
-        translate_instruction_to_query,
-    )
+    # Looked up on the module per call so tests can patch the translators.
+    translate_instruction_to_command = ollama_translation.translate_instruction_to_command
+    translate_instruction_to_query = ollama_translation.translate_instruction_to_query
 
     working_arguments = dict(arguments)
 
@@ -165,25 +213,9 @@ def call_tool_with_tldr(
                 has_error = exit_code not in (0, None)
                 if has_error:
                     logger.info(f"shell_agent: exit code {exit_code} (failure), stderr: {stderr}")
-                lower_err = stderr.lower()
                 if not has_error and stderr:
-                    for marker in (
-                        "unknown option",
-                        "unrecognized option",
-                        "invalid option",
-                        "command not found",
-                        "permission denied",
-                        "no such file or directory",
-                        "cannot access",
-                        "not found",
-                        "no such file or directory",
-                        "failed",
-                        "error",
-                    ):
-                        if marker in lower_err:
-                            has_error = True
-                            break
-                if not has_error and exit_code == 0 and not stdout.strip():
+                    has_error = bool(_STDERR_ERROR_MARKERS.search(stderr))
+                if not has_error and exit_code == 0 and not stdout:
                     logger.info("shell_agent: exit 0 but no output, treating as failure to trigger retry/fallback")
                     has_error = True
             if not has_error:
@@ -263,7 +295,7 @@ def call_tool_with_tldr(
     raw_text = _format_tool_output(tool_name, raw_output)
     _debug(
         "tool_raw_output",
-        {
+        lambda: {
             "tool": tool_name,
             "arguments": working_arguments,
             "raw_output": raw_output,
@@ -271,9 +303,7 @@ def call_tool_with_tldr(
     )
 
     # Truncate tool output for history to keep it manageable
-    truncated_text = raw_text[:MAX_TOOL_OUTPUT_IN_HISTORY] + (
-        "..." if len(raw_text) > MAX_TOOL_OUTPUT_IN_HISTORY else ""
-    )
+    truncated_text = _bounded(raw_text, MAX_TOOL_OUTPUT_IN_HISTORY)
 
     history.append({"role": "tool", "name": tool_name, "content": truncated_text})
 
@@ -284,7 +314,7 @@ def call_tool_with_tldr(
             "arguments": _stringify_data(working_arguments)
             if working_arguments
             else "{}",
-            "output": raw_text,
+            "output": truncated_text,
         },
     )
 
@@ -295,34 +325,43 @@ def call_tool_with_tldr(
             )
         return raw_text if not tldr_separate else (raw_text, None)
 
-    summary = None
-    try:
-        summary = tldr_tool_output(tool_name, raw_text)
-    except Exception as err:
-        logger.error(f"Error generating TLDR for tool {tool_name}: {err}")
+    # Short outputs are their own summary; skip the TLDR model call for them.
+    short_text = raw_text.strip()
+    is_short = len(short_text) <= TLDR_MIN_CHARS
+    summary = short_text if is_short else None
+    if not is_short:
+        try:
+            summary = tldr_tool_output(tool_name, raw_text)
+        except Exception as err:
+            logger.error(f"Error generating TLDR for tool {tool_name}: {err}")
 
     if summary:
         summary_text = summary
         if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
-            logger.info(f"TLDR ready for {tool_name}: {summary_text}")
+            logger.info("TLDR ready for %s: %s", tool_name, summary_text)
         _record_event("tldr", f"{tool_name}: {summary_text}")
         _debug(
             "tldr_summary",
-            {
+            lambda: {
                 "tool": tool_name,
                 "summary": summary_text,
             },
         )
-        history.append(
-            {
-                "role": "assistant",
-                "content": f"TLDR (from {tool_name}): {summary_text}",
-            }
-        )
+        if not is_short:
+            history.append(
+                {
+                    "role": "assistant",
+                    "content": f"TLDR (from {tool_name}): {summary_text}",
+                }
+            )
         try:
-            audio_script = build_audio_script(summary_text) or summary_text
+            # Only the separate-TLDR callers voice short outputs as a script.
+            if is_short and not tldr_separate:
+                audio_script = summary_text
+            else:
+                audio_script = build_audio_script(summary_text) or summary_text
             if DEBUG_OLLAMA or DEBUG_TOOL_DIRECTIVES:
-                logger.info(f"Queued TLDR audio script for {tool_name}: {audio_script}")
+                logger.info("Queued TLDR audio script for %s: %s", tool_name, audio_script)
             _set_last_tool_audio(
                 {
                     "summary": summary_text,
@@ -333,7 +372,7 @@ def call_tool_with_tldr(
             _record_event("audio_queue", f"Queued TLDR audio for {tool_name}")
             _debug(
                 "audio_queue_payload",
-                {
+                lambda: {
                     "tool": tool_name,
                     "audio_script": audio_script,
                 },
@@ -345,26 +384,31 @@ def call_tool_with_tldr(
 
         if tldr_separate:
             return raw_text, summary_text
+        elif is_short:
+            return raw_text
         else:
             return f"{raw_text}\n\nTLDR: {summary_text}"
 
     return raw_text if not tldr_separate else (raw_text, None)
 
 
+_FRIENDLY_SHELL_ERRORS = (
+    "All attempts to generate a valid command failed",
+    "All attempts produced no output.",
+)
+
+
 def _format_tool_output(tool_name: str, raw_output: Any) -> str:
     if tool_name == "shell_agent":
         if isinstance(raw_output, dict):
+            stderr = raw_output.get("stderr", "")
             # If this is the user-friendly error, suppress command details
-            if (
-                raw_output.get("stderr", "").startswith("All attempts to generate a valid command failed")
-                or raw_output.get("stderr", "").startswith("All attempts produced no output.")
-            ):
-                return raw_output.get("stderr", "Unknown error")
+            if stderr.startswith(_FRIENDLY_SHELL_ERRORS):
+                return stderr
             command = raw_output.get("command", "")
-            stdout = raw_output.get("stdout", "")
-            stderr = raw_output.get("stderr", "")
-            if len(stdout) > 16000:
-                stdout = stdout[:16000] + "\n... (output truncated)"
+            stdout = _bounded(
+                raw_output.get("stdout", ""), 16000, "\n... (output truncated)"
+            )
             return f"Command: {command}\nOutput: {stdout}\nError: {stderr}"
         return str(raw_output)
 
@@ -397,12 +441,7 @@ def _resolve_tool_entry(tool_identifier: str) -> Optional[Tuple[str, Dict[str, A
     if tool_identifier in available_functions:
         return tool_identifier, available_functions[tool_identifier]
 
-    # Alias match
-    for name, entry in available_functions.items():
-        if tool_identifier in entry.get("aliases", []):
-            return name, entry
-
-    return None
+    return _tool_aliases.get(tool_identifier)
 
 
 def resolve_tool_identifier(
@@ -6,6 +6,7 @@ from ollama import chat
 from config import DEBUG_OLLAMA, DEBUG_TOOL_DIRECTIVES
 from services.ollama_shared import (
     COMMAND_TRANSLATOR_SYSTEM_PROMPT,
+    KEEP_ALIVE,
     MODEL_NAME,
     QUERY_TRANSLATOR_SYSTEM_PROMPT,
 )
@@ -20,6 +21,7 @@ from utils.logger import debug_payload, logger
 # are imported from services.ollama_shared
 
 _last_command_translation_error: Optional[str] = None
+_SPLIT_CMD = re.compile(r"[;&|]")
 
 
 _debug = (
@@ -65,7 +67,7 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
         return None
 
     _set_last_command_translation_error(None)
-    _debug("command_translation_input", {"instruction": instruction})
+    _debug("command_translation_input", lambda: {"instruction": instruction})
 
     direct = detect_direct_command(instruction)
     if direct:
@@ -80,7 +82,7 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
     _debug("command_translation_request", messages)
 
     try:
-        response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+        response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
         command = (response.message.content or "").strip()
         _debug("command_translation_response", command)
 
@@ -88,12 +90,12 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
             command = command.split(":", 1)[1].strip()
 
         if "\n" in command:
-            command = command.splitlines()[0].strip()
+            command = command.partition("\n")[0].strip()
 
         if command.upper() == "NONE":
             _debug(
                 "command_translation_none",
-                {"instruction": instruction, "reason": "model_returned_NONE"},
+                lambda: {"instruction": instruction, "reason": "model_returned_NONE"},
             )
             _set_last_command_translation_error(
                 "model explicitly replied with NONE (no safe command)"
@@ -116,14 +118,14 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
                     _set_last_command_translation_error(None)
                     return fixed_sanitized
 
-        segments = re.split(r"[;&|]", command, maxsplit=1)
+        segments = _SPLIT_CMD.split(command, maxsplit=1)
         leading = segments[0].strip() if segments else ""
         if leading and leading != command:
             fallback = sanitize_command(leading)
             if fallback:
                 _debug(
                     "command_translation_sanitized_fallback",
-                    {
+                    lambda: {
                         "instruction": instruction,
                         "raw_command": fallback,
                     },
@@ -139,7 +141,7 @@ def translate_instruction_to_command(instruction: str) -> Optional[str]:
         )
         _debug(
             "command_translation_rejected",
-            {
+            lambda: {
                 "instruction": instruction,
                 "raw_command": command,
                 "reason": sanitize_reason,
@@ -166,12 +168,12 @@ def translate_instruction_to_query(instruction: str) -> Optional[str]:
     _debug("query_translation_request", messages)
 
     try:
-        response = chat(model=MODEL_NAME, messages=messages, keep_alive=0)
+        response = chat(model=MODEL_NAME, messages=messages, keep_alive=KEEP_ALIVE)
         query = (response.message.content or "").strip()
         _debug("query_translation_response", query)
 
         if "\n" in query:
-            query = query.splitlines()[0].strip()
+            query = query.partition("\n")[0].strip()
 
         if query.upper() == "NONE":
             return None
@@ -1,49 +1,115 @@
 import asyncio
 import base64
+from typing import Optional
 
-import requests
+import httpx
 
 from config import GEMINI_KEY
+from utils.logger import logger
 
 
 STT_MODEL = "gemini-2.0-flash"
-STT_URL = (
-    "https://generativelanguage.googleapis.com/v1beta/models/"
-    f"{STT_MODEL}:generateContent?key={GEMINI_KEY}"
+API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+STT_URL = f"{API_BASE}/models/{STT_MODEL}:generateContent?key={GEMINI_KEY}"
+
+UPLOAD_URL = (
+    "https://generativelanguage.googleapis.com/upload/v1beta/files"
+    f"?key={GEMINI_KEY}"
 )
 
 MIME_TYPE_OGG = "audio/ogg"
 STT_PROMPT = "Please transcribe this audio."
 STT_TIMEOUT_SECONDS = 30
+# Short voice notes go inline in one request; the Files API costs an upload,
+# the transcription and a delete, so it only pays off for large recordings.
+UPLOAD_MIN_BYTES = 1024 * 1024
+
+# Shared client so consecutive transcriptions reuse the TLS session.
+_HTTP = httpx.AsyncClient(http2=True, timeout=STT_TIMEOUT_SECONDS)
 
 
-def encode_audio(file_path: str) -> str:
+def _read_audio(file_path: str) -> bytes:
     with open(file_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
-
-
-def _transcribe_sync(file_path: str):
-    data = encode_audio(file_path)
-    body = {
-        "contents": [
-            {
-                "parts": [
-                    {"inline_data": {"mime_type": MIME_TYPE_OGG, "data": data}},
-                    {"text": STT_PROMPT},
-                ]
-            }
-        ]
-    }
-
-    response = requests.post(
-        STT_URL,
-        headers={"Content-Type": "application/json"},
-        json=body,
-        timeout=STT_TIMEOUT_SECONDS,
+        return f.read()
+
+
+def _build_stt_request(audio_part: dict) -> dict:
+    return {"contents": [{"parts": [audio_part, {"text": STT_PROMPT}]}]}
+
+
+async def _upload_audio(audio: bytes) -> Optional[dict]:
+    """Upload raw audio bytes through the Gemini Files API.
+
+    Returns the file resource (with "name" and "uri"), or None when the upload
+    could not be completed.
+    """
+    start = await _HTTP.post(
+        UPLOAD_URL,
+        headers={
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(len(audio)),
+            "X-Goog-Upload-Header-Content-Type": MIME_TYPE_OGG,
+            "Content-Type": "application/json",
+        },
+        json={"file": {"display_name": "voice-note"}},
     )
-    return response.json()
+    start.raise_for_status()
+    upload_url = start.headers.get("x-goog-upload-url")
+    if not upload_url:
+        return None
+
+    response = await _HTTP.post(
+        upload_url,
+        headers={
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize",
+            "Content-Length": str(len(audio)),
+        },
+        content=audio,
+    )
+    response.raise_for_status()
+    uploaded = response.json().get("file") or {}
+    return uploaded if uploaded.get("uri") else None
+
+
+async def _delete_uploaded(name: str) -> None:
+    """Remove an uploaded voice note instead of leaving it until it expires."""
+    try:
+        response = await _HTTP.delete(f"{API_BASE}/{name}?key={GEMINI_KEY}")
+        response.raise_for_status()
+    except httpx.HTTPError as err:
+        logger.warning(f"Could not delete uploaded audio {name}: {err}")
 
 
 async def transcribe(file_path: str):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, _transcribe_sync, file_path)
+    audio = await asyncio.to_thread(_read_audio, file_path)
+
+    # Uploading a large recording avoids inflating it by a third as base64
+    # inside the JSON body; inline data stays as a fallback.
+    uploaded = None
+    if len(audio) > UPLOAD_MIN_BYTES:
+        try:
+            uploaded = await _upload_audio(audio)
+        except httpx.HTTPError as err:
+            logger.warning(f"Gemini file upload failed, sending audio inline: {err}")
+
+    if uploaded:
+        audio_part = {
+            "file_data": {"mime_type": MIME_TYPE_OGG, "file_uri": uploaded["uri"]}
+        }
+    else:
+        data = base64.b64encode(audio).decode("utf-8")
+        audio_part = {"inline_data": {"mime_type": MIME_TYPE_OGG, "data": data}}
+
+    try:
+        response = await _HTTP.post(
+            STT_URL,
+            headers={"Content-Type": "application/json"},
+            json=_build_stt_request(audio_part),
+        )
+        response.raise_for_status()
+        return response.json()
+    finally:
+        if uploaded and uploaded.get("name"):
+            await _delete_uploaded(uploaded["name"])
@@ -5,6 +5,7 @@ import re
 import wave
 from typing import Optional
 
+import httpx
 import requests
 
 from config import GEMINI_KEY
@@ -25,6 +26,9 @@ CHANNELS = 1  # mono
 SAMPLE_WIDTH_BYTES = 2  # 16-bit samples
 SAMPLE_RATE_HZ = 24000  # 24 kHz
 
+# Shared client so consecutive TTS calls reuse the TLS session.
+_HTTP = httpx.AsyncClient(http2=True, timeout=TTS_TIMEOUT_SECONDS)
+
 
 def clean_text_for_tts(text: str) -> str:
     text = html.unescape(text)
@@ -34,10 +38,8 @@ def clean_text_for_tts(text: str) -> str:
     return text.strip()
 
 
-def _generate_tts_file(text: str, output_filename: str = DEFAULT_TTS_OUTPUT) -> Optional[str]:
-    text = clean_text_for_tts(text)
-
-    body = {
+def _build_tts_body(text: str) -> dict:
+    return {
         "contents": [{"parts": [{"text": text}]}],
         "generationConfig": {
             "responseModalities": ["AUDIO"],
@@ -50,52 +52,78 @@ def _generate_tts_file(text: str, output_filename: str = DEFAULT_TTS_OUTPUT) ->
         "model": TTS_MODEL,
     }
 
-    try:
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": GEMINI_KEY,
-        }
 
+def _tts_headers() -> dict:
+    return {
+        "Content-Type": "application/json",
+        "x-goog-api-key": GEMINI_KEY,
+    }
+
+
+def _write_tts_file(data: dict, output_filename: str) -> Optional[str]:
+    audio_b64 = (
+        data.get("candidates", [{}])[0]
+        .get("content", {})
+        .get("parts", [{}])[0]
+        .get("inlineData", {})
+        .get("data")
+    )
+
+    if not audio_b64:
+        logger.error("Missing audio data in response.")
+        return None
+
+    pcm_data = base64.b64decode(audio_b64)
+    output_filename = output_filename.replace(".raw", ".wav")
+
+    with wave.open(output_filename, "wb") as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(SAMPLE_WIDTH_BYTES)
+        wf.setframerate(SAMPLE_RATE_HZ)
+        wf.writeframes(pcm_data)
+
+    return output_filename
+
+
+def _generate_tts_file(text: str, output_filename: str = DEFAULT_TTS_OUTPUT) -> Optional[str]:
+    text = clean_text_for_tts(text)
+
+    try:
         response = requests.post(
             TTS_URL,
-            headers=headers,
-            json=body,
+            headers=_tts_headers(),
+            json=_build_tts_body(text),
             timeout=TTS_TIMEOUT_SECONDS,
         )
         response.raise_for_status()
 
-        data = response.json()
-        audio_b64 = (
-            data.get("candidates", [{}])[0]
-            .get("content", {})
-            .get("parts", [{}])[0]
-            .get("inlineData", {})
-            .get("data")
-        )
+        return _write_tts_file(response.json(), output_filename)
 
-        if not audio_b64:
-            logger.error("Missing audio data in response.")
-            return None
+    except Exception as e:
+        logger.error(f"TTS request failed: {e}")
+        return None
 
-        pcm_data = base64.b64decode(audio_b64)
-        output_filename = output_filename.replace(".raw", ".wav")
 
-        with wave.open(output_filename, "wb") as wf:
-            wf.setnchannels(CHANNELS)
-            wf.setsampwidth(SAMPLE_WIDTH_BYTES)
-            wf.setframerate(SAMPLE_RATE_HZ)
-            wf.writeframes(pcm_data)
+async def synthesize_speech(text: str, output_filename: str = DEFAULT_TTS_OUTPUT):
+    text = clean_text_for_tts(text)
 
-        return output_filename
+    try:
+        response = await _HTTP.post(
+            TTS_URL,
+            headers=_tts_headers(),
+            json=_build_tts_body(text),
+        )
+        response.raise_for_status()
+
+        # Decoding and writing several seconds of PCM is disk/CPU work;
+        # keep it off the event loop.
+        return await asyncio.to_thread(
+            _write_tts_file, response.json(), output_filename
+        )
 
     except Exception as e:
         logger.error(f"TTS request failed: {e}")
         return None
 
-
-async def synthesize_speech(text: str, output_filename: str = DEFAULT_TTS_OUTPUT):
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, _generate_tts_file, text, output_filename)
-
 def synthesize_speech_sync(text: str, output_filename: str = DEFAULT_TTS_OUTPUT) -> Optional[str]:
     return _generate_tts_file(text, output_filename)
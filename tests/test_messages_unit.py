@@ -3,6 +3,7 @@ import time
 import unittest
 
 from handlers import messages as msg
+from utils.message_chunks import split_by_chunk_size
 
 
 class FakeMessage:
@@ -109,5 +110,24 @@ class SendChunkedMessageTests(unittest.IsolatedAsyncioTestCase):
             self.assertGreaterEqual(delay, 0.5)
 
 
+class SplitByChunkSizeTests(unittest.TestCase):
+    def test_prefers_newline_boundaries(self) -> None:
+        lines = [f"*item {i}* some description" for i in range(20)]
+        text = "\n".join(lines)
+
+        chunks = split_by_chunk_size(text, 100)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 100)
+            for line in chunk.split("\n"):
+                self.assertIn(line, lines)
+
+    def test_falls_back_to_hard_cut_without_newlines(self) -> None:
+        chunks = split_by_chunk_size("x" * 250, 100)
+
+        self.assertEqual([len(c) for c in chunks], [100, 100, 50])
+
+
 if __name__ == "__main__":  # pragma: no cover
     asyncio.run(unittest.main())
@@ -80,6 +80,8 @@ class GroupTokensByLineTests(unittest.TestCase):
 
 
 class ProcessImageTests(unittest.TestCase):
+    @patch("services.ocr.tesserocr", None)
+    @patch("services.ocr.cv2", None)
     @patch("services.ocr.pytesseract.image_to_data")
     @patch("services.ocr.Image.open")
     def test_process_image_handles_tesseract_output(self, mock_open, mock_image_to_data) -> None:  # noqa: ANN001
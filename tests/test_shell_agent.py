@@ -195,6 +195,15 @@ class ShellAgentTests(unittest.TestCase):
         
         self.assertLessEqual(len(truncated), MAX_TOOL_OUTPUT_IN_HISTORY + 3)  # +3 for "..."
 
+    def test_successful_shell_output_format(self):
+        from services.ollama import _format_tool_output
+
+        raw_output = {"command": "ls", "exit_code": 0, "stdout": "a\nb\n", "stderr": ""}
+        self.assertEqual(_format_tool_output("shell_agent", raw_output), "$ ls\na\nb")
+
+        raw_output["stdout"] = "  \n"
+        self.assertEqual(_format_tool_output("shell_agent", raw_output), "$ ls")
+
     def test_tool_output_truncated_in_formatting(self):
         # Test that very long stdout is truncated in formatting
         from services.ollama import _format_tool_output
@@ -215,6 +224,25 @@ class ShellAgentTests(unittest.TestCase):
         # Should be shorter than original
         self.assertLess(len(formatted), len(long_stdout))
 
+    def test_streamed_stdout_is_read_only_up_to_the_cap(self):
+        from itertools import count
+
+        from services.ollama import MAX_STDOUT_CHARS, _format_tool_output
+
+        consumed = []
+
+        def endless_lines():
+            for index in count():
+                consumed.append(index)
+                yield "x" * 99 + "\n"
+
+        raw_output = {"command": "yes", "exit_code": 0, "stdout": endless_lines()}
+
+        formatted = _format_tool_output("shell_agent", raw_output)
+
+        self.assertTrue(formatted.endswith("... (output truncated)"))
+        self.assertLessEqual(len(consumed), MAX_STDOUT_CHARS // 100 + 1)
+
     def test_tool_history_truncation(self):
         # Test that tool outputs are truncated when stored in history
         from services.ollama import call_tool_with_tldr, MAX_TOOL_OUTPUT_IN_HISTORY
@@ -1,18 +1,20 @@
 import asyncio
 import unittest
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import handlers.commands as cmds
 
 
 class TestRunToolAsync(unittest.IsolatedAsyncioTestCase):
-    async def test_run_tool_async_delegates_to_thread(self):
+    async def test_run_tool_async_awaits_the_async_runner(self):
+        # Awaited in this context, so tool audio it queues stays visible.
         with patch(
-            "handlers.commands.run_tool_direct", return_value="output"
+            "handlers.commands.run_tool_direct_async",
+            new=AsyncMock(return_value="output"),
         ) as mock_run:
             result = await cmds._run_tool_async("shell_agent", {"prompt": "ls"})
             self.assertEqual(result, "output")
-            mock_run.assert_called_once_with("shell_agent", {"prompt": "ls"})
+            mock_run.assert_awaited_once_with("shell_agent", {"prompt": "ls"})
 
 
 if __name__ == "__main__":
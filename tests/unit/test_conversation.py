@@ -0,0 +1,32 @@
+import unittest
+from unittest.mock import MagicMock
+
+from services.conversation import ConversationManager
+
+
+def _ollama_manager(reply="hello"):
+    manager = ConversationManager(provider="ollama")
+    backend = MagicMock(return_value=reply)
+    manager._dispatch = backend
+    return manager, backend
+
+
+class TestReplyCache(unittest.TestCase):
+    def test_ollama_replies_are_not_cached(self):
+        # Replies depend on per-user history and tool runs, so each call is fresh.
+        manager, backend = _ollama_manager()
+        self.assertEqual(manager.generate_reply(1, "hi"), "hello")
+        self.assertEqual(manager.generate_reply(2, "hi"), "hello")
+        self.assertEqual(backend.call_count, 2)
+
+    def test_gemini_replies_are_not_cached(self):
+        manager = ConversationManager(provider="gemini")
+        backend = MagicMock(return_value="hello")
+        manager._dispatch = backend
+        manager.generate_reply(1, "hi")
+        manager.generate_reply(1, "hi")
+        self.assertEqual(backend.call_count, 2)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
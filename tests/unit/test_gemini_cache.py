@@ -0,0 +1,142 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+import services.gemini as gemini
+
+
+def _turns(count, size=8000):
+    roles = ("user", "model")
+    return [
+        {"role": roles[i % 2], "parts": [{"text": str(i) * size}]}
+        for i in range(count)
+    ]
+
+
+def _response(body):
+    response = MagicMock()
+    response.json.return_value = body
+    response.raise_for_status.return_value = None
+    return response
+
+
+def _http_error(status):
+    response = MagicMock()
+    response.status_code = status
+    return requests.HTTPError(str(status), response=response)
+
+
+REPLY = {"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}
+
+
+class TestGeminiPrefixCache(unittest.TestCase):
+    def setUp(self):
+        gemini._user_cache_ids.clear()
+        gemini._cache_retry_at.clear()
+
+    def tearDown(self):
+        gemini._user_cache_ids.clear()
+        gemini._cache_retry_at.clear()
+
+    def test_short_history_is_sent_whole(self):
+        with patch.object(gemini._session, "post", return_value=_response(REPLY)) as post:
+            gemini.generate_content("hi", history=_turns(2, 10), cache_key="1")
+
+        post.assert_called_once()
+        payload = post.call_args.kwargs["json"]
+        self.assertEqual(len(payload["contents"]), 3)
+        self.assertNotIn("cachedContent", payload)
+
+    def test_long_history_reuses_cached_prefix(self):
+        history = _turns(20)
+        responses = [_response({"name": "cachedContents/abc"}), _response(REPLY)]
+        with patch.object(gemini._session, "post", side_effect=responses):
+            self.assertEqual(
+                gemini.generate_content("hi", history=history, cache_key="1"), "ok"
+            )
+
+        history += _turns(2, 5)
+        with patch.object(gemini._session, "post", return_value=_response(REPLY)) as post:
+            gemini.generate_content("again", history=history, cache_key="1")
+
+        post.assert_called_once()
+        payload = post.call_args.kwargs["json"]
+        self.assertEqual(payload["cachedContent"], "cachedContents/abc")
+        self.assertEqual(len(payload["contents"]), 3)
+
+    def test_failed_cached_call_falls_back_to_full_history(self):
+        history = _turns(20)
+        gemini._user_cache_ids["1"] = (
+            len(history),
+            gemini._prefix_hash(history),
+            "cachedContents/expired",
+        )
+        expired = _response({})
+        expired.raise_for_status.side_effect = _http_error(404)
+        with (
+            patch.object(
+                gemini._session, "post", side_effect=[expired, _response(REPLY)]
+            ) as post,
+            patch.object(gemini._session, "delete") as delete,
+        ):
+            self.assertEqual(
+                gemini.generate_content("hi", history=history, cache_key="1"), "ok"
+            )
+
+        payload = post.call_args.kwargs["json"]
+        self.assertNotIn("cachedContent", payload)
+        self.assertEqual(len(payload["contents"]), 21)
+        self.assertNotIn("1", gemini._user_cache_ids)
+        self.assertIn("cachedContents/expired", delete.call_args.args[0])
+
+    def test_transient_error_keeps_the_cache_and_does_not_retry(self):
+        history = _turns(20)
+        entry = (len(history), gemini._prefix_hash(history), "cachedContents/live")
+        gemini._user_cache_ids["1"] = entry
+        busy = _response({})
+        busy.raise_for_status.side_effect = _http_error(503)
+        with patch.object(gemini._session, "post", return_value=busy) as post:
+            reply = gemini.generate_content("hi", history=history, cache_key="1")
+
+        self.assertTrue(reply.startswith("Error calling Gemini API"))
+        post.assert_called_once()
+        self.assertEqual(gemini._user_cache_ids["1"], entry)
+
+    def test_failed_cache_creation_backs_off(self):
+        history = _turns(20)
+        rejected = _response({})
+        rejected.raise_for_status.side_effect = requests.HTTPError("400")
+        with patch.object(
+            gemini._session, "post", side_effect=[rejected, _response(REPLY)]
+        ):
+            gemini.generate_content("hi", history=history, cache_key="1")
+
+        with patch.object(gemini._session, "post", return_value=_response(REPLY)) as post:
+            gemini.generate_content("again", history=history, cache_key="1")
+
+        post.assert_called_once()
+        self.assertNotIn("cachedContent", post.call_args.kwargs["json"])
+
+    def test_superseded_cache_is_deleted(self):
+        history = _turns(20)
+        gemini._user_cache_ids["1"] = (
+            len(history),
+            gemini._prefix_hash(history),
+            "cachedContents/old",
+        )
+        shifted = history[2:] + _turns(2)
+        responses = [_response({"name": "cachedContents/new"}), _response(REPLY)]
+        with (
+            patch.object(gemini._session, "post", side_effect=responses),
+            patch.object(gemini._session, "delete") as delete,
+        ):
+            gemini.generate_content("hi", history=shifted, cache_key="1")
+
+        delete.assert_called_once()
+        self.assertIn("cachedContents/old", delete.call_args.args[0])
+        self.assertEqual(gemini._user_cache_ids["1"][2], "cachedContents/new")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import services.gemini as gemini
+
+
+class TestConversationWal(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        conv_file = os.path.join(self._tmp.name, "conversations.json")
+        wal_file = os.path.join(self._tmp.name, "conversations.wal")
+        self._patches = [
+            patch.object(gemini, "CONVERSATION_FILE", conv_file),
+            patch.object(gemini, "CONVERSATION_WAL", wal_file),
+            patch.object(gemini, "generate_content", return_value="pong"),
+        ]
+        for p in self._patches:
+            p.start()
+        self._saved = gemini.user_conversations
+        gemini._reply_cache.clear()
+        gemini.load_conversations()
+
+    def tearDown(self):
+        gemini._close_wal()
+        for p in reversed(self._patches):
+            p.stop()
+        gemini.user_conversations = self._saved
+        gemini._turns_since_snapshot = 0
+        gemini._reply_cache.clear()
+        self._tmp.cleanup()
+
+    def test_turns_are_appended_and_replayed(self):
+        gemini.handle_user_message(1, "ping")
+        self.assertFalse(os.path.exists(gemini.CONVERSATION_FILE))
+        with open(gemini.CONVERSATION_WAL, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+        gemini.load_conversations()
+        self.assertEqual(
+            [m["parts"][0]["text"] for m in gemini.user_conversations["1"]],
+            ["ping", "pong"],
+        )
+
+    def test_snapshot_truncates_wal(self):
+        with patch.object(gemini, "SNAPSHOT_EVERY_TURNS", 1):
+            gemini.handle_user_message(1, "one")
+            gemini.handle_user_message(1, "two")
+
+        with open(gemini.CONVERSATION_FILE, encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)["1"]), 4)
+        self.assertEqual(os.path.getsize(gemini.CONVERSATION_WAL), 0)
+
+        gemini.load_conversations()
+        self.assertEqual(len(gemini.user_conversations["1"]), 4)
+
+    def test_history_keeps_only_latest_pairs(self):
+        with (
+            patch.object(gemini, "HISTORY_LIMIT", 4),
+            patch.object(gemini, "HISTORY_TRIM_BLOCK", 2),
+        ):
+            for text in ("one", "two", "three"):
+                gemini.handle_user_message(1, text)
+
+        history = gemini.user_conversations["1"]
+        self.assertEqual(
+            [m["parts"][0]["text"] for m in history], ["two", "pong", "three", "pong"]
+        )
+
+    def test_history_is_trimmed_in_blocks(self):
+        with (
+            patch.object(gemini, "HISTORY_LIMIT", 6),
+            patch.object(gemini, "HISTORY_TRIM_BLOCK", 4),
+            patch.object(gemini, "_drop_cached_prefix") as drop,
+        ):
+            for text in ("one", "two", "three"):
+                gemini.handle_user_message(1, text)
+            drop.assert_not_called()
+            gemini.handle_user_message(1, "four")
+            drop.assert_called_once_with("1")
+
+        history = gemini.user_conversations["1"]
+        self.assertEqual(
+            [m["parts"][0]["text"] for m in history], ["three", "pong", "four", "pong"]
+        )
+
+    def test_conversations_are_loaded_on_first_use(self):
+        with (
+            patch.object(gemini, "_loaded", False),
+            patch.object(gemini, "load_conversations") as load,
+        ):
+            gemini._ensure_loaded()
+            load.assert_called_once()
+
+    def test_loaded_flag_is_set_only_after_the_conversations(self):
+        seen = []
+
+        def replay(conversations):
+            seen.append((gemini._loaded, gemini.user_conversations is conversations))
+
+        with (
+            patch.object(gemini, "_loaded", False),
+            patch.object(gemini, "_replay_wal", side_effect=replay),
+        ):
+            gemini.load_conversations()
+            self.assertTrue(gemini._loaded)
+
+        self.assertEqual(seen, [(False, False)])
+
+
+class TestGeminiReplyCache(unittest.TestCase):
+    def setUp(self):
+        gemini._reply_cache.clear()
+
+    def tearDown(self):
+        gemini._reply_cache.clear()
+
+    def test_identical_history_and_prompt_reuses_reply(self):
+        with (
+            patch.object(gemini, "generate_content", return_value="pong") as generate,
+            patch.object(gemini, "_append_wal"),
+            patch.object(gemini, "_ensure_loaded"),
+            patch.dict(gemini.user_conversations, clear=True),
+        ):
+            gemini.handle_user_message(1, "ping")
+            gemini.handle_user_message(2, "ping")
+            gemini.handle_user_message(3, "ping", bypass_cache=True)
+
+        self.assertEqual(generate.call_count, 2)
+
+    def test_error_replies_are_not_cached(self):
+        with (
+            patch.object(
+                gemini, "generate_content", return_value="Error calling Gemini API: x"
+            ) as generate,
+            patch.object(gemini, "_append_wal"),
+            patch.object(gemini, "_ensure_loaded"),
+            patch.dict(gemini.user_conversations, clear=True),
+        ):
+            gemini.handle_user_message(1, "ping")
+            gemini.handle_user_message(2, "ping")
+
+        self.assertEqual(generate.call_count, 2)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,57 @@
+import pickle
+import unittest
+
+from utils.history_state import (
+    BoundedOrderedDict,
+    get_output_metadata,
+    get_prompt_history,
+)
+
+
+class FakeContext:
+    def __init__(self, user_data=None):
+        self.user_data = user_data if user_data is not None else {}
+
+
+class TestBoundedOrderedDict(unittest.TestCase):
+    def test_evicts_oldest_entry_when_full(self):
+        store = BoundedOrderedDict(2)
+        store[1] = "a"
+        store[2] = "b"
+        store[3] = "c"
+        self.assertEqual(list(store.items()), [(2, "b"), (3, "c")])
+
+    def test_rewriting_key_marks_it_recent(self):
+        store = BoundedOrderedDict(2)
+        store[1] = "a"
+        store[2] = "b"
+        store[1] = "a2"
+        store[3] = "c"
+        self.assertEqual(list(store.keys()), [1, 3])
+
+    def test_survives_pickle_round_trip(self):
+        store = BoundedOrderedDict(3)
+        store[1] = "a"
+        restored = pickle.loads(pickle.dumps(store))
+        self.assertIsInstance(restored, BoundedOrderedDict)
+        self.assertEqual(restored.maxlen, 3)
+        self.assertEqual(dict(restored), {1: "a"})
+
+
+class TestUserMaps(unittest.TestCase):
+    def test_prompt_history_is_bounded_and_reused(self):
+        context = FakeContext()
+        history = get_prompt_history(context)
+        self.assertIsInstance(history, BoundedOrderedDict)
+        self.assertIs(get_prompt_history(context), history)
+
+    def test_plain_dict_from_persistence_is_upgraded(self):
+        context = FakeContext({"output_metadata": {7: {"tool_name": "web"}}})
+        metadata = get_output_metadata(context)
+        self.assertIsInstance(metadata, BoundedOrderedDict)
+        self.assertEqual(metadata[7], {"tool_name": "web"})
+        self.assertIs(context.user_data["output_metadata"], metadata)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -1,8 +1,11 @@
 import asyncio
+import os
+import tempfile
 import unittest
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import handlers.messages as msg
+import services.ollama as ollama
 
 
 class FakeMessage:
@@ -24,14 +27,125 @@ class FakeContext:
         self.user_data = {}
 
 
+class TestStripCommandPrefix(unittest.TestCase):
+    def test_plain_text_is_returned_unchanged(self):
+        self.assertEqual(msg._strip_command_prefix("hello there"), "hello there")
+
+    def test_command_with_arguments_keeps_arguments(self):
+        self.assertEqual(msg._strip_command_prefix("/web best ramen"), "best ramen")
+
+    def test_bare_command_returns_empty_string(self):
+        self.assertEqual(msg._strip_command_prefix("/web"), "")
+
+
+class TestMergeInstructionsWithPrompt(unittest.TestCase):
+    def test_control_word_reuses_original_prompt(self):
+        merged = msg._merge_instructions_with_prompt("Retry!", "list files")
+        self.assertEqual(merged, "list files")
+
+    def test_instructions_are_prepended(self):
+        merged = msg._merge_instructions_with_prompt("shorter", "list files")
+        self.assertEqual(merged, "shorter\n\nlist files")
+
+
+class TestNeedsMarkdownify(unittest.TestCase):
+    def test_plain_prose_is_skipped(self):
+        self.assertFalse(msg._needs_markdownify("Sunny all day, 20 C"))
+
+    def test_markdown_and_escapable_text_is_converted(self):
+        self.assertTrue(msg._needs_markdownify("**bold**"))
+        self.assertTrue(msg._needs_markdownify("Done."))
+        self.assertTrue(msg._needs_markdownify("C:\\temp"))
+
+
+class TestRespondInModeAudioPrompt(unittest.IsolatedAsyncioTestCase):
+    async def test_audio_prompt_is_joined_into_short_reply(self):
+        sent = []
+
+        class KeyboardMessage(FakeMessage):
+            async def reply_text(self, text, parse_mode=None, reply_markup=None):
+                sent.append({"text": text, "reply_markup": reply_markup})
+                return self
+
+        fake_message = KeyboardMessage()
+        fake_message.message_id = 1
+        fake_context = FakeContext()
+        with patch("handlers.messages._stage_tool_audio", return_value=True):
+            await msg.respond_in_mode(
+                fake_message, fake_context, "weather", "Sunny all day"
+            )
+
+        self.assertEqual(len(sent), 1)
+        self.assertIn("audio summary", sent[0]["text"])
+        self.assertIsNotNone(sent[0]["reply_markup"])
+
+
+class TestStageToolAudio(unittest.IsolatedAsyncioTestCase):
+    async def test_new_payload_cancels_the_previous_script_task(self):
+        old_task = asyncio.get_running_loop().create_task(asyncio.sleep(60))
+        new_task = asyncio.get_running_loop().create_task(asyncio.sleep(60))
+        fake_context = FakeContext()
+        fake_context.user_data["pending_tool_audio"] = {
+            "script": "old",
+            "script_task": old_task,
+        }
+        payload = {
+            "summary": "s",
+            "tool_name": "web",
+            "script": "s",
+            "script_task": new_task,
+        }
+
+        with (
+            patch.object(msg.conversation_manager, "is_ollama", True),
+            patch.object(msg, "pop_last_tool_audio", return_value=payload),
+        ):
+            self.assertTrue(msg._stage_tool_audio(fake_context))
+
+        await asyncio.sleep(0)
+        self.assertTrue(old_task.cancelled())
+        self.assertFalse(new_task.done())
+        pending = fake_context.user_data["pending_tool_audio"]
+        self.assertIs(pending["script_task"], new_task)
+        new_task.cancel()
+
+
+class TestSendVoiceReply(unittest.IsolatedAsyncioTestCase):
+    async def test_file_is_removed_in_background_after_sending(self):
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as handle:
+            handle.write(b"audio")
+            filename = handle.name
+
+        class VoiceMessage(FakeMessage):
+            async def reply_voice(self, voice, caption=None):
+                return "voice-message"
+
+        sent = await msg.send_voice_reply(VoiceMessage(), filename, "caption")
+        self.assertEqual(sent, "voice-message")
+        await asyncio.gather(*msg._BACKGROUND_TASKS)
+        self.assertFalse(os.path.exists(filename))
+
+
 class TestRunToolAsync(unittest.IsolatedAsyncioTestCase):
-    async def test_run_tool_async_delegates_to_thread(self):
+    async def test_run_tool_async_awaits_the_async_runner(self):
+        # Awaited in this context, so tool audio it queues stays visible.
         with patch(
-            "handlers.messages.run_tool_direct", return_value="output"
+            "handlers.messages.run_tool_direct_async",
+            new=AsyncMock(return_value="output"),
         ) as mock_run:
             result = await msg._run_tool_async("shell_agent", {"prompt": "ls"})
             self.assertEqual(result, "output")
-            mock_run.assert_called_once_with("shell_agent", {"prompt": "ls"})
+            mock_run.assert_awaited_once_with("shell_agent", {"prompt": "ls"})
+
+    async def test_tool_audio_queued_by_the_tool_reaches_the_caller(self):
+        async def fake_run(tool_name, parameters):
+            ollama._set_last_tool_audio({"summary": "done"})
+            return "output"
+
+        with patch("handlers.messages.run_tool_direct_async", new=fake_run):
+            await msg._run_tool_async("shell_agent", {"prompt": "ls"})
+
+        self.assertEqual(ollama.pop_last_tool_audio(), {"summary": "done"})
 
 
 class TestHandleShellCommand(unittest.IsolatedAsyncioTestCase):
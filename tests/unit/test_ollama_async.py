@@ -2,9 +2,30 @@ import asyncio
 import unittest
 from unittest.mock import MagicMock, patch
 
+from ollama import ChatResponse, Message
+
 import services.ollama as ollama
 
 
+def _chunks(text):
+    """Split text into streamed chunks, the last one marked done."""
+    words = text.split(" ")
+    pieces = [word + " " for word in words[:-1]] + [words[-1]]
+    return [
+        ChatResponse(
+            model="m",
+            message=Message(role="assistant", content=piece),
+            done=index == len(pieces) - 1,
+        )
+        for index, piece in enumerate(pieces)
+    ]
+
+
+async def _stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
 class TestOllamaAsyncToolHelpers(unittest.IsolatedAsyncioTestCase):
     async def test_run_tool_direct_async_success(self):
         # Patch _resolve_tool_entry to return a fake tool and function
@@ -42,8 +63,8 @@ class TestOllamaAsyncToolHelpers(unittest.IsolatedAsyncioTestCase):
             patch.object(ollama, "_debug"),
             patch.object(ollama, "_record_event"),
             patch.object(ollama, "_truncate_event_text", return_value="done"),
-            patch.object(ollama, "tldr_tool_output", return_value="summary"),
-            patch.object(ollama, "build_audio_script", return_value="audio script"),
+            patch.object(ollama, "tldr_tool_output_async", return_value="summary"),
+            patch.object(ollama, "build_audio_script_async", return_value="audio script"),
             patch.object(ollama, "_set_last_tool_audio"),
         ):
             history = []
@@ -67,8 +88,9 @@ class TestOllamaAsyncToolHelpers(unittest.IsolatedAsyncioTestCase):
             patch.object(ollama, "_debug"),
             patch.object(ollama, "_record_event"),
             patch.object(ollama, "_truncate_event_text", return_value="raw output"),
-            patch.object(ollama, "tldr_tool_output", return_value="summary"),
-            patch.object(ollama, "build_audio_script", return_value="audio script"),
+            patch.object(ollama, "TLDR_MIN_CHARS", 0),
+            patch.object(ollama, "tldr_tool_output_async", return_value="summary"),
+            patch.object(ollama, "build_audio_script_async", return_value="audio script"),
             patch.object(ollama, "_set_last_tool_audio"),
         ):
             history = []
@@ -80,8 +102,38 @@ class TestOllamaAsyncToolHelpers(unittest.IsolatedAsyncioTestCase):
             self.assertTrue(any(entry["role"] == "tool" for entry in history))
             self.assertTrue(any(entry["role"] == "assistant" for entry in history))
 
+    async def test_call_tool_with_tldr_async_short_output_skips_model(self):
+        def fake_tool(**kwargs):
+            return "raw output"
+
+        with (
+            patch.object(ollama, "_record_event"),
+            patch.object(ollama, "tldr_tool_output_async") as tldr,
+            patch.object(
+                ollama, "build_audio_script_async", return_value="spoken"
+            ) as script,
+            patch.object(ollama, "_set_last_tool_audio") as set_audio,
+        ):
+            history = []
+            result = await ollama.call_tool_with_tldr_async(
+                "some_tool", fake_tool, history
+            )
+            separate = await ollama.call_tool_with_tldr_async(
+                "some_tool", fake_tool, history, tldr_separate=True
+            )
+            plain, spoken = (call.args[0] for call in set_audio.call_args_list)
+            self.assertEqual(await spoken["script_task"], "spoken")
+
+        self.assertEqual(result, "raw output")
+        self.assertEqual(separate, ("raw output", "raw output"))
+        tldr.assert_not_called()
+        script.assert_awaited_once_with("raw output")
+        self.assertEqual(plain["script"], "raw output")
+        self.assertIsNone(plain["script_task"])
+        self.assertFalse(any(entry["role"] == "assistant" for entry in history))
+
     async def test_call_tool_with_tldr_async_tldr_exception(self):
-        # Simulate a tool that returns a string, but tldr_tool_output raises
+        # Simulate a tool that returns a string, but tldr_tool_output_async raises
         def fake_tool(**kwargs):
             return "raw output"
 
@@ -90,8 +142,9 @@ class TestOllamaAsyncToolHelpers(unittest.IsolatedAsyncioTestCase):
             patch.object(ollama, "_debug"),
             patch.object(ollama, "_record_event"),
             patch.object(ollama, "_truncate_event_text", return_value="raw output"),
-            patch.object(ollama, "tldr_tool_output", side_effect=Exception("fail")),
-            patch.object(ollama, "build_audio_script", return_value="audio script"),
+            patch.object(ollama, "TLDR_MIN_CHARS", 0),
+            patch.object(ollama, "tldr_tool_output_async", side_effect=Exception("fail")),
+            patch.object(ollama, "build_audio_script_async", return_value="audio script"),
             patch.object(ollama, "_set_last_tool_audio"),
         ):
             history = []
@@ -127,9 +180,12 @@ class TestOllamaAsyncToolHelpers(unittest.IsolatedAsyncioTestCase):
             patch.object(ollama, "_debug"),
             patch.object(ollama, "_record_event"),
             patch.object(ollama, "_truncate_event_text", return_value="success"),
-            patch.object(ollama, "tldr_tool_output", return_value="summary"),
-            patch.object(ollama, "build_audio_script", return_value="audio script"),
+            patch.object(ollama, "tldr_tool_output_async", return_value="summary"),
+            patch.object(ollama, "build_audio_script_async", return_value="audio script"),
             patch.object(ollama, "_set_last_tool_audio"),
+            patch.object(
+                ollama, "translate_instruction_to_commands", return_value=[]
+            ),
             patch.object(
                 ollama, "translate_instruction_to_command", return_value="goodcmd"
             ),
@@ -145,6 +201,182 @@ class TestOllamaAsyncToolHelpers(unittest.IsolatedAsyncioTestCase):
             # For shell_agent, assistant TLDR entry should not be present
             self.assertFalse(any(entry["role"] == "assistant" for entry in history))
 
+    async def test_shell_agent_retries_use_one_batch_of_candidates(self):
+        prompts = []
+
+        def failing_shell_tool(**kwargs):
+            prompts.append(kwargs["prompt"])
+            return {
+                "exit_code": 1,
+                "stdout": "",
+                "stderr": "boom",
+                "command": kwargs["prompt"],
+            }
+
+        with (
+            patch.object(ollama, "_record_event"),
+            patch.object(
+                ollama,
+                "translate_instruction_to_commands",
+                return_value=["alt1", "alt2"],
+            ) as batch,
+            patch.object(ollama, "translate_instruction_to_command") as single,
+            patch.object(ollama, "run_tool_direct", return_value=None),
+        ):
+            await ollama.call_tool_with_tldr_async(
+                "shell_agent", failing_shell_tool, [], prompt="first"
+            )
+
+        self.assertEqual(prompts, ["first", "alt1", "alt2"])
+        batch.assert_called_once()
+        single.assert_not_called()
+
+
+class TestGenerateContentAsync(unittest.IsolatedAsyncioTestCase):
+    def _fake_client(self, reply):
+        client = MagicMock()
+
+        async def fake_chat(**kwargs):
+            return _stream(_chunks(reply))
+
+        client.chat = MagicMock(side_effect=fake_chat)
+        return client
+
+    async def test_generate_content_async_appends_reply_to_history(self):
+        client = self._fake_client("hello there")
+        with (
+            patch.object(ollama, "_get_async_client", return_value=client),
+            patch.object(ollama, "_get_or_create_user_id", return_value="async-user"),
+            patch.dict(ollama.user_histories, clear=True),
+        ):
+            result = await ollama.generate_content_async("hi")
+            history = ollama.user_histories["async-user"]
+
+        self.assertEqual(result, "hello there")
+        self.assertIs(history[0], ollama._SYSTEM_MESSAGE)
+        self.assertEqual(history[-1], {"role": "assistant", "content": "hello there"})
+        self.assertEqual(
+            client.chat.call_args.kwargs["keep_alive"], ollama.KEEP_ALIVE
+        )
+
+    async def test_generate_content_many_runs_every_prompt(self):
+        client = self._fake_client("ok")
+        with (
+            patch.object(ollama, "_get_async_client", return_value=client),
+            patch.object(ollama, "_get_or_create_user_id", return_value="async-user"),
+            patch.dict(ollama.user_histories, clear=True),
+        ):
+            results = await ollama.generate_content_many(["a", "b", "c"])
+
+        self.assertEqual(results, ["ok", "ok", "ok"])
+        self.assertEqual(client.chat.call_count, 3)
+
+    async def test_literal_command_skips_the_chat_call(self):
+        client = self._fake_client("unused")
+
+        async def fake_run(tool_name, parameters, tldr_separate=False):
+            return f"{tool_name}:{parameters['prompt']}"
+
+        with (
+            patch.object(ollama, "_get_async_client", return_value=client),
+            patch.object(ollama, "run_tool_direct_async", side_effect=fake_run),
+            patch.object(
+                ollama,
+                "get_available_functions",
+                return_value={"shell_agent": {"function": print}},
+            ),
+        ):
+            result = await ollama.generate_content_async("ls -la")
+
+        self.assertEqual(result, "shell_agent:ls -la")
+        client.chat.assert_not_called()
+
+
+class TestStreamedChat(unittest.IsolatedAsyncioTestCase):
+    def test_sync_stream_is_reassembled(self):
+        tokens = []
+        function = Message.ToolCall.Function(name="web_search", arguments={})
+        call = Message.ToolCall(function=function)
+        chunks = _chunks("hello there")
+        chunks[-1].message.tool_calls = [call]
+        with patch.object(ollama._client, "chat", return_value=iter(chunks)) as chat:
+            response = ollama.chat(model="m", messages=[], on_token=tokens.append)
+
+        self.assertTrue(chat.call_args.kwargs["stream"])
+        self.assertEqual(response.message.content, "hello there")
+        self.assertEqual(response.message.tool_calls, [call])
+        self.assertTrue(response.done)
+        self.assertEqual("".join(tokens), "hello there")
+
+    async def test_async_stream_is_reassembled(self):
+        client = MagicMock()
+
+        async def fake_chat(**kwargs):
+            return _stream(_chunks("hi you"))
+
+        client.chat = MagicMock(side_effect=fake_chat)
+        response = await ollama._client_chat_async(client, model="m", messages=[])
+        self.assertEqual(response.message.content, "hi you")
+        self.assertIsNone(response.message.tool_calls)
+
+    def test_stream_can_be_disabled(self):
+        reply = _chunks("whole")[-1]
+        with (
+            patch.object(ollama, "STREAM_CHAT", False),
+            patch.object(ollama._client, "chat", return_value=reply) as chat,
+        ):
+            self.assertIs(ollama.chat(model="m", messages=[]), reply)
+        self.assertNotIn("stream", chat.call_args.kwargs)
+
+
+class TestBatchWindow(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch.object(ollama, "STREAM_CHAT", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        for task in list(ollama._BACKGROUND_TASKS):
+            task.cancel()
+        ollama._batch_queue = None
+        ollama._batch_loop = None
+
+    async def test_requests_in_one_window_are_released_together(self):
+        released = []
+
+        async def fake_chat(**kwargs):
+            released.append(kwargs["messages"])
+            return kwargs["messages"]
+
+        client = MagicMock()
+        client.chat = MagicMock(side_effect=fake_chat)
+        with (
+            patch.object(ollama, "OLLAMA_BATCH_WINDOW_MS", 20),
+            patch.object(ollama, "_get_async_client", return_value=client),
+        ):
+            first = asyncio.create_task(ollama._chat_async(messages="a"))
+            await asyncio.sleep(0)
+            self.assertEqual(released, [])
+            second = asyncio.create_task(ollama._chat_async(messages="b"))
+            results = await asyncio.gather(first, second)
+
+        self.assertEqual(results, ["a", "b"])
+        self.assertEqual(sorted(released), ["a", "b"])
+
+    async def test_errors_reach_the_caller(self):
+        client = MagicMock()
+
+        async def failing_chat(**kwargs):
+            raise RuntimeError("boom")
+
+        client.chat = MagicMock(side_effect=failing_chat)
+        with (
+            patch.object(ollama, "OLLAMA_BATCH_WINDOW_MS", 1),
+            patch.object(ollama, "_get_async_client", return_value=client),
+        ):
+            with self.assertRaises(RuntimeError):
+                await ollama._chat_async(messages="a")
+
 
 if __name__ == "__main__":
     asyncio.run(unittest.main())
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+
+import services.ollama as ollama
+
+
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        self._saved = list(ollama._event_log)
+        ollama._event_log.clear()
+
+    def tearDown(self):
+        ollama._event_log.clear()
+        ollama._event_log.extend(self._saved)
+
+    def test_events_store_raw_timestamp_and_format_on_read(self):
+        # 2024-01-01 12:34:56 UTC
+        with patch.object(ollama.time, "time_ns", return_value=1704112496_000_000_000):
+            ollama._record_event("user", "hello")
+
+        self.assertNotIn("time", ollama._event_log[-1])
+        events = ollama.get_recent_events(limit=5)
+        self.assertEqual(events[-1]["time"], "12:34:56")
+        self.assertEqual(events[-1]["message"], "hello")
+
+    def test_limit_returns_latest_events(self):
+        for index in range(5):
+            ollama._record_event("user", f"m{index}")
+
+        events = ollama.get_recent_events(limit=2)
+        self.assertEqual([e["message"] for e in events], ["m3", "m4"])
+
+    def test_full_log_leaves_the_evicted_entry_untouched(self):
+        for index in range(ollama.EVENT_LOG_LIMIT):
+            ollama._record_event("user", f"m{index}", user_id="u1")
+        oldest = ollama._event_log[0]
+
+        ollama._record_event("tool_call", "done", {"arguments": {}})
+
+        self.assertEqual(len(ollama._event_log), ollama.EVENT_LOG_LIMIT)
+        self.assertIsNot(ollama._event_log[-1], oldest)
+        self.assertEqual(ollama._event_log[0]["message"], "m1")
+        self.assertEqual(oldest["message"], "m0")
+        self.assertEqual(oldest["user_id"], "u1")
+
+    def test_extra_is_serialized_on_read(self):
+        arguments = {"query": "cats"}
+        with patch.object(ollama, "_stringify_data", wraps=ollama._stringify_data) as dump:
+            ollama._record_event("tool_call", "done", {"arguments": arguments})
+            dump.assert_not_called()
+            arguments["query"] = "dogs"
+            events = ollama.get_recent_events(limit=1)
+            ollama.get_recent_events(limit=1)
+            dump.assert_called_once()
+
+        expected = ollama._stringify_data({"query": "cats"})
+        self.assertEqual(events[-1]["extra"], {"arguments": expected})
+
+
+class TestEventText(unittest.TestCase):
+    def test_short_trimmed_text_is_returned_as_is(self):
+        text = "already short"
+        self.assertIs(ollama._truncate_event_text(text), text)
+
+    def test_text_is_stripped_and_truncated(self):
+        self.assertEqual(ollama._truncate_event_text("  hi \n"), "hi")
+        self.assertEqual(ollama._truncate_event_text(""), "")
+        long_text = "x" * (ollama.MAX_EVENT_TEXT + 10)
+        truncated = ollama._truncate_event_text(long_text)
+        self.assertEqual(len(truncated), ollama.MAX_EVENT_TEXT)
+        self.assertTrue(truncated.endswith("..."))
+
+    def test_sanitize_payload_redacts_messages_only(self):
+        plain = {"limit": 5}
+        self.assertIs(ollama._sanitize_payload(plain), plain)
+
+        payload = {"messages": [{"role": "system", "content": "secret"}]}
+        sanitized = ollama._sanitize_payload(payload)
+        self.assertEqual(sanitized["messages"][0]["content"], "<REDACTED_SYSTEM_PROMPT>")
+        self.assertEqual(payload["messages"][0]["content"], "secret")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,201 @@
+import contextvars
+import sys
+import threading
+import unittest
+from unittest.mock import patch
+
+import services.ollama as ollama
+
+
+class TestCompactForLlm(unittest.TestCase):
+    def test_only_latest_tool_results_are_sent_verbatim(self):
+        history = [{"role": "system", "content": "sys"}]
+        for index in range(4):
+            history.append({"role": "user", "content": f"q{index}"})
+            history.append({"role": "tool", "name": "web", "content": f"out{index}"})
+
+        compacted = ollama._compact_for_llm(history)
+
+        tool_contents = [m["content"] for m in compacted if m["role"] == "tool"]
+        self.assertEqual(
+            tool_contents,
+            [ollama.EVICTED_TOOL_OUTPUT, ollama.EVICTED_TOOL_OUTPUT, "out2", "out3"],
+        )
+        self.assertEqual(history[2]["content"], "out0")
+
+    def test_old_long_messages_are_archived_and_roles_kept(self):
+        long_text = "x" * 500
+        history = [{"role": "system", "content": long_text}]
+        for _ in range(3):
+            history.append({"role": "user", "content": long_text})
+            history.append({"role": "assistant", "content": long_text})
+
+        with patch.object(ollama, "KEEP_RECENT_TURNS", 1):
+            compacted = ollama._compact_for_llm(history)
+
+        self.assertEqual([m["role"] for m in compacted], [m["role"] for m in history])
+        self.assertEqual(compacted[0]["content"], long_text)
+        self.assertTrue(compacted[1]["content"].endswith("[archived]"))
+        self.assertEqual(compacted[-2]["content"], long_text)
+        self.assertEqual(compacted[-1]["content"], long_text)
+
+
+class TestTrimHistory(unittest.TestCase):
+    def test_trims_in_place_with_slack_and_keeps_system_prompt(self):
+        history = [{"role": "system", "content": "sys"}]
+        history += [{"role": "user", "content": str(i)} for i in range(11)]
+
+        with (
+            patch.object(ollama, "MAX_HISTORY_LENGTH", 10),
+            patch.object(ollama, "HISTORY_TRIM_SLACK", 3),
+            patch.object(ollama, "HISTORY_TAIL_TOKENS", 0),
+        ):
+            same = history
+            ollama._trim_history(history)
+            self.assertIs(history, same)
+            self.assertEqual(len(history), 7)
+            self.assertEqual(history[0]["role"], "system")
+            self.assertEqual(history[-1]["content"], "10")
+
+            history.append({"role": "user", "content": "11"})
+            ollama._trim_history(history)
+            self.assertEqual(len(history), 8)
+
+    def test_cut_lands_on_user_turn_and_is_summarized(self):
+        history = [{"role": "system", "content": "sys"}]
+        for index in range(4):
+            history.append({"role": "user", "content": f"q{index}\nmore"})
+            history.append({"role": "assistant", "content": f"a{index}"})
+            history.append({"role": "tool", "name": "web", "content": f"t{index}"})
+
+        with (
+            patch.object(ollama, "MAX_HISTORY_LENGTH", 10),
+            patch.object(ollama, "HISTORY_TRIM_SLACK", 0),
+            patch.object(ollama, "HISTORY_TAIL_TOKENS", 0),
+        ):
+            ollama._trim_history(history)
+
+        self.assertEqual(history[0]["content"], "sys")
+        self.assertEqual(history[1]["role"], "system")
+        self.assertEqual(
+            history[1]["content"],
+            f"{ollama.SUMMARY_MARKER}\n- q0\n- q1",
+        )
+        self.assertEqual(history[2]["content"], "q2\nmore")
+        self.assertEqual(len(history), 8)
+
+    def test_slack_is_not_taken_from_the_hot_tail(self):
+        history = [{"role": "system", "content": "sys"}]
+        history += [{"role": "user", "content": "x" * 40} for _ in range(11)]
+
+        with (
+            patch.object(ollama, "MAX_HISTORY_LENGTH", 10),
+            patch.object(ollama, "HISTORY_TRIM_SLACK", 5),
+            patch.object(ollama, "HISTORY_TAIL_TOKENS", 60),
+        ):
+            ollama._trim_history(history)
+
+        # slack stops where the last 6 turns (60 tokens) begin
+        self.assertEqual(len(history), 8)
+        self.assertTrue(history[1]["content"].startswith(ollama.SUMMARY_MARKER))
+
+
+class TestLRUHistoryStore(unittest.TestCase):
+    def test_least_recently_used_user_is_evicted(self):
+        store = ollama._LRUHistoryStore(capacity=2)
+        store.checkout("a")
+        store.checkout("b")
+        store.checkout("a")
+        store.checkout("c")
+        self.assertEqual(list(store), ["a", "c"])
+
+    def test_idle_users_expire(self):
+        store = ollama._LRUHistoryStore(capacity=10, ttl=60)
+        with patch.object(ollama.time, "monotonic", return_value=1000.0):
+            store.checkout("old").append({"role": "user", "content": "hi"})
+        with patch.object(ollama.time, "monotonic", return_value=1100.0):
+            history = store.checkout("new")
+
+        self.assertEqual(list(store), ["new"])
+        self.assertEqual(history, [])
+
+    def test_checkout_returns_the_same_history(self):
+        store = ollama._LRUHistoryStore()
+        history = store.checkout("a")
+        history.append({"role": "user", "content": "hi"})
+        self.assertIs(store.checkout("a"), history)
+
+    def test_concurrent_checkouts_keep_the_capacity(self):
+        store = ollama._LRUHistoryStore(capacity=8)
+        errors = []
+
+        def churn(worker):
+            try:
+                for index in range(2000):
+                    store.checkout(f"{worker}-{index % 20}")
+                    if index % 7 == 0:
+                        store.pop(f"{worker}-{index % 20}", None)
+            except Exception as err:  # pragma: no cover - failure path
+                errors.append(err)
+
+        threads = [threading.Thread(target=churn, args=(n,)) for n in range(4)]
+        # Switch threads as often as possible so unguarded updates interleave.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(store), 8)
+        self.assertEqual(set(store._last_seen), set(store))
+
+
+class TestUserContext(unittest.TestCase):
+    def test_bound_user_id_is_used_for_history(self):
+        def run():
+            ollama.bind_user(42)
+            return ollama._get_or_create_user_id()
+
+        self.assertEqual(contextvars.Context().run(run), "42")
+
+    def test_unbound_contexts_get_separate_ids(self):
+        first = contextvars.Context().run(ollama._get_or_create_user_id)
+        second = contextvars.Context().run(ollama._get_or_create_user_id)
+        self.assertNotEqual(first, second)
+
+    def test_tool_audio_is_popped_once(self):
+        def run():
+            ollama._set_last_tool_audio({"text": "hi"})
+            return ollama.pop_last_tool_audio(), ollama.pop_last_tool_audio()
+
+        self.assertEqual(
+            contextvars.Context().run(run), ({"text": "hi"}, None)
+        )
+
+
+
+class TestClearHistory(unittest.TestCase):
+    def test_model_is_unloaded_only_after_the_last_conversation(self):
+        histories = {"1": [], "2": []}
+
+        def run(user_id):
+            ollama.clear_history(user_id)
+
+        with (
+            patch.object(ollama, "user_histories", histories),
+            patch.object(ollama, "unload_model") as unload,
+        ):
+            contextvars.Context().run(run, 1)
+            unload.assert_not_called()
+
+            contextvars.Context().run(run, 2)
+            unload.assert_called_once_with()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
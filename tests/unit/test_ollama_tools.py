@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+
+import services.ollama as ollama
+
+
+def _fake_tools():
+    def web_search(query: str):
+        return query
+
+    return {"web_search": {"function": web_search, "triggers": ["search"]}}
+
+
+class TestToolRegistry(unittest.TestCase):
+    def setUp(self):
+        self._saved = ollama._tools_cache
+
+    def tearDown(self):
+        ollama._tools_cache = self._saved
+        ollama._refresh_tool_index()
+
+    def test_registry_is_loaded_on_first_use(self):
+        ollama._tools_cache = None
+        with patch.object(ollama, "load_tools", return_value=_fake_tools()) as load:
+            use_tools, matched = ollama.evaluate_tool_usage("search cats")
+            ollama.get_available_functions()
+
+        load.assert_called_once()
+        self.assertTrue(use_tools)
+        self.assertEqual(list(matched), ["web_search"])
+
+    def test_reload_rebuilds_cached_lookups(self):
+        with patch.object(ollama, "load_tools", return_value=_fake_tools()):
+            ollama.reload_tools()
+        self.assertEqual(ollama._match_tool_names("search cats"), ("web_search",))
+
+        with patch.object(ollama, "load_tools", return_value={}):
+            ollama.reload_tools()
+        self.assertEqual(ollama._match_tool_names("search cats"), ())
+
+    def test_mixed_case_triggers_match_the_lowercased_prompt(self):
+        tools = _fake_tools()
+        tools["web_search"]["triggers"] = ["Search"]
+        with patch.object(ollama, "load_tools", return_value=tools):
+            ollama.reload_tools()
+        self.assertEqual(ollama._match_tool_names("search cats"), ("web_search",))
+
+    def test_resolve_by_function_name_and_trigger(self):
+        with patch.object(ollama, "load_tools", return_value=_fake_tools()):
+            ollama.reload_tools()
+
+        self.assertEqual(ollama._resolve_tool_entry("Web_Search")[0], "web_search")
+        self.assertEqual(ollama._resolve_tool_entry("SEARCH")[0], "web_search")
+        self.assertIsNone(ollama._resolve_tool_entry("unknown"))
+        self.assertIsNone(ollama._resolve_tool_entry(""))
+
+    def test_follow_up_sentinels(self):
+        tools = {"shell_agent": {"function": lambda prompt: prompt}}
+        with patch.object(ollama, "load_tools", return_value=tools):
+            ollama.reload_tools()
+
+        self.assertEqual(ollama.evaluate_tool_usage("Given this shell output: x"), (False, {}))
+        self.assertEqual(ollama.evaluate_tool_usage("So, Answer this question: x"), (False, {}))
+        use_tools, matched = ollama.evaluate_tool_usage("note\nPrevious command: ls")
+        self.assertTrue(use_tools)
+        self.assertEqual(list(matched), ["shell_agent"])
+        self.assertEqual(
+            ollama.evaluate_tool_usage("previous command: ls; answer this question: y"),
+            (False, {}),
+        )
+        use_tools, matched = ollama.evaluate_tool_usage(
+            "Previous command: ls -la\n... previous command: ls again"
+        )
+        self.assertTrue(use_tools)
+        self.assertEqual(list(matched), ["shell_agent"])
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import services.ollama as ollama
+
+
+def _reply(content):
+    response = MagicMock()
+    response.message.content = content
+    return response
+
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        ollama.clear_translation_cache()
+
+    def tearDown(self):
+        ollama.clear_translation_cache()
+
+    def test_repeated_command_translation_is_cached(self):
+        with patch.object(ollama, "chat", return_value=_reply("ls -la")) as chat:
+            first = ollama.translate_instruction_to_command("show all files here")
+            second = ollama.translate_instruction_to_command("show all files here")
+
+        self.assertEqual(first, "ls -la")
+        self.assertEqual(second, "ls -la")
+        chat.assert_called_once()
+
+    def test_cache_can_be_disabled(self):
+        with (
+            patch.object(ollama, "TRANSLATION_CACHE_ENABLED", False),
+            patch.object(ollama, "chat", return_value=_reply("ls -la")) as chat,
+        ):
+            ollama.translate_instruction_to_command("show all files here")
+            ollama.translate_instruction_to_command("show all files here")
+
+        self.assertEqual(chat.call_count, 2)
+
+    def test_failed_translation_is_not_cached(self):
+        with patch.object(ollama, "chat", side_effect=RuntimeError("down")) as chat:
+            self.assertIsNone(ollama.translate_instruction_to_command("list files"))
+            self.assertIsNone(ollama.translate_instruction_to_command("list files"))
+
+        self.assertEqual(chat.call_count, 2)
+        self.assertIn("down", ollama.get_last_command_translation_error())
+
+    def test_expired_query_translation_is_refetched(self):
+        with patch.object(ollama, "chat", return_value=_reply("python news")) as chat:
+            with patch.object(ollama.time, "monotonic", return_value=1000.0):
+                ollama.translate_instruction_to_query("what's new in python")
+            with patch.object(
+                ollama.time,
+                "monotonic",
+                return_value=1000.0 + ollama.TRANSLATION_CACHE_TTL + 1,
+            ):
+                ollama.translate_instruction_to_query("what's new in python")
+
+        self.assertEqual(chat.call_count, 2)
+
+
+class TestCommandAlternatives(unittest.TestCase):
+    def test_suggestions_are_cleaned_sanitized_and_deduplicated(self):
+        content = "1. ls -la\n- ls -la\n$ sudo rm -rf /\n```\n`du -sh .`\nfind . -name x"
+        with patch.object(ollama, "chat", return_value=_reply(content)):
+            commands = ollama.translate_instruction_to_commands("list files", n=2)
+
+        self.assertEqual(commands, ["ls -la", "du -sh ."])
+
+    def test_model_errors_give_no_candidates(self):
+        with patch.object(ollama, "chat", side_effect=RuntimeError("down")):
+            self.assertEqual(ollama.translate_instruction_to_commands("list files"), [])
+
+    def test_next_candidate_skips_the_failed_command(self):
+        candidates = ["ls", "ls -la"]
+        self.assertEqual(ollama._next_candidate(candidates, "ls"), "ls -la")
+        self.assertIsNone(ollama._next_candidate(candidates, "ls"))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -1,5 +1,6 @@
 import re
 import shlex
+from functools import lru_cache
 from typing import Optional
 
 from utils.logger import logger, YELLOW, RST, RED, GREEN
@@ -90,6 +91,7 @@ def sanitize_command(command: str) -> Optional[str]:
     return sanitized
 
 
+@lru_cache(maxsize=4096)
 def detect_direct_command(instruction: str) -> Optional[str]:
     text = (instruction or "").strip()
     if not text:
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from typing import Any, Dict, Iterable, Optional, Tuple, List
 
 from telegram.ext import ContextTypes
@@ -11,11 +12,45 @@ try:  # Optional import for type hints only
 except ImportError:  # pragma: no cover - telegram only required at runtime
     Message = Any  # type: ignore
 
+# Upper bound on remembered message ids per user for each bookkeeping map.
+MAX_TRACKED_MESSAGES = 500
+
+
+class BoundedOrderedDict(OrderedDict):
+    """OrderedDict that evicts its oldest entries once ``maxlen`` is exceeded.
+
+    Writing an existing key marks it as most recent, so the map behaves as a
+    small LRU keyed by Telegram message_id.
+    """
+
+    def __init__(self, maxlen: int = MAX_TRACKED_MESSAGES, *args, **kwargs) -> None:
+        self.maxlen = maxlen
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, key, value) -> None:
+        if key in self:
+            self.move_to_end(key)
+        super().__setitem__(key, value)
+        while len(self) > self.maxlen:
+            self.popitem(last=False)
+
+
+def _bounded_user_map(context: ContextTypes.DEFAULT_TYPE, key: str) -> BoundedOrderedDict:
+    store = context.user_data.get(key)
+    if isinstance(store, BoundedOrderedDict):
+        return store
+    # Upgrade plain dicts restored from older persistence files in place.
+    bounded = BoundedOrderedDict(MAX_TRACKED_MESSAGES)
+    if store:
+        for msg_id, value in store.items():
+            bounded[msg_id] = value
+    context.user_data[key] = bounded
+    return bounded
 
 
 # Deprecated: In-memory prompt history is replaced by persistent DB storage.
 def get_prompt_history(context: ContextTypes.DEFAULT_TYPE) -> Dict[int, str]:
-    return context.user_data.setdefault("prompt_history", {})  # type: ignore[return-value]
+    return _bounded_user_map(context, "prompt_history")
 
 
 def get_output_metadata(context: ContextTypes.DEFAULT_TYPE) -> Dict[int, Dict[str, Any]]:
@@ -26,7 +61,7 @@ def get_output_metadata(context: ContextTypes.DEFAULT_TYPE) -> Dict[int, Dict[st
     was produced (tool name, parameters, originating prompt, etc.).
     """
 
-    return context.user_data.setdefault("output_metadata", {})  # type: ignore[return-value]
+    return _bounded_user_map(context, "output_metadata")
 
 
 
@@ -34,11 +69,17 @@ def remember_prompt(
     context: ContextTypes.DEFAULT_TYPE,
     message: Any,
     prompt: str,
+    prompt_history: Optional[Dict[int, str]] = None,
 ) -> None:
-    """Persist prompt to DB for the given Telegram message."""
+    """Persist prompt to DB for the given Telegram message.
+
+    Handlers that already hold the prompt_history map can pass it in to
+    skip the user_data lookup.
+    """
     if not message or not getattr(message, "message_id", None):
         return
-    prompt_history = get_prompt_history(context)
+    if prompt_history is None:
+        prompt_history = get_prompt_history(context)
     prompt_history[message.message_id] = prompt
 
 
@@ -79,12 +120,16 @@ def remember_generated_output(
 def lookup_reply_context(
     context: ContextTypes.DEFAULT_TYPE,
     reply_message: Any,
+    prompt_history: Optional[Dict[int, str]] = None,
+    output_metadata: Optional[Dict[int, Dict[str, Any]]] = None,
 ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
     """Return (original_prompt, tool_metadata) for a reply target, if any, using persistent DB history."""
     if not reply_message or not getattr(reply_message, "message_id", None):
         return None, None
-    prompt_history = get_prompt_history(context)
-    output_metadata = get_output_metadata(context)
+    if prompt_history is None:
+        prompt_history = get_prompt_history(context)
+    if output_metadata is None:
+        output_metadata = get_output_metadata(context)
 
     tool_metadata = None
     msg_id = getattr(reply_message, "message_id", None)
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 from typing import Any
@@ -77,20 +78,21 @@ def debug(msg: str):
 
 
 def debug_payload(label: str, payload: Any) -> None:
-    import json
-    from logging import DEBUG, Logger
-
     log_instance = getattr(logger, "logger", None)
-    if isinstance(log_instance, Logger):
-        if not log_instance.isEnabledFor(DEBUG):
+    if isinstance(log_instance, logging.Logger):
+        if not log_instance.isEnabledFor(logging.DEBUG):
             return
-    elif isinstance(logger, Logger):
+    elif isinstance(logger, logging.Logger):
         log_instance = logger
-        if not log_instance.isEnabledFor(DEBUG):
+        if not log_instance.isEnabledFor(logging.DEBUG):
             return
     else:
         return
 
+    # Callables defer building costly payloads until DEBUG is known to be on.
+    if callable(payload):
+        payload = payload()
+
     try:
         serialized = json.dumps(payload, indent=2, sort_keys=True, default=str)
     except (TypeError, ValueError):
@@ -6,6 +6,11 @@ import asyncio
 import re
 from typing import Any, Callable, List, Optional, Tuple
 
+try:
+    from telegram.error import BadRequest
+except ImportError:  # pragma: no cover - telegram only required at runtime
+    BadRequest = Exception
+
 
 def split_preserve_code_blocks(s: str) -> List[Tuple[str, str]]:
     """
@@ -34,8 +39,22 @@ def split_paragraphs(text: str) -> List[str]:
 def split_by_chunk_size(text: str, chunk_size: int) -> List[str]:
     """
     Splits a string into chunks of at most chunk_size characters.
+
+    Cuts at the last newline before the limit so Markdown entities stay
+    intact; only falls back to a hard cut when no newline is found in the
+    second half of the window.
     """
-    return [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+    chunks = []
+    while text:
+        if len(text) <= chunk_size:
+            chunks.append(text)
+            break
+        cut = text.rfind("\n", 0, chunk_size)
+        if cut < chunk_size // 2:
+            cut = chunk_size
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    return chunks
 
 
 async def send_code_block_chunked(
@@ -80,6 +99,24 @@ async def send_code_block_chunked(
     return messages
 
 
+async def _send_segment(
+    target: Any,
+    segment: str,
+    parse_mode: Optional[str],
+    strip_markdown_escape: Optional[Callable] = None,
+) -> Any:
+    """
+    Sends one segment with parse_mode, falling back to unescaped plain text.
+    """
+    if parse_mode:
+        try:
+            return await target.reply_text(text=segment, parse_mode=parse_mode)
+        except BadRequest:
+            if strip_markdown_escape:
+                segment = strip_markdown_escape(segment)
+    return await target.reply_text(text=segment, parse_mode=None)
+
+
 async def send_chunked_message(
     target: Any,
     text: str,
@@ -140,18 +177,14 @@ async def send_chunked_message(
                                 )
                             )
                         await asyncio.sleep(1)
-                    # If single paragraph exceeds chunk_size, fallback to raw splits without parse mode to avoid malformed entities
+                    # If single paragraph exceeds chunk_size, split it on line
+                    # boundaries and only drop to plain text for segments
+                    # Telegram refuses to parse.
                     if len(para) > chunk_size:
                         for segment in split_by_chunk_size(para, chunk_size):
-                            cleaned = (
-                                strip_markdown_escape(segment)
-                                if parse_mode and strip_markdown_escape
-                                else segment
-                            )
                             messages.append(
-                                await target.reply_text(
-                                    text=cleaned,
-                                    parse_mode=None if parse_mode else None,
+                                await _send_segment(
+                                    target, segment, parse_mode, strip_markdown_escape
                                 )
                             )
                             await asyncio.sleep(1)
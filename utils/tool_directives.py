@@ -8,7 +8,7 @@ from utils.logger import debug_payload, logger
 
 _debug = lambda *args, **kwargs: debug_payload(*args, **kwargs) if DEBUG_TOOL_DIRECTIVES else None
 
-REPROCESS_CONTROL_WORDS = {"reprocess", "retry", "again", "repeat"}
+REPROCESS_CONTROL_WORDS = frozenset({"reprocess", "retry", "again", "repeat"})
 
 ALLOWED_SHELL_CMDS = (
     "grep", "awk", "bash", "bc", "cat", "cd", "cat", "chmod", "chown", "cp", "curl", "cut", "date", 